@@ -1,6 +1,9 @@
-
-__all__ = ['Sis3316_udp']
+__all__ = ['Sis3316_udp', 'Monitor', 'Recovery', 'BankScheduler', 'RingBuffer']
 
 #TODO: check requirements:  abs, 
 
 from .sis3316_udp import Sis3316 as Sis3316_udp
+from .monitor import Monitor
+from .recovery import Recovery
+from .scheduler import BankScheduler
+from .readout import RingBuffer
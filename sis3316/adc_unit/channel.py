@@ -23,12 +23,37 @@ from ..common import *
 from .registers import *
 from .trigger import Adc_trigger
 
+def event_words(format_mask, raw_window, maw_window = 0, maw_ena = False):
+	""" Event size (in 32-bit words) for a given data format. """
+	elen = 2 + 1 # two header words, 0xE word
+	
+	if format_mask & 0b1:
+		elen += 7 # peak high, accum 1..6
+	
+	if format_mask & 0b10:
+		elen += 2 # accum 7,8
+	
+	if format_mask & 0b100:
+		elen += 3 # maw values
+	
+	if format_mask & 0b1000:
+		elen += 2 # energy values
+	
+	elen += raw_window // 2 # two 16-bit samples per word
+	
+	if maw_ena:
+		elen += maw_window
+	
+	return elen
+
+
 class Adc_channel(object):
 	"""ADC CHANNEL"""
 
 	__slots__ = ('group', 'idx', 'cid', 'trig', 'gid', 'unit_noidx', 'board') # Restrict attribute list (foolproof).
 
 	_conf_params = [
+			'dac_offset',
 			'event_format_mask',
 			'event_maw_ena',
 			'flags',
@@ -54,7 +79,12 @@ class Adc_channel(object):
 		
 	def bank_read(self, bank, dest, wcount, woffset = 0):
 		""" Read channel memory. """
-		if woffset + wcount > const.MEM_BANK_SIZE:
+		mem_no, woffset = self.bank_location(bank, wcount, woffset)
+		return self.board.read_fifo(dest, self.gid, mem_no, wcount, woffset)
+	
+	def bank_location(self, bank, wcount, woffset = 0):
+		""" Memory chip and word offset of channel's bank data. Returns (mem_no, woffset). """
+		if woffset + wcount > const.MEM_BANK_SIZE // 4: # words
 			raise ValueError("out of channel bound")
 		
 		if bank != 0 and bank != 1:
@@ -71,7 +101,7 @@ class Adc_channel(object):
 		else:
 			mem_no = 1
 		
-		return self.board.read_fifo(dest, self.gid, mem_no, wcount, woffset)
+		return mem_no, woffset
 
 
 	def bank_poll(self, bank):
@@ -81,8 +111,10 @@ class Adc_channel(object):
 	
 	@property
 	def dac_offset(self):
-		''' Get ADC offsets (DAC) via SPI. '''
-		raise AttributeError("You cant't read back loaded offset value.")
+		''' Configure ADC offsets (DAC) via SPI. 
+		The DAC can't be read back, so the last written value is returned (None if unknown).
+		'''
+		return self.board._dac_offsets.get(self.idx)
 		
 	@dac_offset.setter
 	def dac_offset(self,value):
@@ -103,6 +135,8 @@ class Adc_channel(object):
 			self.board.write(reg, spell)
 			#~ print hex(spell)
 			usleep(10) #Doc.: The logic needs approximately 7 usec to execute a command.
+		
+		self.board._dac_offsets[self.idx] = value
 	
 	
 	@property
@@ -210,33 +244,38 @@ class Adc_channel(object):
 			raise ValueError("A mask of the value is {0}. '{1}' given".format(hex(mask), value) )
 		self.board._set_field(reg, value, offset, mask)
 	
-	#TODO:
-	#FIXME:
 	@property
 	def event_length(self):
-		""" Calculate the current size of the event (in words). """
-		emask = self.event_format_mask
-		nraw = self.group.raw_window
-		nmaw = self.group.maw_window
-		maw_ena = self.event_maw_ena
-		
-		elen = 6 + nraw #two header fields, 0xE field
-		
-		if maw_ena:
-			elen += nmaw * 2
-		
-		if emask & 0b1:
-			elen += 14 # peaking, accum 1..6
-		
-		if emask & 0b10:
-			elen +=4 # accum 7,8
-		
-		if emask & 0b100:
-			elen +=6 # maw values
-		
-		return elen
+		""" Calculate the current size of the event (in 32-bit words). """
+		return event_words(self.event_format_mask, self.group.raw_window,
+				self.group.maw_window, self.event_maw_ena)
 
 	
+	@property
+	def actual_addr_reg(self):
+		""" Register address of addr_actual (for bulk reads). """
+		return SIS3316_ADC_GRP(ACTUAL_SAMPLE_ADDRESS_REG, self.gid) + 0x4 * self.cid
+	
+	@property
+	def prev_addr_reg(self):
+		""" Register address of addr_prev (for bulk reads). """
+		return SIS3316_ADC_GRP(PREVIOUS_BANK_SAMPLE_ADDRESS_REG, self.gid) + 0x4 * self.cid
+	
+	stat_counter_names = ('internal', 'hit', 'deadtime', 'pileup', 'veto', 'high_energy')
+	
+	@property
+	def stat_counter_addrs(self):
+		""" Addresses of the trigger statistic counters (see stat_counter_names). """
+		base = SIS3316_ADC_GRP(TRIGGER_STATISTIC_COUNTERS_REG, self.gid) + 0x20 * self.cid
+		return [base + 4 * i for i in range(0, TRIGGER_STATISTIC_COUNTERS_NUM)]
+	
+	@property
+	def stat_counters(self):
+		""" Trigger statistic counters (a dict). See group's stat_counter_mode. """
+		data = self.board.read_list(self.stat_counter_addrs)
+		return dict(zip(self.stat_counter_names, data))
+	
+	
 	@property
 	def intern_trig_delay(self):
 		""" Delay of the internal trigger."""
@@ -46,6 +46,7 @@ class Adc_group(object):
 			'accum6_start', 'accum6_window', 
 			'accum7_start', 'accum7_window', 
 			'accum8_start', 'accum8_window', 
+			'stat_counter_mode',
 			]
 	
 	_help_properties = ['firmware_version', 'status']
@@ -84,11 +85,34 @@ class Adc_group(object):
 		self.board.write( SIS3316_ADC_GRP(INPUT_TAP_DELAY_REG, self.gid), 0x400)
 	
 	
+	_image_regs = (ANALOG_CTRL_REG, EVENT_CONFIG_REG, CHANNEL_HEADER_REG, ADDRESS_THRESHOLD_REG,
+			TRIGGER_GATE_WINDOW_LENGTH_REG, RAW_DATA_BUFFER_CONFIG_REG, PILEUP_CONFIG_REG,
+			PRE_TRIGGER_DELAY_REG, DATAFORMAT_CONFIG_REG, MAW_TEST_BUFFER_CONFIG_REG,
+			INTERNAL_TRIGGER_DELAY_CONFIG_REG, INTERNAL_GATE_LENGTH_CONFIG_REG,
+			SUM_FIR_TRIGGER_SETUP_REG, SUM_FIR_TRIGGER_THRESHOLD_REG, SUM_FIR_HIGH_ENERGY_THRESHOLD_REG,
+			TRIGGER_STATISTIC_COUNTER_MODE_REG,
+			ACCUMULATOR_GATE1_CONFIG_REG, ACCUMULATOR_GATE2_CONFIG_REG,
+			ACCUMULATOR_GATE3_CONFIG_REG, ACCUMULATOR_GATE4_CONFIG_REG,
+			ACCUMULATOR_GATE5_CONFIG_REG, ACCUMULATOR_GATE6_CONFIG_REG,
+			ACCUMULATOR_GATE7_CONFIG_REG, ACCUMULATOR_GATE8_CONFIG_REG,
+			)
+	_image_chan_regs = (FIR_TRIGGER_SETUP_REG, FIR_TRIGGER_THRESHOLD_REG, FIR_HIGH_ENERGY_THRESHOLD_REG)
+	
+	@property
+	def image_addrs(self):
+		""" Addresses of plain read/write configuration registers (see Sis3316.register_image). """
+		addrs = [SIS3316_ADC_GRP(reg, self.gid) for reg in self._image_regs]
+		for cid in range(0, const.CHAN_PER_GRP):
+			addrs.extend([SIS3316_ADC_GRP(reg, self.gid) + 0x10 * cid for reg in self._image_chan_regs])
+		return addrs
+	
+	_status_ok = (0x130018, 0x130118) # I think 0x130118 just means data link speed flag is up, and is therefore ok 
+	
 	@property
 	def status(self):
 		stat = self.board.read(SIS3316_ADC_GRP(STATUS_REG, self.gid))
-		if stat not in (0x130018, 0x130118): # I think 0x130118 just means data link speed flag is up, and is therefore ok 
-                    return stat
+		if stat not in self._status_ok:
+			return stat
 		return True
 	
 	
@@ -339,6 +363,8 @@ class Adc_group(object):
 		'maw_window':      Param(0x3Fe , 0, MAW_TEST_BUFFER_CONFIG_REG, "MAW test buffer length. 0 to 1022."),
 		'maw_delay' :      Param(0x3Fe , 16, MAW_TEST_BUFFER_CONFIG_REG, "The number of MAW samples before the trigger to save to MAW test biffer. 2 to 1022."),
 
+		'stat_counter_mode': Param(True, 0, TRIGGER_STATISTIC_COUNTER_MODE_REG, "Trigger statistic counters: 0 -> actual values, 1 -> latched on bank swap."),
+
 		'gate1_chan_mask': Param(0xF , 16, INTERNAL_GATE_LENGTH_CONFIG_REG, "Which channels icluded in gate-1."),
 		'gate2_chan_mask': Param(0xF , 20, INTERNAL_GATE_LENGTH_CONFIG_REG, "Which channels icluded in gate-2."),
 		
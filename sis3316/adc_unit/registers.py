@@ -55,3 +55,7 @@ FIR_HIGH_ENERGY_THRESHOLD_REG 	= 0x48
 ACTUAL_SAMPLE_ADDRESS_REG 	= 0x110
 PREVIOUS_BANK_SAMPLE_ADDRESS_REG 	= 0x120
 
+#offset is 0x20:
+TRIGGER_STATISTIC_COUNTERS_REG 	= 0x200 # internal, hit, deadtime, pileup, veto, high energy; 32-bit each
+TRIGGER_STATISTIC_COUNTERS_NUM 	= 6
+
@@ -54,6 +54,11 @@ class Adc_trigger(object):
 		'high_threshold': Param(0xFffFFFF, 0, FIR_HIGH_ENERGY_THRESHOLD_REG, """ The full 27-bit running sum + 0x800 0000 is compared to the High Energy Suppress threshold value. \n Note 1: use channel invert for negative signals. """),
 		}
 	
+	@property
+	def threshold_addr(self):
+		""" FIR_TRIGGER_THRESHOLD_REG address of the trigger (for bulk writes). """
+		return SIS3316_ADC_GRP(FIR_TRIGGER_THRESHOLD_REG, self.gid) + 0x10 * self.cid
+	
 	_conf_params = _auto_properties.keys()
 	dump_conf = common_dump_conf
 	ls = common_ls
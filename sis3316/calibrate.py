@@ -0,0 +1,303 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# DAC offset calibration to a target baseline, pedestal runs.
+
+import time
+
+from .common import *
+from .registers import *
+from .readout import destination, RingBuffer
+from .events import iter_events, event_info
+from .sis3316_udp import VME_WRITE_LIMIT
+
+DAC_MAX = 0xFFFF
+ADC_MAX = 0x3FFF # 14 bit samples
+CALIB_RAW_WINDOW = 64 # samples, if raw_window is not configured
+
+
+def sample_stats(buf, maw_words = 0):
+	""" Mean and RMS of raw samples of all events in `buf'. Returns (mean, rms, nsamples). """
+	spans = [(rpos, nraw) for pos, length, rpos, nraw in iter_events(buf, maw_words) if nraw]
+	if not spans:
+		return None, None, 0
+
+	try:
+		import numpy as np
+	except ImportError:
+		np = None
+
+	if np is not None:
+		arr = np.concatenate([np.frombuffer(buf, '<u2', nraw, rpos) for rpos, nraw in spans])
+		return float(arr.mean()), float(arr.std()), len(arr)
+
+	vals = []
+	for rpos, nraw in spans:
+		vals.extend(memoryview(buf)[rpos : rpos + 2 * nraw].cast('H'))
+	n = len(vals)
+	mean = float(sum(vals)) / n
+	rms = (sum((v - mean)**2 for v in vals) / n) ** 0.5
+	return mean, rms, n
+
+
+def sample_sums(buf, maw_words = 0):
+	""" Sums of raw samples of all events in `buf': (nevents, nsamples, sum, sum of squares).
+	Vectorized with NumPy if events have the same layout (the usual case), see sample_stats() otherwise.
+	"""
+	if not len(buf):
+		return 0, 0, 0.0, 0.0
+	try:
+		import numpy as np
+	except ImportError:
+		np = None
+
+	if np is not None:
+		length, rpos, nraw = event_info(buf, 0, maw_words)
+		if nraw and len(buf) % length == 0:
+			words = np.frombuffer(buf, '<u4').reshape(-1, length // 4)
+			hdr = words[:, rpos // 4 - 1] # the 0xE header of each event
+			if np.all(hdr >> 28 == 0xE) and np.all(hdr & 0x1FFffFF == nraw // 2):
+				raw = np.frombuffer(buf, '<u2').reshape(-1, length // 2)[:, rpos // 2 : rpos // 2 + nraw]
+				vals = raw.astype(np.float64)
+				return len(raw), vals.size, float(vals.sum()), float((vals * vals).sum())
+
+	nevents = sum(1 for e in iter_events(buf, maw_words))
+	mean, rms, n = sample_stats(buf, maw_words)
+	if not n:
+		return nevents, 0, 0.0, 0.0
+	return nevents, n, mean * n, (rms**2 + mean**2) * n
+
+
+def fire_bursts(dev, count, rate = None, burst = VME_WRITE_LIMIT):
+	""" Fire `count' key triggers, `burst' of them per write_list, at `rate' (Hz, as fast as possible if None).
+	A burst is a single request: 1 to VME_WRITE_LIMIT triggers.
+	"""
+	if not 1 <= burst <= VME_WRITE_LIMIT:
+		raise ValueError("burst must be from 1 to %d (writes per request), not %d." % (VME_WRITE_LIMIT, burst))
+	t0 = time.time()
+	done = 0
+	while done < count:
+		num = min(burst, count - done)
+		dev.write_list([SIS3316_KEY_TRIGGER] * num, [1] * num)
+		done += num
+		if rate:
+			delay = t0 + float(done) / rate - time.time()
+			if delay > 0:
+				sleep(delay)
+
+
+def pedestals(dev, chanlist = None, nevents = 1000, rate = None, burst = VME_WRITE_LIMIT, raw_window = None):
+	""" Pedestal run: software triggers, raw samples of all channels, mean and RMS per channel.
+
+	Triggers are sent in bursts (see fire_bursts()). raw_window: samples per
+	event in all groups, the configured raw windows (CALIB_RAW_WINDOW where
+	not set) if None; see software_trigger. If `nevents' don't fit
+	the bank, the run is done in rounds: a swap and an interleaved readout
+	of all channels (Sis3316.readout_groups) per round.
+	Returns a dict {chan: {'mean', 'rms', 'events', 'samples'}} (None if no samples).
+	"""
+	if chanlist is None:
+		chanlist = range(0, const.CHAN_TOTAL)
+	chanlist = list(chanlist)
+	sums = dict((idx, [0, 0, 0.0, 0.0]) for idx in chanlist)
+
+	with software_trigger(dev, chanlist, raw_window) as trig:
+		evlen = max(dev.channels[idx].event_length for idx in chanlist)
+		per_round = max(1, min(nevents, const.CHAN_BANK_WORDS // evlen - 1))
+
+		left = nevents
+		while left > 0:
+			num = min(left, per_round)
+			dev.disarm()
+			dev.arm(0)
+			fire_bursts(dev, num, rate, burst)
+			msleep(1)
+			dev.mem_toggle()
+
+			bufs = dict((idx, RingBuffer(4 * num * evlen, grow = True)) for idx in chanlist)
+			dev.readout_groups([(idx, bufs[idx]) for idx in chanlist])
+			for idx in chanlist:
+				res = sample_sums(bufs[idx].read(), trig.maw_words[idx])
+				sums[idx] = [a + b for a, b in zip(sums[idx], res)]
+			left -= num
+
+	ret = {}
+	for idx in chanlist:
+		events, n, total, total_sq = sums[idx]
+		mean = total / n if n else None
+		rms = max(0.0, total_sq / n - mean**2) ** 0.5 if n else None
+		ret[idx] = {'mean': mean, 'rms': rms, 'events': events, 'samples': n}
+	return ret
+
+
+def acquire(dev, chanlist, nevents = 16):
+	""" Fire `nevents' key triggers (a single write_list) and read the bank of each channel.
+	Returns a dict {chan: bytearray}.
+	"""
+	dev.disarm()
+	dev.arm(0)
+	dev.write_list([SIS3316_KEY_TRIGGER] * nevents, [1] * nevents)
+	msleep(1)
+	bank = dev.mem_toggle() ^ 1 # the bank we have just filled
+
+	data = {}
+	for idx in chanlist:
+		chan = dev.channels[idx]
+		nwords = chan.addr_prev
+		buf = bytearray(4 * nwords)
+		if nwords:
+			chan.bank_read(bank, destination(buf), nwords)
+		data[idx] = buf
+	return data
+
+
+class software_trigger(object):
+	""" Context manager: let channels accept key triggers and record raw samples.
+	Restores the flags and raw windows on exit.
+	raw_window: samples per event, set in all groups; if None, the configured
+	raw windows are kept and CALIB_RAW_WINDOW is set where there's none.
+	maw_words: {chan: MAW test buffer words in its events}, to parse them (see sample_stats()).
+	"""
+	def __init__(self, dev, chanlist, raw_window = None):
+		self.dev = dev
+		self.chanlist = chanlist
+		self.raw_window = raw_window
+
+	def __enter__(self):
+		dev = self.dev
+		self.dev_flags = dev.flags
+		self.chan_flags = dict((i, dev.channels[i].flags) for i in self.chanlist)
+		self.raw_windows = dict((g.idx, g.raw_window) for g in dev.groups)
+
+		dev.flags = list(set(self.dev_flags + ['extern_trig_ena']))
+		for i in self.chanlist:
+			flags = self.chan_flags[i]
+			dev.channels[i].flags = [f for f in flags if f not in ('intern_trig', 'intern_sum_trig')] \
+					+ ([] if 'extern_trig' in flags else ['extern_trig'])
+		for grp in dev.groups:
+			if self.raw_window is not None:
+				if self.raw_windows[grp.idx] != self.raw_window:
+					grp.raw_window = self.raw_window
+			elif not self.raw_windows[grp.idx]:
+				grp.raw_window = CALIB_RAW_WINDOW
+		self.maw_words = dict((i, dev.channels[i].group.maw_window if dev.channels[i].event_maw_ena else 0)
+				for i in self.chanlist)
+		return self
+
+	def __exit__(self, *exc):
+		dev = self.dev
+		dev.disarm()
+		for grp in dev.groups:
+			if grp.raw_window != self.raw_windows[grp.idx]:
+				grp.raw_window = self.raw_windows[grp.idx]
+		for i, flags in self.chan_flags.items():
+			dev.channels[i].flags = flags
+		dev.flags = self.dev_flags
+
+
+def clipped(baseline):
+	return baseline <= 0 or baseline >= ADC_MAX
+
+
+def dac_calibrate(dev, target, chanlist = None, tolerance = 2.0, max_iter = 8, nevents = 16, step = 0x1000):
+	""" Find DAC offsets which put the baseline of each channel to `target' (ADC counts).
+
+	All channels are calibrated at once: each iteration is one software-triggered
+	acquisition for the whole board. The search is a secant method kept inside the
+	bracket found so far (bisection if the secant step leaves it). While the baseline
+	is clipped at 0 or ADC_MAX, the offset is moved towards the target (a higher
+	offset gives a higher baseline) in doubling steps.
+	Found offsets are written to the channels (see Adc_channel.dac_offset).
+
+	Returns a dict {chan: {'offset', 'baseline', 'rms', 'iterations', 'converged'}}.
+	"""
+	if chanlist is None:
+		chanlist = range(0, const.CHAN_TOTAL)
+	chanlist = list(chanlist)
+
+	state = {}
+	for idx in chanlist:
+		x0 = dev.channels[idx].dac_offset
+		if x0 is None:
+			x0 = 0x8000
+		state[idx] = {'x': x0, 'prev': None, 'lo': None, 'hi': None,
+				'offset': x0, 'baseline': None, 'rms': None, 'iterations': 0, 'converged': False}
+
+	with software_trigger(dev, chanlist) as trig:
+		for it in range(0, max_iter):
+			active = [i for i in chanlist if not state[i]['converged']]
+			if not active:
+				break
+
+			for idx in active:
+				dev.channels[idx].dac_offset = state[idx]['x']
+			msleep(10) # let the DAC output settle
+
+			data = acquire(dev, active, nevents)
+
+			for idx in active:
+				st = state[idx]
+				x = st['x']
+				y, rms, n = sample_stats(data[idx], trig.maw_words[idx])
+				st['iterations'] = it + 1
+				if y is None:
+					continue # no events, try again
+
+				err = y - target
+				if st['baseline'] is None or abs(err) < abs(st['baseline'] - target):
+					st['offset'], st['baseline'], st['rms'] = x, y, rms # the best so far
+				if abs(err) <= tolerance:
+					st['converged'] = True
+					continue
+
+				# keep a bracket: lo/hi are offsets with the baseline below/above target
+				if err < 0:
+					st['lo'] = (x, y)
+				else:
+					st['hi'] = (x, y)
+
+				prev = st['prev']
+				st['prev'] = (x, y)
+
+				towards = 1 if err < 0 else -1
+				if clipped(y): # the slope says nothing, go towards the target
+					last = abs(x - prev[0]) if prev and prev[1] == y else 0
+					nx = x + max(step, 2 * last) * towards
+				elif prev is not None and clipped(prev[1]): # just left the rail
+					nx = x + step * towards
+				elif prev is None: # slope is unknown yet
+					nx = x + step if x < DAC_MAX // 2 else x - step
+				elif prev[1] == y: # saturated, go further
+					nx = x + 2 * (x - prev[0])
+				else:
+					nx = x + (target - y) * (x - prev[0]) / (y - prev[1]) # secant
+
+				if st['lo'] and st['hi']:
+					a, b = sorted((st['lo'][0], st['hi'][0]))
+					if not a < nx < b:
+						nx = (a + b) / 2.0 # bisection
+
+				st['x'] = min(DAC_MAX, max(0, int(round(nx))))
+
+		for idx in chanlist: # the best found values
+			dev.channels[idx].dac_offset = state[idx]['offset']
+
+	return dict((idx, dict((k, state[idx][k]) for k in ('offset', 'baseline', 'rms', 'iterations', 'converged')))
+			for idx in chanlist)
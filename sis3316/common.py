@@ -4,6 +4,7 @@ import sys
 class const:
 	MEM_BANK_SIZE = 0x4000000 # 64MB
 	MEM_BANK_COUNT = 2
+	CHAN_BANK_WORDS = MEM_BANK_SIZE // 4 # a channel's bank capacity
 	CHAN_GRP_COUNT = 4
 	CHAN_PER_GRP   = 4
 	CHAN_MASK  = CHAN_PER_GRP - 1 # 0b11
@@ -15,6 +16,11 @@ from time import sleep
 msleep = lambda x: sleep(x/1000.0)
 usleep = lambda x: sleep(x/1000000.0)
 
+def bank_full(words, evlen):
+	''' A channel's bank with `words' has no room for another event of `evlen' words. '''
+	return words + evlen > const.CHAN_BANK_WORDS
+
+
 def set_bits(int_type, val, offset, mask):
 	''' Set bit-field with value.'''
 	data = int_type & ~(mask << offset)	# clear
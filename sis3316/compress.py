@@ -0,0 +1,387 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Compressed output: a stream of independently decompressible blocks.
+#
+# Block: | b'SISZ' | codec(8) | level(8) | reserved(16) | raw size(32) | compressed size(32) | data |
+
+import io
+import sys
+import time
+import zlib
+import bz2
+from collections import deque
+from struct import Struct
+from array import array
+
+from .readout import write_all
+
+try:
+	import lzma
+except ImportError: # Python 2
+	lzma = None
+
+BLOCK_HEADER = Struct('<4sBBHII')
+BLOCK_MAGIC = b'SISZ'
+
+_thread_time = getattr(time, 'thread_time', time.time) # CPU time of a worker thread
+
+
+def delta_encode(data):
+	""" Differences of consecutive 16-bit words (modulo 2**16): slow baselines become small numbers. """
+	try:
+		import numpy as np
+	except ImportError:
+		np = None
+
+	if np is not None:
+		arr = np.frombuffer(data, '<u2')
+		out = np.empty_like(arr)
+		out[:1] = arr[:1]
+		np.subtract(arr[1:], arr[:-1], out[1:])
+		return out.tobytes()
+
+	arr = array('H', bytes(data))
+	prev = 0
+	for i, val in enumerate(arr):
+		arr[i] = (val - prev) & 0xFFFF
+		prev = val
+	return arr.tobytes()
+
+
+def delta_decode(data):
+	try:
+		import numpy as np
+	except ImportError:
+		np = None
+
+	if np is not None:
+		return np.cumsum(np.frombuffer(data, '<u2'), dtype='<u2').tobytes()
+
+	arr = array('H', bytes(data))
+	acc = 0
+	for i, val in enumerate(arr):
+		acc = (acc + val) & 0xFFFF
+		arr[i] = acc
+	return arr.tobytes()
+
+
+BITPACK_FRAME = 128 # words per frame, a frame has its own bit width
+BITPACK_HEADER = Struct('<I') # number of words | BITPACK_STORED
+BITPACK_STORED = 1 << 31 # the block is stored as it is (packing would make it bigger)
+
+
+def _zigzag(arr):
+	""" Small signed values (as uint16 deltas) to small unsigned ones: 0, -1, 1, -2... -> 0, 1, 2, 3... """
+	return [((v << 1) ^ (0xFFFF if v & 0x8000 else 0)) & 0xFFFF for v in arr]
+
+
+def _frame_width(counts):
+	""" The width which packs a frame smallest, and the number of exceptions then.
+	counts[k]: values of bit length k. A frame of width w takes 16*w bytes,
+	each value longer than w is an exception of 3 bytes (position and value).
+	"""
+	best = None
+	exc = sum(counts)
+	for width in range(0, 17):
+		exc -= counts[width]
+		size = BITPACK_FRAME * width // 8 + 3 * exc
+		if best is None or size < best[0]:
+			best = (size, width, exc)
+	return best[1], best[2]
+
+
+def bitpack_encode(data):
+	""" Delta + zigzag + bit packing of 16-bit words (ADC samples are 14 bit, baselines vary slowly).
+
+	Each frame has the width which packs it smallest; the values which don't fit
+	(event headers between the samples) are exceptions, stored apart. Payload:
+	| number of words(32) | width of each frame(8) | exceptions in each frame(8) |
+	| frames | position of each exception(8) | value of each exception(16) |,
+	a frame of width w is BITPACK_FRAME values of w bits, LSB first (16*w bytes),
+	exceptions are 0 there. If that's not smaller than the data, the data is
+	stored (BITPACK_STORED).
+	"""
+	try:
+		import numpy as np
+	except ImportError:
+		np = None
+
+	nwords = len(data) // 2
+	nframes = -(-nwords // BITPACK_FRAME)
+	if not nwords:
+		return BITPACK_HEADER.pack(0)
+
+	if np is None:
+		deltas = array('H', delta_encode(data))
+		deltas.extend([0] * (nframes * BITPACK_FRAME - nwords)) # the last value repeats
+		zz = _zigzag(deltas)
+		widths = bytearray()
+		nexc = bytearray()
+		frames = []
+		positions = bytearray()
+		values = array('H')
+		for f in range(0, nframes):
+			frame = zz[f * BITPACK_FRAME : (f + 1) * BITPACK_FRAME]
+			counts = [0] * 17
+			for val in frame:
+				counts[val.bit_length()] += 1
+			width, exc = _frame_width(counts)
+			acc = 0
+			for i, val in enumerate(frame):
+				if val >> width:
+					positions.append(i)
+					values.append(val)
+				else:
+					acc |= val << (i * width)
+			widths.append(width)
+			nexc.append(exc)
+			frames.append(acc.to_bytes(BITPACK_FRAME * width // 8, 'little'))
+		if sys.byteorder == 'big':
+			values.byteswap()
+		payload = bytes(widths) + bytes(nexc) + b''.join(frames) + bytes(positions) + values.tobytes()
+	else:
+		arr = np.frombuffer(data, '<u2', nwords)
+		vals = np.empty(nframes * BITPACK_FRAME, np.uint16)
+		vals[:nwords] = arr
+		vals[nwords:] = arr[-1]
+		deltas = np.empty_like(vals)
+		deltas[0] = vals[0]
+		np.subtract(vals[1:], vals[:-1], deltas[1:])
+		signed = deltas.view(np.int16).astype(np.int32)
+		frames = ((signed << 1) ^ (signed >> 15)).astype(np.uint16).reshape(nframes, BITPACK_FRAME)
+		bitlen = np.frexp(frames)[1].astype(np.int64) # bit length of each value
+
+		# the smallest frame: 16*w bytes + 3 bytes per value longer than w
+		counts = np.bincount((np.arange(nframes)[:, None] * 17 + bitlen).ravel(),
+				minlength = nframes * 17).reshape(nframes, 17)
+		longer = counts.sum(axis = 1)[:, None] - np.cumsum(counts, axis = 1) # values longer than w
+		sizes = np.arange(17) * (BITPACK_FRAME // 8) + 3 * longer
+		widths = sizes.argmin(axis = 1).astype(np.uint8)
+		nexc = longer[np.arange(nframes), widths].astype(np.uint8)
+
+		exc = bitlen > widths[:, None]
+		exc_frames, exc_pos = np.nonzero(exc) # in the order of frames, then positions
+		exc_vals = frames[exc_frames, exc_pos]
+		frames = np.where(exc, 0, frames).astype(np.uint16)
+
+		fsizes = widths.astype(np.int64) * (BITPACK_FRAME // 8)
+		offsets = np.cumsum(fsizes) - fsizes
+		out = np.zeros(int(fsizes.sum()), np.uint8)
+		for width in np.unique(widths):
+			if not width:
+				continue
+			sel = np.nonzero(widths == width)[0]
+			bits = ((frames[sel][:, :, None] >> np.arange(width, dtype = np.uint16)) & 1).astype(np.uint8)
+			packed = np.packbits(bits.reshape(len(sel), -1), axis = 1, bitorder = 'little')
+			out[offsets[sel][:, None] + np.arange(packed.shape[1])] = packed
+		payload = widths.tobytes() + nexc.tobytes() + out.tobytes() \
+				+ exc_pos.astype(np.uint8).tobytes() + exc_vals.astype('<u2').tobytes()
+
+	if len(payload) >= 2 * nwords:
+		return BITPACK_HEADER.pack(nwords | BITPACK_STORED) + bytes(data[:2 * nwords])
+	return BITPACK_HEADER.pack(nwords) + payload
+
+
+def bitpack_decode(data):
+	try:
+		import numpy as np
+	except ImportError:
+		np = None
+
+	nwords = BITPACK_HEADER.unpack_from(data)[0]
+	if nwords & BITPACK_STORED:
+		nwords &= ~BITPACK_STORED
+		return bytes(data[BITPACK_HEADER.size : BITPACK_HEADER.size + 2 * nwords])
+	nframes = -(-nwords // BITPACK_FRAME)
+	pos = BITPACK_HEADER.size + 2 * nframes
+
+	if np is None:
+		widths = bytearray(data[BITPACK_HEADER.size : BITPACK_HEADER.size + nframes])
+		nexc = bytearray(data[BITPACK_HEADER.size + nframes : pos])
+		epos = pos + sum(BITPACK_FRAME * width // 8 for width in widths)
+		evals = epos + sum(nexc)
+		vals = array('H')
+		acc_val = 0
+		for width, exc in zip(widths, nexc):
+			size = BITPACK_FRAME * width // 8
+			acc = int.from_bytes(data[pos : pos + size], 'little')
+			pos += size
+			mask = (1 << width) - 1
+			frame = [(acc >> (i * width)) & mask for i in range(0, BITPACK_FRAME)]
+			for n in range(0, exc):
+				frame[data[epos]] = data[evals] | data[evals + 1] << 8
+				epos += 1
+				evals += 2
+			for zz in frame:
+				acc_val = (acc_val + ((zz >> 1) ^ -(zz & 1))) & 0xFFFF
+				vals.append(acc_val)
+		del vals[nwords:]
+		if sys.byteorder == 'big':
+			vals.byteswap()
+		return vals.tobytes()
+
+	widths = np.frombuffer(data, np.uint8, nframes, BITPACK_HEADER.size)
+	nexc = np.frombuffer(data, np.uint8, nframes, BITPACK_HEADER.size + nframes).astype(np.int64)
+	sizes = widths.astype(np.int64) * (BITPACK_FRAME // 8)
+	offsets = np.cumsum(sizes) - sizes
+	payload = np.frombuffer(data, np.uint8, int(sizes.sum()), pos)
+	frames = np.zeros((nframes, BITPACK_FRAME), np.uint16)
+	for width in np.unique(widths):
+		if not width:
+			continue
+		sel = np.nonzero(widths == width)[0]
+		packed = payload[offsets[sel][:, None] + np.arange(BITPACK_FRAME * int(width) // 8)]
+		bits = np.unpackbits(packed, axis = 1, bitorder = 'little').reshape(len(sel), BITPACK_FRAME, width)
+		frames[sel] = (bits.astype(np.uint16) << np.arange(width, dtype = np.uint16)).sum(axis = 2, dtype = np.uint16)
+
+	total = int(nexc.sum())
+	if total:
+		epos = pos + int(sizes.sum())
+		exc_pos = np.frombuffer(data, np.uint8, total, epos)
+		exc_vals = np.frombuffer(data, '<u2', total, epos + total)
+		frames[np.repeat(np.arange(nframes), nexc), exc_pos] = exc_vals
+	zz = frames.ravel().astype(np.int32)
+	deltas = ((zz >> 1) ^ -(zz & 1)).astype(np.uint16)
+	return np.cumsum(deltas, dtype = np.uint16)[:nwords].astype('<u2').tobytes()
+
+
+# name: (id, compress(data, level), decompress(data))
+# 'delta' is delta + zlib (good ratio, zlib speed), 'bitpack' is delta + bit packing
+# (fast with NumPy, the level is not used)
+CODECS = {
+	'zlib': (1, lambda d, l: zlib.compress(d, l), zlib.decompress),
+	'bz2': (2, lambda d, l: bz2.compress(d, l), bz2.decompress),
+	'delta': (4, lambda d, l: zlib.compress(delta_encode(d), l), lambda d: delta_decode(zlib.decompress(d))),
+	'bitpack': (5, lambda d, l: bitpack_encode(d), bitpack_decode),
+	}
+if lzma is not None:
+	CODECS['lzma'] = (3, lambda d, l: lzma.compress(d, preset = l), lzma.decompress)
+
+_CODEC_IDS = dict((v[0], v[2]) for v in CODECS.values())
+
+
+def compress_block(data, codec = 'zlib', level = 6):
+	""" Returns (block, cpu time). """
+	t0 = _thread_time()
+	cid, compress, _ = CODECS[codec]
+	if codec in ('delta', 'bitpack') and len(data) % 2:
+		raise ValueError("%s codec needs 16-bit words." % codec)
+	payload = compress(bytes(data), level)
+	return BLOCK_HEADER.pack(BLOCK_MAGIC, cid, level, 0, len(data), len(payload)) + payload, _thread_time() - t0
+
+
+def iter_blocks(fileobj):
+	""" Yield decompressed blocks of a compressed stream. """
+	while True:
+		hdr = fileobj.read(BLOCK_HEADER.size)
+		if not hdr:
+			return
+		if len(hdr) < BLOCK_HEADER.size:
+			raise EOFError("Truncated block header.")
+		magic, cid, level, _, raw_size, size = BLOCK_HEADER.unpack(hdr)
+		if magic != BLOCK_MAGIC or cid not in _CODEC_IDS:
+			raise ValueError("Not a compressed block.")
+		payload = fileobj.read(size)
+		if len(payload) < size:
+			raise EOFError("Truncated block.")
+		data = _CODEC_IDS[cid](payload)
+		if len(data) != raw_size:
+			raise ValueError("Block size mismatch.")
+		yield data
+
+
+class CompressedWriter(io.RawIOBase):
+	""" A writable file which compresses data in blocks of `block_size' in a worker pool.
+
+	Blocks are written to `fileobj' in order. Up to `max_pending' blocks may wait
+	in the pool; write() blocks when there are more (the caller is the disk writer
+	thread, not the network receive).
+	executor: a concurrent.futures executor, may be shared by several writers.
+	zlib, bz2 and lzma release the GIL, so a thread pool is enough ('delta' and
+	'bitpack' need NumPy for that, the pure Python fallback is slow).
+	"""
+	def __init__(self, fileobj, executor, codec = 'zlib', level = 6, block_size = 4 * 1024 * 1024, max_pending = 8):
+		if codec not in CODECS:
+			raise ValueError("Unknown codec '{0}', use one of: {1}.".format(codec, ', '.join(sorted(CODECS))))
+		if codec in ('delta', 'bitpack') and block_size % 2:
+			raise ValueError("%s codec needs an even block size." % codec)
+		self.fileobj = fileobj
+		self.executor = executor
+		self.codec = codec
+		self.level = level
+		self.block_size = block_size
+		self.max_pending = max_pending
+		self._buf = bytearray()
+		self._pending = deque()
+		self.raw_bytes = 0
+		self.compressed_bytes = 0
+		self.cpu_time = 0.0
+
+	def writable(self):
+		return True
+
+	def write(self, data):
+		count = len(data)
+		self._buf += data
+		while len(self._buf) >= self.block_size:
+			self._submit(self._buf[:self.block_size])
+			del self._buf[:self.block_size]
+		self._collect(wait = False)
+		return count
+
+	def _submit(self, block):
+		self._pending.append((len(block), self.executor.submit(compress_block, bytes(block), self.codec, self.level)))
+		while len(self._pending) > self.max_pending:
+			self._collect_one()
+
+	def _collect_one(self):
+		raw_size, future = self._pending.popleft()
+		block, cpu = future.result()
+		write_all(self.fileobj, block)
+		self.raw_bytes += raw_size
+		self.compressed_bytes += len(block)
+		self.cpu_time += cpu
+
+	def _collect(self, wait):
+		while self._pending and (wait or self._pending[0][1].done()):
+			self._collect_one()
+
+	def flush(self):
+		""" Compress the data buffered so far as a (short) block and write all pending blocks. """
+		if self.closed:
+			return
+		if self._buf:
+			self._submit(self._buf)
+			self._buf = bytearray()
+		self._collect(wait = True)
+		self.fileobj.flush()
+
+	def close(self):
+		if not self.closed:
+			self.flush()
+			io.RawIOBase.close(self)
+			self.fileobj.close()
+
+	def stats(self):
+		mb = self.raw_bytes / 1024.0**2
+		return {'raw': self.raw_bytes, 'compressed': self.compressed_bytes,
+			'ratio': float(self.raw_bytes) / self.compressed_bytes if self.compressed_bytes else None,
+			'cpu_per_mb': self.cpu_time / mb if mb else None}
@@ -0,0 +1,236 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# A single-file container for readout data: spill-framed chunks and a trailing index.
+#
+# File:    | file header | chunk | ... | index block | chunk | ... | index block | trailer |
+# Header:  b'SIS3316\0', version(32), reserved(32)
+# Chunk:   | AAA(12) | a(4) | chan(8) | flags(8) |   a = 2, flags: bit0 sync, bit1 bank
+#          | nSpill(32)                            |
+#          | x(4) | size in words(28)              |
+#          | timestamp (double, unix time)         |
+#          | data ...                              |
+# Index block: b'SIXB', number of entries(32), offset of the previous index block(64, 0 if none),
+#          an entry per chunk written since the previous block (see INDEX_ENTRY)
+# Trailer: offset of the last index block(64), number of entries in all blocks(32), b'SIDX'
+#
+# An index block is written every `index_block' chunks and on close, so the
+# writer doesn't keep the index of a long run in memory.
+
+import time
+from collections import namedtuple
+from struct import Struct
+
+from .readout import destination
+
+MAGIC = b'SIS3316\0'
+VERSION = 3
+FILE_HEADER = Struct('<8sII')
+CHUNK_HEADER = Struct('<IIId')
+CHUNK_MAGIC = 0xAAA
+INDEX_ENTRY = Struct('<IBBxxQId') # spill, chan, flags, data offset, data size (bytes), timestamp
+INDEX_BLOCK = Struct('<4sIQ')
+INDEX_BLOCK_MAGIC = b'SIXB'
+TRAILER = Struct('<QI4s')
+TRAILER_MAGIC = b'SIDX'
+
+FLAG_SYNC = 0b1 # the data starts with an event
+FLAG_BANK = 0b10
+
+Entry = namedtuple('entry', 'spill, chan, sync, bank, offset, size, ts')
+
+
+class FormatError(ValueError):
+	""" Not a container or a broken one. """
+
+
+def chunk_header(chan, spill, size, sync = True, bank = 0, ts = None):
+	""" A chunk header for `size' bytes of channel's data. """
+	if size % 4 or size // 4 > 0xFffFFFF:
+		raise ValueError("Chunk size should be a multiple of 4 bytes below 1GB, {0} given.".format(size))
+	if ts is None:
+		ts = time.time()
+	flags = (FLAG_SYNC if sync else 0) | (FLAG_BANK if bank else 0)
+	return CHUNK_HEADER.pack(CHUNK_MAGIC << 20 | VERSION << 16 | (chan & 0xFF) << 8 | flags,
+			spill, size // 4, ts)
+
+
+def parse_chunk_header(hdr, offset = None):
+	""" Returns an Entry (with a given data offset). Raises FormatError. """
+	word0, spill, size, ts = CHUNK_HEADER.unpack(hdr)
+	if word0 >> 20 != CHUNK_MAGIC:
+		raise FormatError("Not a chunk header.")
+	flags = word0 & 0xFF
+	return Entry(spill, (word0 >> 8) & 0xFF, bool(flags & FLAG_SYNC), int(bool(flags & FLAG_BANK)),
+			offset, 4 * (size & 0xFffFFFF), ts)
+
+
+class ContainerWriter(object):
+	""" Write readout chunks to a container.
+	target: a file, or anything readout.destination() accepts (like a sis3316.pipeline destination).
+	index_block: the number of chunks to write an index block after.
+	"""
+	def __init__(self, target, index_block = 4096):
+		self.dest = destination(target)
+		self.index_block = index_block
+		self.spill = 0
+		self.count = 0 # chunks written
+		self.entries = [] # not in an index block yet
+		self._last_block = 0
+		self._closed = False
+		self.dest.push(FILE_HEADER.pack(MAGIC, VERSION, 0))
+
+	def next_spill(self):
+		""" Call once per bank swap. Returns the new spill number. """
+		self.spill += 1
+		return self.spill
+
+	def write_chunk(self, chan, data, sync = True, bank = 0, ts = None):
+		""" Write a chunk of channel's data (a whole number of 32-bit words). """
+		if ts is None:
+			ts = time.time()
+		self.dest.push(chunk_header(chan, self.spill, len(data), sync, bank, ts))
+		offset = self.dest.index
+		self.dest.push(data)
+		self.entries.append(Entry(self.spill, chan, bool(sync), int(bool(bank)), offset, len(data), ts))
+		self.count += 1
+		if len(self.entries) >= self.index_block:
+			self._write_index()
+
+	def _write_index(self):
+		offset = self.dest.index
+		self.dest.push(INDEX_BLOCK.pack(INDEX_BLOCK_MAGIC, len(self.entries), self._last_block)
+				+ b''.join(INDEX_ENTRY.pack(e.spill, e.chan, (FLAG_SYNC if e.sync else 0) | (FLAG_BANK if e.bank else 0),
+					e.offset, e.size, e.ts) for e in self.entries))
+		self._last_block = offset
+		self.entries = []
+
+	def close(self):
+		""" Write the last index block and the trailer. Doesn't close the target. """
+		if self._closed:
+			return
+		self._closed = True
+		self._write_index()
+		self.dest.push(TRAILER.pack(self._last_block, self.count, TRAILER_MAGIC))
+
+
+class ContainerReader(object):
+	""" Read a container. The index is loaded from the trailer, or rebuilt by
+	walking the chunk headers if the file was not closed properly.
+	"""
+	def __init__(self, fileobj):
+		if isinstance(fileobj, str):
+			fileobj = open(fileobj, 'rb')
+		self.f = fileobj
+
+		self.f.seek(0)
+		hdr = self.f.read(FILE_HEADER.size)
+		if len(hdr) < FILE_HEADER.size:
+			raise FormatError("File is too short.")
+		magic, version, _ = FILE_HEADER.unpack(hdr)
+		if magic != MAGIC:
+			raise FormatError("Not a sis3316 container.")
+		if version != VERSION:
+			raise FormatError("Unsupported container version {0}.".format(version))
+
+		self.entries = self._load_index()
+		if self.entries is None:
+			self.entries = self._scan()
+
+	def _load_index(self):
+		self.f.seek(0, 2)
+		end = self.f.tell()
+		if end < FILE_HEADER.size + INDEX_BLOCK.size + TRAILER.size:
+			return None
+
+		self.f.seek(end - TRAILER.size)
+		offset, total, magic = TRAILER.unpack(self.f.read(TRAILER.size))
+		if magic != TRAILER_MAGIC:
+			return None
+
+		# Index blocks, from the last one back
+		blocks = []
+		limit = end - TRAILER.size
+		while offset:
+			if offset < FILE_HEADER.size or offset + INDEX_BLOCK.size > limit:
+				return None
+			self.f.seek(offset)
+			magic, count, prev = INDEX_BLOCK.unpack(self.f.read(INDEX_BLOCK.size))
+			if magic != INDEX_BLOCK_MAGIC or offset + INDEX_BLOCK.size + count * INDEX_ENTRY.size > limit:
+				return None
+			blocks.append((offset + INDEX_BLOCK.size, count))
+			limit = offset
+			offset = prev
+
+		entries = []
+		for offset, count in reversed(blocks):
+			self.f.seek(offset)
+			raw = self.f.read(count * INDEX_ENTRY.size)
+			for n in range(0, count):
+				spill, chan, flags, doff, size, ts = INDEX_ENTRY.unpack_from(raw, n * INDEX_ENTRY.size)
+				entries.append(Entry(spill, chan, bool(flags & FLAG_SYNC), int(bool(flags & FLAG_BANK)), doff, size, ts))
+		if len(entries) != total:
+			return None
+		return entries
+
+	def _scan(self):
+		""" Walk chunk headers (skipping index blocks) up to the first broken one. """
+		entries = []
+		pos = FILE_HEADER.size
+		while True:
+			self.f.seek(pos)
+			hdr = self.f.read(CHUNK_HEADER.size)
+			if hdr[:len(INDEX_BLOCK_MAGIC)] == INDEX_BLOCK_MAGIC and len(hdr) >= INDEX_BLOCK.size:
+				magic, count, prev = INDEX_BLOCK.unpack_from(hdr)
+				pos += INDEX_BLOCK.size + count * INDEX_ENTRY.size
+				continue
+			if len(hdr) < CHUNK_HEADER.size:
+				break
+			try:
+				entry = parse_chunk_header(hdr, pos + CHUNK_HEADER.size)
+			except FormatError:
+				break
+			self.f.seek(0, 2)
+			if entry.offset + entry.size > self.f.tell():
+				break # truncated
+			entries.append(entry)
+			pos = entry.offset + entry.size
+		return entries
+
+	def select(self, chan = None, spill = None):
+		""" Index entries of a channel and/or a spill. """
+		return [e for e in self.entries
+				if (chan is None or e.chan == chan) and (spill is None or e.spill == spill)]
+
+	@property
+	def spills(self):
+		return sorted(set(e.spill for e in self.entries))
+
+	@property
+	def channels(self):
+		return sorted(set(e.chan for e in self.entries))
+
+	def read(self, entry):
+		""" Data of an index entry. """
+		self.f.seek(entry.offset)
+		return self.f.read(entry.size)
+
+	def close(self):
+		self.f.close()
@@ -0,0 +1,79 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Trigger statistic counters
+
+import time
+from collections import namedtuple
+
+from .common import *
+
+Snapshot = namedtuple('snapshot', 'ts, counters')
+
+
+def counter_rates(prev, cur):
+	""" Rates [Hz] between two snapshots (see Sis3316.counters_snapshot).
+	Returns a list (per channel) of dicts (per counter).
+	Counters are 32-bit, a single rollover between snapshots is handled.
+	"""
+	dt = cur.ts - prev.ts
+	if dt <= 0:
+		raise ValueError("Snapshots should be taken one after another.")
+
+	rates = []
+	for c0, c1 in zip(prev.counters, cur.counters):
+		if c0 is None or c1 is None:
+			rates.append(None)
+			continue
+		rates.append(dict( (k, ((c1[k] - c0[k]) & 0xFFFFFFFF) / dt) for k in c1 ))
+	return rates
+
+
+class Sis3316(object):
+
+	def counters_snapshot(self, chanlist = None):
+		""" Read trigger statistic counters of several channels in one bulk request.
+		Returns Snapshot(ts, counters), where counters is a list of dicts
+		(None for channels not in chanlist).
+		"""
+		if chanlist is None:
+			chanlist = range(0, const.CHAN_TOTAL)
+
+		addrs = []
+		for i in chanlist:
+			addrs.extend(self.channels[i].stat_counter_addrs)
+
+		ts = time.time()
+		data = self.read_list(addrs)
+
+		names = self.channels[0].stat_counter_names
+		num = len(names)
+		counters = [None] * const.CHAN_TOTAL
+		for n, i in enumerate(chanlist):
+			counters[i] = dict(zip(names, data[n * num : (n + 1) * num]))
+
+		return Snapshot(ts, counters)
+
+	def counters_rates(self, interval = 1.0, chanlist = None):
+		""" Take two snapshots `interval' seconds apart and return trigger rates. """
+		prev = self.counters_snapshot(chanlist)
+		sleep(interval)
+		cur = self.counters_snapshot(chanlist)
+		return counter_rates(prev, cur)
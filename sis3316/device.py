@@ -61,7 +61,7 @@ class Sis3316(object):
 	_help_methods = [ 'reset', 'fire', 'ts_clear', 'read', 'write', 'read_list', 'write_list']
 	_help_properties = ['id','serno', 'hardwareVersion', 'status']
 	
-	__slots__ = ('groups', 'channels', 'triggers', 'sum_triggers')
+	__slots__ = ('_units', '_dac_offsets')
 	
 	dump_conf = common_dump_conf
 	ls = common_ls
@@ -69,17 +69,33 @@ class Sis3316(object):
 	
 	def __init__(self):
 		""" Initializes class structures, but not touches the device. """
-		self.groups = [adcunit.Adc_group(self, i) for i in range(0, const.CHAN_GRP_COUNT)]
-		self.channels = [c for g in self.groups for c in g.channels]
-		self.triggers = [c.trig for c in self.channels]
-		self.sum_triggers = [g.sum_trig for g in self.groups]
-		
-		#short aliases
-		self.grp = self.groups
-		self.chan = self.channels
-		self.trig = self.triggers
-		self.strig = self.sum_triggers
-		
+		self._units = None # ADC units are created on first access
+		self._dac_offsets = {} # chan idx: value, DAC offsets can't be read back
+	
+	def _adc_units(self):
+		""" Create groups, channels and triggers objects (once). """
+		if self._units is None:
+			groups = [adcunit.Adc_group(self, i) for i in range(0, const.CHAN_GRP_COUNT)]
+			channels = [c for g in groups for c in g.channels]
+			self._units = {
+				'groups': groups,
+				'channels': channels,
+				'triggers': [c.trig for c in channels],
+				'sum_triggers': [g.sum_trig for g in groups],
+				}
+		return self._units
+	
+	groups = property(lambda self: self._adc_units()['groups'])
+	channels = property(lambda self: self._adc_units()['channels'])
+	triggers = property(lambda self: self._adc_units()['triggers'])
+	sum_triggers = property(lambda self: self._adc_units()['sum_triggers'])
+	
+	#short aliases
+	grp = groups
+	chan = channels
+	trig = triggers
+	strig = sum_triggers
+	
 
 	def configure(self, id = 0x00):
 		""" Prepere after restart.
@@ -128,6 +144,32 @@ class Sis3316(object):
 		#~ pass
 	
 	
+	_image_regs = (SIS3316_SAMPLE_CLOCK_DISTRIBUTION_CONTROL, SIS3316_FP_LVDS_BUS_CONTROL,
+			SIS3316_NIM_INPUT_CONTROL_REG, SIS3316_ACQUISITION_CONTROL_STATUS,
+			SIS3316_LEMO_OUT_CO_SELECT_REG, SIS3316_LEMO_OUT_TO_SELECT_REG, SIS3316_LEMO_OUT_UO_SELECT_REG,
+			)
+	
+	def register_image(self):
+		""" Read all plain configuration registers at once. 
+		Returns a dict {address: value}, DAC offsets are included with 'dac_offsets' key.
+		"""
+		addrs = list(self._image_regs)
+		for grp in self.groups:
+			addrs.extend(grp.image_addrs)
+		
+		image = dict(zip(addrs, self.read_list(addrs)))
+		image[SIS3316_ACQUISITION_CONTROL_STATUS] &= 0xFFFF # the rest is status
+		image['dac_offsets'] = dict(self._dac_offsets)
+		return image
+	
+	def load_register_image(self, image):
+		""" Write back the configuration saved with register_image(). """
+		addrs = [k for k in image.keys() if not isinstance(k, str)]
+		self.write_list(addrs, [image[a] for a in addrs])
+		
+		for idx, value in image.get('dac_offsets', {}).items():
+			self.channels[idx].dac_offset = value
+	
 	def _set_field(self, addr, value, offset, mask):
 		""" Read value, set bits and write back. """
 		data = self.read(addr)
@@ -277,7 +319,12 @@ class Sis3316(object):
 	@property
 	def temp(self):
 		""" Temperature C. """
-		val = self._get_field(SIS3316_INTERNAL_TEMPERATURE_REG, 0, 0x3FF)
+		return self._temp_decode(self.read(SIS3316_INTERNAL_TEMPERATURE_REG))
+	
+	@staticmethod
+	def _temp_decode(data):
+		""" Convert the temperature register value to degrees C. """
+		val = get_bits(data, 0, 0x3FF)
 		if val & 0x200:	#10-bit arithmetics
 			val -= 0x400
 
@@ -342,10 +389,12 @@ class Sis3316(object):
 		#check FPGA Link interface status
 		self.write(SIS3316_VME_FPGA_LINK_ADC_PROT_STATUS, 0xE0E0E0E0) #clear error Latch bits 
 		status = self.read(SIS3316_VME_FPGA_LINK_ADC_PROT_STATUS)
-		if status != 0x18181818:
+		if status != self._link_status_ok:
 			ok = False
 		
 		return ok
+	
+	_link_status_ok = 0x18181818 # SIS3316_VME_FPGA_LINK_ADC_PROT_STATUS, all four links are up
 		
 	def reboot(self):
 		""" Reset the registers to power-on state."""
@@ -0,0 +1,602 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# A SIS3316 emulator: the Ethernet UDP protocol, registers and DDR memory.
+#
+# Runs in a thread (or as a script) on a local UDP port, so Sis3316_udp can
+# be tested and benchmarked without a board:
+#	with Emulator(rate = 1000) as emu:
+#		dev = Sis3316_udp('127.0.0.1', emu.port, local_port = 0)
+
+import math
+import random
+import select
+import socket
+import sys
+import time
+from array import array
+from struct import pack, unpack_from, error as struct_error
+from threading import Thread, Event, RLock
+
+from .common import *
+from .registers import *
+from .i2c import I2C_ACK, I2C_START, I2C_REP_START, I2C_STOP, I2C_WRITE, I2C_READ
+from .adc_unit.registers import *
+from .adc_unit.channel import event_words
+from .sis3316_udp import SIS3316_FPGA_ADC_GRP_MEM_BASE, SIS3316_FPGA_ADC_GRP_MEM_OFFSET, \
+		VME_READ_LIMIT, VME_WRITE_LIMIT, FIFO_READ_LIMIT, FIFO_WRITE_LIMIT
+
+STAT_NO_GRANT = 1 << 4
+STAT_FIFO_TIMEOUT = 1 << 5
+STAT_PROTOCOL_ERROR = 1 << 6
+
+TS_MASK = (1 << 48) - 1
+GRANT = 1 << 20 # own grant bit of the link interface
+GROUP_STATUS_OK = 0x130018 # see Adc_group._status_ok
+LINK_STATUS_OK = 0x18181818 # see Sis3316._link_status_ok
+SI570_ADDR = 0x55 # the clock oscillator on I2C
+SI570_250MHZ = {13: 0x20, 14: 0xC2} # see Sis3316._freq_presets
+TEMPLATES = 16 # different noise per event, events are made of these
+
+
+class Emulator(object):
+	""" A SIS3316 on a local UDP port.
+
+	Protocol: link read/write (0x10/0x11), VME read/write (0x20/0x21),
+	FIFO read/write (0x30/0x31), with the packet identifier (VME FPGA 2008+,
+	or without it if `packet_identifier' is False), status bits (no grant,
+	FIFO timeout, protocol error) and FIFO response packets numbered in the
+	status field. A response goes to the request's sender.
+
+	Registers: a plain r/w register file, plus:
+		the link grant (arbitration control bit 20), module id, serial No.,
+		temperature, Si570 clock oscillator on I2C (250 MHz),
+		acquisition status (armed, bank, busy, threshold overrun),
+		actual/previous bank sample addresses, trigger statistic counters
+		(internal and hit), group and FPGA link status (always ok),
+		key registers (reset, arm/swap banks, disarm, trigger, timestamp clear),
+		data transfer control (FIFO logic of each group).
+
+	Memory: two memory chips per group, two banks per channel (see
+	Adc_channel.bank_location). While armed, each channel gets events at
+	`rate' Hz ({chan: Hz} or Hz for all channels) in its current bank, in the
+	format set by the registers (format mask, MAW test buffer, raw window),
+	with 250 MHz timestamps. A full bank takes no more events.
+	The banks are filled every `tick' seconds by a thread of serve() (and on
+	key register writes), not while a request is handled.
+	Raw samples are `pedestal' + gaussian noise (`noise') + a pulse of
+	`amplitude' (0: no pulse). Memory is allocated as the banks fill up.
+
+	Faults (of the seeded `seed' random generator):
+		loss: probability to drop a packet (requests and responses),
+		reorder: probability to send a response packet after the next one,
+		duplicate: probability to send a response packet twice,
+		latency: seconds to wait before handling a request.
+	gap: seconds between the packets of a response (like udp_transmit_gap);
+	0 still lets other threads run, so a client in the same process keeps up
+	(a burst larger than the receive buffer of its socket is lost otherwise).
+	stats: counts of requests, packets sent and faults.
+	"""
+	clock = 250e6 # Hz
+	modid = 0x33162008
+	serno = 0x30
+	temp = 40.0 # C
+	hardware_version = 0x3
+	firmware = 0x250A0108 # ADC FPGA firmware
+
+	def __init__(self, host = '127.0.0.1', port = 0, rate = 0, seed = None,
+			loss = 0.0, reorder = 0.0, duplicate = 0.0, latency = 0.0, gap = 0.0,
+			packet_identifier = True, pedestal = 1000, noise = 2.0, amplitude = 0, tick = 0.01):
+		self.loss = loss
+		self.reorder = reorder
+		self.duplicate = duplicate
+		self.latency = latency
+		self.gap = gap
+		self.packet_identifier = packet_identifier
+		self.pedestal = pedestal
+		self.noise = noise
+		self.amplitude = amplitude
+		self.tick = tick
+		self.rates = dict.fromkeys(range(const.CHAN_TOTAL), 0.0)
+		self.set_rate(rate)
+
+		self._rnd = random.Random(seed)
+		self.grant = False
+		self._seed = seed
+		self._lock = RLock() # requests of the server thread vs. direct calls
+		self._templates = {}
+		self.mem = {} # {(grp_no, mem_no, region): bytearray}, region: bank | odd channel << 1
+		self.stats = dict.fromkeys(('requests', 'packets', 'dropped', 'reordered',
+				'duplicated', 'malformed', 'errors'), 0)
+		self.reset()
+
+		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		sock.bind((host, port))
+		self._sock = sock
+		self._held = None # a packet delayed by reordering
+		self._stop_flag = Event()
+		self._thread = None
+
+	@property
+	def address(self):
+		return self._sock.getsockname()
+
+	@property
+	def port(self):
+		return self.address[1]
+
+	def set_rate(self, rate):
+		""" Event rate, Hz: a number for all channels or {chan: Hz}. """
+		if isinstance(rate, dict):
+			self.rates.update(rate)
+		else:
+			self.rates = dict.fromkeys(range(const.CHAN_TOTAL), float(rate))
+
+	def reset(self):
+		""" Power-on state (the memory content is kept). """
+		with self._lock:
+			self.regs = {}
+			self.armed = False
+			self.bank = 0
+			self.fill = [0] * const.CHAN_TOTAL # words in the current bank
+			self.prev = [0] * const.CHAN_TOTAL # addr_prev
+			self.events = [0] * const.CHAN_TOTAL # for the trigger statistic counters
+			self._carry = [0.0] * const.CHAN_TOTAL
+			self._xfer = [None] * const.CHAN_GRP_COUNT # [cmd, mem_no, woffset] of the FIFO logic
+			self._i2c = {'data': 0, 'state': None, 'ptr': 0, 'regs': dict(SI570_250MHZ)}
+			self._t0 = self._t_acq = time.time()
+
+# ----------- Server ----------------------
+
+	def start(self):
+		""" Serve requests in a background thread. """
+		self._stop_flag.clear()
+		self._thread = Thread(target = self.serve, name = 'sis3316-emulator')
+		self._thread.daemon = True
+		self._thread.start()
+		return self
+
+	def stop(self):
+		if self._thread:
+			self._stop_flag.set()
+			self._thread.join()
+			self._thread = None
+
+	def close(self):
+		self.stop()
+		self._sock.close()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def serve(self):
+		""" Handle requests until stop(). """
+		filler = Thread(target = self._fill_loop, name = 'sis3316-emulator-fill')
+		filler.daemon = True
+		filler.start()
+		try:
+			self._serve()
+		finally:
+			self._stop_flag.set()
+			filler.join()
+
+	def _fill_loop(self):
+		while not self._stop_flag.wait(self.tick):
+			with self._lock:
+				self._acquire()
+
+	def _serve(self):
+		sock = self._sock
+		while not self._stop_flag.is_set():
+			if not select.select([sock], [], [], 0.05)[0]:
+				continue
+			msg, addr = sock.recvfrom(0x10000)
+			self.stats['requests'] += 1
+			if self.loss and self._rnd.random() < self.loss:
+				self.stats['dropped'] += 1
+				continue
+			if self.latency:
+				time.sleep(self.latency)
+
+			try:
+				with self._lock:
+					replies = self.handle(msg)
+			except (struct_error, IndexError):
+				self.stats['malformed'] += 1
+				continue
+			except Exception:
+				self.stats['errors'] += 1
+				continue
+
+			for n, pkt in enumerate(replies):
+				if n:
+					time.sleep(self.gap)
+				self._send(pkt, addr)
+			if self._held is not None: # nothing to swap it with
+				sock.sendto(self._held, addr)
+				self._held = None
+
+	def _send(self, pkt, addr):
+		rnd = self._rnd
+		if self.loss and rnd.random() < self.loss:
+			self.stats['dropped'] += 1
+			return
+		if self.reorder and self._held is None and rnd.random() < self.reorder:
+			self.stats['reordered'] += 1
+			self._held = pkt
+			return
+
+		self._sock.sendto(pkt, addr)
+		self.stats['packets'] += 1
+		if self._held is not None:
+			self._sock.sendto(self._held, addr)
+			self._held = None
+		if self.duplicate and rnd.random() < self.duplicate:
+			self.stats['duplicated'] += 1
+			self._sock.sendto(pkt, addr)
+
+	def handle(self, msg):
+		""" Process a request packet, returns a list of response packets. """
+		cmd = msg[0]
+		if cmd == 0x11: # link write has no packet identifier and no response
+			addr, data = unpack_from('<II', msg, 1)
+			self.write(addr, data)
+			return []
+
+		if self.packet_identifier:
+			hdr, pos = msg[:2], 2 # a response repeats the identifier of its request
+		else:
+			hdr, pos = msg[:1], 1
+
+		if cmd == 0x10:
+			addr, = unpack_from('<I', msg, pos)
+			return [hdr + pack('<II', addr, self.read(addr))]
+
+		if cmd == 0x20:
+			num = unpack_from('<H', msg, pos)[0] + 1
+			if num > VME_READ_LIMIT:
+				return [self._status(hdr, STAT_PROTOCOL_ERROR)]
+			addrs = unpack_from('<%dI' % num, msg, pos + 2)
+			if not self.grant:
+				return [self._status(hdr, STAT_NO_GRANT)]
+			return [self._status(hdr, 0) + pack('<%dI' % num, *[self.read(a) for a in addrs])]
+
+		if cmd == 0x21:
+			num = unpack_from('<H', msg, pos)[0] + 1
+			if num > VME_WRITE_LIMIT:
+				return [self._status(hdr, STAT_PROTOCOL_ERROR)]
+			admix = unpack_from('<%dI' % (2 * num), msg, pos + 2)
+			if not self.grant:
+				return [self._status(hdr, STAT_NO_GRANT)]
+			for addr, data in zip(admix[::2], admix[1::2]):
+				self.write(addr, data)
+			return [self._status(hdr, 0)]
+
+		if cmd == 0x30:
+			wnum, addr = unpack_from('<HI', msg, pos)
+			return self._fifo_read(hdr, addr, wnum + 1)
+
+		if cmd == 0x31:
+			wnum, addr = unpack_from('<HI', msg, pos)
+			return [self._fifo_write(hdr, addr, wnum + 1, msg[pos + 6:])]
+
+		self.stats['malformed'] += 1
+		return []
+
+	@staticmethod
+	def _status(hdr, stat):
+		return hdr + bytes((stat,))
+
+# ----------- Registers ----------------------
+
+	def read(self, addr):
+		""" Register value as the board would return it. """
+		with self._lock:
+			return self._read(addr) & 0xFFFFFFFF
+
+	def _read(self, addr):
+		regs = self.regs
+		if addr == SIS3316_MODID:
+			return self.modid
+		if addr == SIS3316_INTERFACE_ACCESS_ARBITRATION_CONTROL:
+			return regs.get(addr, 0) | (GRANT if self.grant else 0)
+		if addr == SIS3316_HARDWARE_VERSION:
+			return self.hardware_version
+		if addr == SIS3316_INTERNAL_TEMPERATURE_REG:
+			return int(self.temp * 4) & 0x3FF
+		if addr == SIS3316_SERIAL_NUMBER_REG:
+			return self.serno
+		if addr == SIS3316_ADC_CLK_OSC_I2C_REG:
+			return self._i2c['data']
+		if addr == SIS3316_ACQUISITION_CONTROL_STATUS:
+			return regs.get(addr, 0) & 0xFFFF | self._acq_status()
+		if addr == SIS3316_VME_FPGA_LINK_ADC_PROT_STATUS:
+			return LINK_STATUS_OK
+		if SIS3316_KEY_RESET <= addr < 0x1000: # key registers are write only
+			return 0
+
+		if SIS3316_FPGA_ADC_GRP_REG_BASE <= addr < SIS3316_ADC_GRP(0, const.CHAN_GRP_COUNT):
+			grp_no, reg = divmod(addr - SIS3316_FPGA_ADC_GRP_REG_BASE, SIS3316_FPGA_ADC_GRP_REG_OFFSET)
+			if reg == FIRMWARE_REG:
+				return self.firmware
+			if reg == STATUS_REG:
+				return GROUP_STATUS_OK
+			if ACTUAL_SAMPLE_ADDRESS_REG <= reg < ACTUAL_SAMPLE_ADDRESS_REG + 0x10:
+				return self.fill[grp_no * const.CHAN_PER_GRP + (reg - ACTUAL_SAMPLE_ADDRESS_REG) // 4]
+			if PREVIOUS_BANK_SAMPLE_ADDRESS_REG <= reg < PREVIOUS_BANK_SAMPLE_ADDRESS_REG + 0x10:
+				return self.prev[grp_no * const.CHAN_PER_GRP + (reg - PREVIOUS_BANK_SAMPLE_ADDRESS_REG) // 4]
+			if TRIGGER_STATISTIC_COUNTERS_REG <= reg < TRIGGER_STATISTIC_COUNTERS_REG + 0x20 * const.CHAN_PER_GRP:
+				cid, idx = divmod(reg - TRIGGER_STATISTIC_COUNTERS_REG, 0x20)
+				if idx // 4 in (0, 1): # internal, hit
+					return self.events[grp_no * const.CHAN_PER_GRP + cid]
+				return 0
+
+		return regs.get(addr, 0)
+
+	def write(self, addr, data):
+		""" Register write as the board would do it. """
+		with self._lock:
+			self._write(addr, data & 0xFFFFFFFF)
+
+	def _write(self, addr, data):
+		if addr == SIS3316_INTERFACE_ACCESS_ARBITRATION_CONTROL:
+			self.grant = bool(data & 0b1)
+			self.regs[addr] = data & 0b1
+		elif addr in (SIS3316_MODID, SIS3316_HARDWARE_VERSION, SIS3316_SERIAL_NUMBER_REG):
+			pass # read only
+		elif addr == SIS3316_ADC_CLK_OSC_I2C_REG:
+			self._i2c_cmd(data)
+		elif addr == SIS3316_ACQUISITION_CONTROL_STATUS:
+			self.regs[addr] = data & 0xFFFF # status bits are read only
+		elif SIS3316_DATA_TRANSFER_GRP_CTRL_REG <= addr < SIS3316_DATA_TRANSFER_GRP_CTRL_REG + 4 * const.CHAN_GRP_COUNT:
+			grp_no = (addr - SIS3316_DATA_TRANSFER_GRP_CTRL_REG) // 4
+			self.regs[addr] = data
+			cmd = data >> 30
+			self._xfer[grp_no] = [cmd, data >> 28 & 0b1, data & 0x3FFFFFF] if cmd & 0b10 else None
+		elif addr == SIS3316_VME_FPGA_LINK_ADC_PROT_STATUS:
+			pass # clears error latches, there are no errors
+		elif SIS3316_KEY_RESET <= addr < 0x1000:
+			self._key(addr)
+		else:
+			self.regs[addr] = data
+
+	def _key(self, addr):
+		self._acquire() # the events until now go to the current bank
+		if addr == SIS3316_KEY_RESET:
+			self.reset() # the link interface keeps its grant
+		elif addr == SIS3316_KEY_DISARM:
+			self.armed = False
+		elif addr == SIS3316_KEY_DISARM_AND_ARM_BANK1:
+			self._arm(0)
+		elif addr == SIS3316_KEY_DISARM_AND_ARM_BANK2:
+			self._arm(1)
+		elif addr == SIS3316_KEY_TRIGGER:
+			if self.armed:
+				now = time.time()
+				for chan in range(0, const.CHAN_TOTAL):
+					self._append_events(chan, now, 0.0, 1)
+		elif addr == SIS3316_KEY_TIMESTAMP_CLEAR:
+			self._t0 = time.time()
+
+	def _arm(self, bank):
+		""" Disarm and arm `bank': addr_prev of each channel is latched, the bank starts from 0. """
+		self.prev = list(self.fill)
+		self.fill = [0] * const.CHAN_TOTAL
+		self.bank = bank
+		self.armed = True
+		self._t_acq = time.time()
+
+	def _acq_status(self):
+		overrun = any(self.fill[chan] >= self._group_reg(chan // const.CHAN_PER_GRP, ADDRESS_THRESHOLD_REG) & 0xFFFFFF
+				for chan in range(0, const.CHAN_TOTAL))
+		return self.armed << 16 | self.bank << 17 | self.armed << 18 | overrun << 19
+
+	def _group_reg(self, grp_no, reg):
+		return self.regs.get(SIS3316_ADC_GRP(reg, grp_no), 0)
+
+	def _i2c_cmd(self, cmd):
+		""" Si570 on the I2C bus (see i2c.py): register pointer write, register reads and writes. """
+		i2c = self._i2c
+		data = 0
+		if cmd & (I2C_START | I2C_REP_START):
+			i2c['state'] = 'addr'
+		elif cmd & I2C_STOP:
+			i2c['state'] = None
+		elif cmd & I2C_WRITE:
+			byte = cmd & 0xFF
+			state = i2c['state']
+			if state == 'addr':
+				if byte >> 1 == SI570_ADDR:
+					i2c['state'] = 'read' if byte & 0b1 else 'ptr'
+					data = I2C_ACK
+				else:
+					i2c['state'] = None
+			elif state == 'ptr':
+				i2c['ptr'] = byte
+				i2c['state'] = 'write'
+				data = I2C_ACK
+			elif state == 'write':
+				i2c['regs'][i2c['ptr']] = byte
+				i2c['ptr'] += 1
+				data = I2C_ACK
+		elif cmd & I2C_READ:
+			if i2c['state'] == 'read':
+				data = i2c['regs'].get(i2c['ptr'], 0)
+				i2c['ptr'] += 1
+		i2c['data'] = data
+
+# ----------- Memory ----------------------
+
+	def _acquire(self):
+		""" Put the events since the last call into the current banks (at most a bank each). """
+		now = time.time()
+		if not self.armed:
+			self._t_acq = now
+			return
+		t_from, self._t_acq = self._t_acq, now
+		dt = now - t_from
+		for chan, rate in self.rates.items():
+			if not rate:
+				continue
+			self._carry[chan] += rate * dt
+			num = int(self._carry[chan])
+			if num:
+				self._carry[chan] -= num
+				self._append_events(chan, t_from, dt, num)
+
+	def _event_format(self, chan):
+		""" (format mask, maw_ena, raw_window, maw_window) from the registers. """
+		grp_no, cid = divmod(chan, const.CHAN_PER_GRP)
+		dataformat = self._group_reg(grp_no, DATAFORMAT_CONFIG_REG) >> 8 * cid
+		raw_window = self._group_reg(grp_no, RAW_DATA_BUFFER_CONFIG_REG) >> 16 & 0xFFFE
+		maw_window = self._group_reg(grp_no, MAW_TEST_BUFFER_CONFIG_REG) & 0x3FE
+		return dataformat & 0xF, bool(dataformat & 0x10), raw_window, maw_window
+
+	def _template(self, chan, fmt):
+		""" TEMPLATES events (words, with empty timestamps) for a channel and a format. """
+		key = (chan, fmt)
+		if key not in self._templates:
+			mask, maw_ena, raw_window, maw_window = fmt
+			rnd = random.Random(self._seed)
+			evlen = event_words(mask, raw_window, maw_window, maw_ena)
+			head = evlen - raw_window // 2 - (maw_window if maw_ena else 0) - 1 # words before 0xE
+			start = raw_window // 4
+			words = array('I')
+			for n in range(0, TEMPLATES):
+				amp = self.amplitude * rnd.uniform(0.5, 1.0)
+				samples = [int(self.pedestal + rnd.gauss(0, self.noise)
+						+ (amp * math.exp(-(i - start) / 16.0) if i >= start else 0)) & 0xFFFF
+						for i in range(0, raw_window)]
+				words.extend([0] * head)
+				words.append(0xE << 28 | maw_ena << 27 | raw_window // 2)
+				words.extend([lo | hi << 16 for lo, hi in zip(samples[::2], samples[1::2])])
+				words.extend([0] * (maw_window if maw_ena else 0))
+			self._templates[key] = words
+		return self._templates[key]
+
+	def _append_events(self, chan, t_from, dt, count):
+		""" `count' events evenly in (t_from, t_from + dt] (seconds) into the channel's current bank.
+		Events which don't fit the bank are only counted.
+		"""
+		self.events[chan] = (self.events[chan] + count) & 0xFFFFFFFF
+		fmt = self._event_format(chan)
+		evlen = event_words(fmt[0], fmt[2], fmt[3], fmt[1])
+		num = min(count, (const.CHAN_BANK_WORDS - self.fill[chan]) // evlen)
+		if num <= 0:
+			return # the bank is full
+
+		tmpl = self._template(chan, fmt)
+		words = tmpl * (num // TEMPLATES + 1)
+		del words[num * evlen:]
+		ts = [int((t_from + dt * (i + 1) / count - self._t0) * self.clock) & TS_MASK for i in range(0, num)]
+		words[0::evlen] = array('I', [t >> 32 << 16 | chan << 4 | fmt[0] for t in ts])
+		words[1::evlen] = array('I', [t & 0xFFFFFFFF for t in ts])
+		if sys.byteorder == 'big':
+			words.byteswap()
+
+		grp_no, cid = divmod(chan, const.CHAN_PER_GRP)
+		self._mem_write(grp_no, cid // 2, self.bank << 24 | (cid & 0b1) << 25 | self.fill[chan], words.tobytes())
+		self.fill[chan] += num * evlen
+
+	def _mem_write(self, grp_no, mem_no, woffset, data):
+		region, woff = woffset >> 24 & 0b11, woffset & 0xFFFFFF
+		buf = self.mem.setdefault((grp_no, mem_no, region), bytearray())
+		pos = 4 * woff
+		end = min(pos + len(data), 4 * const.CHAN_BANK_WORDS)
+		if len(buf) < pos:
+			buf.extend(bytes(pos - len(buf)))
+		buf[pos:end] = data[:end - pos]
+
+	def _mem_read(self, grp_no, mem_no, woffset, wnum):
+		region, woff = woffset >> 24 & 0b11, woffset & 0xFFFFFF
+		buf = self.mem.get((grp_no, mem_no, region), b'')
+		data = bytes(buf[4 * woff : 4 * (woff + wnum)])
+		return data + bytes(4 * wnum - len(data)) # never written: zeros
+
+	def _fifo_group(self, addr):
+		grp_no, rest = divmod(addr - SIS3316_FPGA_ADC_GRP_MEM_BASE, SIS3316_FPGA_ADC_GRP_MEM_OFFSET)
+		if rest or not 0 <= grp_no < const.CHAN_GRP_COUNT:
+			return None
+		return grp_no
+
+	def _fifo_read(self, hdr, addr, wnum):
+		grp_no = self._fifo_group(addr)
+		if grp_no is None or wnum > FIFO_READ_LIMIT:
+			return [self._status(hdr, STAT_PROTOCOL_ERROR)]
+		if not self.grant:
+			return [self._status(hdr, STAT_NO_GRANT)]
+		xfer = self._xfer[grp_no]
+		if xfer is None or xfer[0] != 0b10: # not set up for reading
+			return [self._status(hdr, STAT_FIFO_TIMEOUT)]
+
+		data = self._mem_read(grp_no, xfer[1], xfer[2], wnum)
+		xfer[2] += wnum
+		jumbo = self.regs.get(SIS3316_UDP_PROTOCOL_CONFIG, 0) & 1 << 4
+		mtu = 8192 if jumbo else 1440
+		return [self._status(hdr, n & 0xF) + data[pos:pos + mtu]
+				for n, pos in enumerate(range(0, len(data), mtu))]
+
+	def _fifo_write(self, hdr, addr, wnum, data):
+		grp_no = self._fifo_group(addr)
+		if grp_no is None or wnum > FIFO_WRITE_LIMIT or len(data) != 4 * wnum:
+			return self._status(hdr, STAT_PROTOCOL_ERROR)
+		if not self.grant:
+			return self._status(hdr, STAT_NO_GRANT)
+		xfer = self._xfer[grp_no]
+		if xfer is None or xfer[0] != 0b11: # not set up for writing
+			return self._status(hdr, STAT_PROTOCOL_ERROR)
+
+		self._mem_write(grp_no, xfer[1], xfer[2], data)
+		xfer[2] += wnum
+		return self._status(hdr, 0)
+
+
+# You can run this file as a script: python -m sis3316.emulator
+def main():
+	parser = argparse.ArgumentParser(description = "Emulate a SIS3316 on a local UDP port.")
+	parser.add_argument('port', type = int, nargs = '?', default = 1234, help = 'UDP port number')
+	parser.add_argument('--host', default = '127.0.0.1', help = 'address to listen on')
+	parser.add_argument('--rate', type = float, default = 0, help = 'events/s per channel while armed')
+	parser.add_argument('--loss', type = float, default = 0, help = 'packet loss probability')
+	parser.add_argument('--reorder', type = float, default = 0, help = 'packet reordering probability')
+	parser.add_argument('--duplicate', type = float, default = 0, help = 'packet duplication probability')
+	parser.add_argument('--latency', type = float, default = 0, help = 'seconds before each response')
+	parser.add_argument('--gap', type = float, default = 0, help = 'seconds between response packets')
+	parser.add_argument('--seed', type = int, help = 'random seed')
+	args = parser.parse_args()
+
+	emu = Emulator(args.host, args.port, rate = args.rate, seed = args.seed, loss = args.loss,
+			reorder = args.reorder, duplicate = args.duplicate, latency = args.latency,
+			gap = args.gap)
+	print("SIS3316 emulator on %s:%d" % emu.address)
+	try:
+		emu.serve()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		print(emu.stats)
+		emu.close()
+
+if __name__ == "__main__":
+	import argparse
+	main()
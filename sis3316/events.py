@@ -0,0 +1,88 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Event boundaries in raw channel data (see tools/parse.py for a full parser).
+
+from struct import unpack_from, error as struct_error
+
+FORMAT_BLOCKS = ((0b1, 7), (0b10, 2), (0b100, 3), (0b1000, 2)) # (format bit, words)
+
+
+def header_words(format_mask):
+	""" Number of words before the 0xE (raw data) header. """
+	nwords = 2
+	for bit, words in FORMAT_BLOCKS:
+		if format_mask & bit:
+			nwords += words
+	return nwords
+
+
+def event_info(data, pos, maw_words = 0):
+	""" Decode an event which starts at byte `pos' of `data'.
+	maw_words: MAW test buffer length, the data has no MAW length field.
+	Returns (length in bytes, raw samples offset in bytes, number of raw samples).
+	Raises ValueError if the data doesn't look like an event, EOFError if it's truncated.
+	"""
+	try:
+		fmt = unpack_from('<I', data, pos)[0] & 0xF
+		rpos = pos + 4 * header_words(fmt)
+		hdr_raw = unpack_from('<I', data, rpos)[0]
+	except struct_error:
+		raise EOFError
+
+	flag, maw_ena, nraw = hdr_raw >> 28, hdr_raw & (1<<27), 2 * (hdr_raw & 0x1FFffFF)
+	rpos += 4
+	navg = 0
+
+	if flag == 0xA: # average data header
+		try:
+			hdr_avg = unpack_from('<I', data, rpos)[0]
+		except struct_error:
+			raise EOFError
+		if hdr_avg >> 28 != 0xE:
+			raise ValueError('no 0xE after 0xA')
+		navg = 2 * (hdr_avg & 0xFFFF)
+		rpos += 4
+
+	elif flag != 0xE:
+		raise ValueError('no 0xE')
+
+	length = rpos - pos + 2 * (nraw + navg)
+	if maw_ena:
+		length += 4 * maw_words
+
+	if pos + length > len(data):
+		raise EOFError
+
+	return length, rpos, nraw
+
+
+def iter_events(data, maw_words = 0):
+	""" Yield (offset, length, raw offset, number of raw samples) for each whole event in `data'.
+	Stops on the first truncated event; raises ValueError on garbage.
+	"""
+	pos = 0
+	while pos < len(data):
+		try:
+			length, rpos, nraw = event_info(data, pos, maw_words)
+		except EOFError:
+			return
+		yield pos, length, rpos, nraw
+		pos += length
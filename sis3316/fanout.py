@@ -0,0 +1,196 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Publish readout chunks to local subscribers over TCP or a Unix socket.
+#
+# A subscriber gets a stream of chunks, each is a container chunk header
+# (see container.py) followed by data.
+
+import os
+import socket
+from threading import Thread, Condition
+from collections import deque
+
+from .container import chunk_header, parse_chunk_header, CHUNK_HEADER
+
+
+def _parse_address(address):
+	""" 'host:port' or a port number for TCP, a path for a Unix socket. """
+	if isinstance(address, int) or ':' not in address and address.isdigit():
+		return socket.AF_INET, ('127.0.0.1', int(address))
+	if ':' in address and '/' not in address:
+		host, port = address.rsplit(':', 1)
+		return socket.AF_INET, (host or '127.0.0.1', int(port))
+	return socket.AF_UNIX, address
+
+
+class Subscriber(object):
+	""" A connected client with a bounded queue. The oldest chunks are dropped when it's full. """
+	def __init__(self, server, sock, name, queue_len):
+		self.server = server
+		self.sock = sock
+		self.name = name
+		self.queue = deque(maxlen = queue_len)
+		self.cond = Condition()
+		self.sent = 0
+		self.dropped = 0
+		self.closed = False
+		self.thread = Thread(target = self._send_loop, name = 'sis3316-fanout-%s' % name)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def put(self, frame):
+		with self.cond:
+			if len(self.queue) == self.queue.maxlen:
+				self.dropped += 1 # deque drops the oldest
+			self.queue.append(frame)
+			self.cond.notify()
+
+	def _send_loop(self):
+		try:
+			while True:
+				with self.cond:
+					while not self.queue and not self.closed:
+						self.cond.wait()
+					if self.closed:
+						return
+					hdr, data = self.queue.popleft()
+				self.sock.sendall(hdr)
+				self.sock.sendall(data)
+				self.sent += 1
+		except (socket.error, IOError):
+			pass
+		finally:
+			self.close()
+
+	def close(self):
+		with self.cond:
+			self.closed = True
+			self.cond.notify()
+		try:
+			self.sock.close()
+		except socket.error:
+			pass
+		self.server._remove(self)
+
+
+class FanoutServer(object):
+	""" Publish chunks to any number of subscribers.
+
+	write_chunk() never blocks on a slow subscriber: each one has a queue of
+	`queue_len' chunks, the oldest are dropped on overflow (see stats()).
+	address: 'host:port' or a port (TCP, localhost by default) or a path (Unix socket).
+	Has the same write_chunk()/next_spill() interface as ContainerWriter.
+	"""
+	def __init__(self, address, queue_len = 64):
+		self.family, self.address = _parse_address(address)
+		self.queue_len = queue_len
+		self.spill = 0
+		self.subscribers = []
+		self.total_dropped = 0
+		self._nclients = 0
+
+		if self.family == socket.AF_UNIX and os.path.exists(self.address):
+			os.unlink(self.address)
+		self._sock = socket.socket(self.family, socket.SOCK_STREAM)
+		if self.family == socket.AF_INET:
+			self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self._sock.bind(self.address)
+		self._sock.listen(8)
+		self._closed = False
+
+		self._thread = Thread(target = self._accept_loop, name = 'sis3316-fanout')
+		self._thread.daemon = True
+		self._thread.start()
+
+	def _accept_loop(self):
+		while not self._closed:
+			try:
+				conn, addr = self._sock.accept()
+			except socket.error:
+				return
+			self._nclients += 1
+			self.subscribers.append(Subscriber(self, conn, str(addr or self._nclients), self.queue_len))
+
+	def _remove(self, sub):
+		if sub in self.subscribers:
+			self.subscribers.remove(sub)
+			self.total_dropped += sub.dropped
+
+	def next_spill(self):
+		self.spill += 1
+		return self.spill
+
+	def write_chunk(self, chan, data, sync = True, bank = 0, ts = None):
+		""" Queue a chunk for all subscribers. `data' is copied only if it's not bytes. """
+		if not self.subscribers:
+			return
+		if not isinstance(data, bytes):
+			data = bytes(data)
+		frame = (chunk_header(chan, self.spill, len(data), sync, bank, ts), data)
+		for sub in list(self.subscribers):
+			sub.put(frame)
+
+	def stats(self):
+		subs = list(self.subscribers)
+		return {'subscribers': len(subs),
+			'queued': sum(len(s.queue) for s in subs),
+			'dropped': self.total_dropped + sum(s.dropped for s in subs)}
+
+	def close(self):
+		self._closed = True
+		try:
+			self._sock.close()
+		except socket.error:
+			pass
+		for sub in list(self.subscribers):
+			sub.close()
+		if self.family == socket.AF_UNIX and os.path.exists(self.address):
+			os.unlink(self.address)
+
+
+def _recv_exactly(sock, size):
+	buf = bytearray(size)
+	view = memoryview(buf)
+	pos = 0
+	while pos < size:
+		n = sock.recv_into(view[pos:])
+		if not n:
+			raise EOFError
+		pos += n
+	return buf
+
+
+def subscribe(address, timeout = None):
+	""" Connect to a FanoutServer. Yields (entry, data) for each chunk, see container.Entry. """
+	family, addr = _parse_address(address)
+	sock = socket.socket(family, socket.SOCK_STREAM)
+	sock.settimeout(timeout)
+	sock.connect(addr)
+	try:
+		while True:
+			try:
+				entry = parse_chunk_header(bytes(_recv_exactly(sock, CHUNK_HEADER.size)))
+				data = _recv_exactly(sock, entry.size)
+			except EOFError:
+				return
+			yield entry, data
+	finally:
+		sock.close()
@@ -52,45 +52,67 @@ class Sis3316(object):
 		if self.read(reg_addr) & BITBUSY:
 			raise self._TransferLogicBusyExcept(group = grp_no)
 		
-		# Fire "Start Read Transfer" command (FIFO programming)
+		self.write(reg_addr, self._fifo_read_cmd(mem_no, woffset)) #Prepare Data transfer logic
+	
+	@staticmethod
+	def _fifo_read_cmd(mem_no, woffset):
+		""" "Start Read Transfer" command (FIFO programming). """
 		cmd = 0b10 << 30 # Read cmd
 		cmd += woffset # Start address
 		
 		if mem_no == 1:
 			cmd += 1  << 28 #Space select bit
+		return cmd
+	
+	def _fifo_transfer_read_groups(self, setup):
+		""" Set up fifo logic of several groups at once (3 requests in total).
+		Args:
+			setup: a dict {grp_no: (mem_no, woffset)}.
+		Raises:
+			_TransferLogicBusyExcept
+		"""
+		regs = [SIS3316_DATA_TRANSFER_GRP_CTRL_REG + 0x4 * g for g in setup]
+		self.write_list(regs, [0] * len(regs)) # reset
 		
-		self.write(reg_addr, cmd) #Prepare Data transfer logic
+		for grp_no, data in zip(setup, self.read_list(regs)):
+			if data & BITBUSY:
+				raise self._TransferLogicBusyExcept(group = grp_no)
 		
+		self.write_list(regs, [self._fifo_read_cmd(*setup[g]) for g in setup])
 		
-	def _fifo_transfer_write(self, grp_no, mem_no, datalist, offset=0): #FIXME!
-		""" Write into DDR memory.
-			Hardware can write only in 64-words chunks.
+		
+	def _fifo_transfer_write(self, grp_no, mem_no, woffset):
+		"""
+		Set up fifo logic for write cmd.
+		Args:
+			grp_no: ADC index: {0,1,2,3}.
+			mem_no: Memory chip index: {0,1}.
+			woffset: Offset (in words).
+		Raises:
+			_TransferLogicBusyExcept
 		"""
 		if grp_no & ~0b11:
 			raise ValueError("grp_no should be 0...3")
 		
 		if mem_no!=0 and mem_no!=1:
 			raise ValueError("mem_no is 0 or 1")
-			
-		dlen = len(datalist)
-		if dlen % 64:
-			raise ValueError("can write ony in 256-byte chunks (hardware limitation)")
-
+		
 		reg_addr = SIS3316_DATA_TRANSFER_GRP_CTRL_REG + 0x4 * grp_no
 		
 		if self.read(reg_addr) & BITBUSY:
-			raise self._TransferLogicBusyExcept(grp_no)
+			raise self._TransferLogicBusyExcept(group = grp_no)
 		
-		# Fire "Start Read Transfer" command (FIFO programming)
+		self.write(reg_addr, self._fifo_write_cmd(mem_no, woffset)) #Prepare Data transfer logic
+	
+	@staticmethod
+	def _fifo_write_cmd(mem_no, woffset):
+		""" "Start Write Transfer" command (FIFO programming). """
 		cmd = 0b11 << 30 # Write cmd
-		cmd += offset # Start address
+		cmd += woffset # Start address
 		
 		if mem_no == 1:
 			cmd += 1  << 28 #Space select bit
-		
-		self.write(reg_addr, cmd) #Prepare Data transfer logic
-		#~ self._write_fifo(fifo_addr, datalist)
-		#~ self._fifo_transfer_reset(grp_no) #cleanup
+		return cmd
 	
 	def _fifo_transfer_reset(self, grp_no):
 		""" Reset memory transfer logic. """
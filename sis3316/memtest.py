@@ -0,0 +1,97 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# DDR memory loopback test: write patterns with write_fifo, read them back with read_fifo.
+
+import os
+import time
+from array import array
+
+from .common import *
+from .readout import destination
+
+PATTERNS = ('counter', 'random', 'walking', 'ones', 'zeros')
+
+
+def pattern(name, nwords, seed = 0):
+	""" Test data of `nwords' 32-bit words as bytes. """
+	if name == 'counter':
+		return array('I', range(seed, seed + nwords)).tobytes() if seed + nwords <= 1 << 32 \
+			else array('I', [(seed + i) & 0xFFFFFFFF for i in range(0, nwords)]).tobytes()
+	if name == 'random':
+		return os.urandom(4 * nwords)
+	if name == 'walking':
+		return array('I', [1 << ((seed + i) % 32) for i in range(0, nwords)]).tobytes()
+	if name == 'ones':
+		return b'\xff' * (4 * nwords)
+	if name == 'zeros':
+		return bytes(4 * nwords)
+	raise ValueError("Unknown pattern '{0}', use one of: {1}.".format(name, ', '.join(PATTERNS)))
+
+
+def compare(expected, got):
+	""" Returns (number of mismatched words, index of the first one or None). """
+	if expected == got:
+		return 0, None
+	exp, act = array('I', expected), array('I', got[:len(expected)])
+	bad = [i for i in range(0, len(act)) if exp[i] != act[i]]
+	bad_count = len(bad) + len(exp) - len(act) # missing words are errors too
+	first = bad[0] if bad else len(act)
+	return bad_count, first
+
+
+def loopback(dev, groups = None, sizes = (64 * 1024, 1024 * 1024), patterns = ('counter',),
+		mem_no = 0, woffset = 0, repeat = 1):
+	""" Write each pattern of each size (bytes, multiples of 256) to the memory of each group,
+	read it back and compare. Overwrites the memory: disarm the sample logic first.
+	Returns a list of dicts, one per (group, size, pattern, repetition):
+		'grp', 'size', 'pattern', 'write_mbps', 'read_mbps', 'errors' (mismatched words),
+		'first_error' (word index or None), 'exception' (str, if a transfer failed).
+	"""
+	if groups is None:
+		groups = range(0, const.CHAN_GRP_COUNT)
+	results = []
+	for size in sizes:
+		if size % 256:
+			raise ValueError("size should be a multiple of 256 bytes, '{0}' given.".format(size))
+		nwords = size // 4
+		for name in patterns:
+			for rep in range(0, repeat):
+				for grp in groups:
+					data = pattern(name, nwords, seed = grp << 24 | rep)
+					res = {'grp': grp, 'size': size, 'pattern': name,
+						'write_mbps': None, 'read_mbps': None,
+						'errors': None, 'first_error': None, 'exception': None}
+					results.append(res)
+					buf = bytearray(size)
+					try:
+						t0 = time.time()
+						dev.write_fifo(data, grp, mem_no, nwords, woffset)
+						t1 = time.time()
+						dev.read_fifo(destination(buf), grp, mem_no, nwords, woffset)
+						t2 = time.time()
+					except Sis3316Except as e:
+						res['exception'] = '%s: %s' % (type(e).__name__, e)
+						continue
+
+					res['write_mbps'] = size / 1024.0**2 / (t1 - t0) if t1 > t0 else None
+					res['read_mbps'] = size / 1024.0**2 / (t2 - t1) if t2 > t1 else None
+					res['errors'], res['first_error'] = compare(data, bytes(buf))
+	return results
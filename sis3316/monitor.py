@@ -0,0 +1,166 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Background health monitor
+
+from threading import Thread, Event, Lock
+from collections import namedtuple, deque
+import time
+
+from .common import *
+from .registers import *
+from .adc_unit import Adc_group
+from .adc_unit.registers import SIS3316_ADC_GRP, STATUS_REG, INPUT_TAP_DELAY_REG
+
+Sample = namedtuple('sample', 'ts, ok, temp, grp_status, link_status, readout')
+
+
+class Monitor(Thread):
+	""" Sample device health at a low rate in a background thread.
+
+	Each sample is a single write_list (clear error latches) and a single
+	read_list (temperature, group status, acquisition status, FPGA link status).
+	The samples are kept in a ring buffer, so callers get cached values
+	without extra round trips to the device.
+	"""
+
+	def __init__(self, dev, interval = 5.0, depth = 720):
+		"""
+		dev: a Sis3316 object.
+		interval: seconds between samples.
+		depth: ring buffer size (samples).
+		"""
+		Thread.__init__(self)
+		self.daemon = True
+		self.dev = dev
+		self.interval = interval
+		self.history = deque(maxlen = depth)
+		self.errors = 0 # failed samples
+		self._lock = Lock()
+		self._stop_flag = Event()
+
+		grp_count = const.CHAN_GRP_COUNT
+		self._clear_addrs = [SIS3316_ADC_GRP(INPUT_TAP_DELAY_REG, i) for i in range(0, grp_count)] \
+				+ [SIS3316_VME_FPGA_LINK_ADC_PROT_STATUS]
+		self._clear_data = [0x400] * grp_count + [0xE0E0E0E0]
+		self._read_addrs = [SIS3316_INTERNAL_TEMPERATURE_REG] \
+				+ [SIS3316_ADC_GRP(STATUS_REG, i) for i in range(0, grp_count)] \
+				+ [SIS3316_ACQUISITION_CONTROL_STATUS, SIS3316_VME_FPGA_LINK_ADC_PROT_STATUS]
+
+		self._id = None
+		self._serno = None
+
+	def run(self):
+		while not self._stop_flag.is_set():
+			try:
+				self.sample()
+			except Exception:
+				self.errors += 1
+			self._stop_flag.wait(self.interval)
+
+	def stop(self):
+		""" Stop sampling (the thread exits after the current sample). """
+		self._stop_flag.set()
+
+	def sample(self):
+		""" Take a sample now. Returns Sample. """
+		dev = self.dev
+		grp_count = const.CHAN_GRP_COUNT
+
+		with dev._lock: # keep the clear/read pair together
+			dev.write_list(self._clear_addrs, self._clear_data)
+			data = dev.read_list(self._read_addrs)
+
+		temp = dev._temp_decode(data[0])
+		grp_raw = data[1 : 1 + grp_count]
+		readout = dev._readout_status_decode(data[1 + grp_count])
+		link = data[2 + grp_count]
+
+		grp_ok = Adc_group._status_ok
+		grp_status = [True if s in grp_ok else s for s in grp_raw]
+		ok = all(s is True for s in grp_status) and link == dev._link_status_ok
+
+		smp = Sample(time.time(), ok, temp, grp_status, link, readout)
+		with self._lock:
+			self.history.append(smp)
+		return smp
+
+	@property
+	def last(self):
+		""" The latest sample or None. """
+		with self._lock:
+			if not self.history:
+				return None
+			return self.history[-1]
+
+	@property
+	def status(self):
+		""" Cached device status (see Sis3316.status). None if no samples yet. """
+		smp = self.last
+		return smp.ok if smp else None
+
+	@property
+	def temp(self):
+		""" Cached temperature C. """
+		smp = self.last
+		return smp.temp if smp else None
+
+	@property
+	def id(self):
+		""" Module ID (read once). """
+		if self._id is None:
+			self._id = self.dev.id
+		return self._id
+
+	@property
+	def serno(self):
+		""" Serial No. (read once). """
+		if self._serno is None:
+			self._serno = self.dev.serno
+		return self._serno
+
+	def trend(self, field = 'temp', window = None):
+		""" Statistics of a numeric sample field over the last `window' seconds.
+		Returns a dict: count, min, max, mean, slope (units per second).
+		For 'ok' the mean is a fraction of good samples.
+		"""
+		with self._lock:
+			samples = list(self.history)
+
+		if window is not None and samples:
+			tmin = samples[-1].ts - window
+			samples = [s for s in samples if s.ts >= tmin]
+
+		if not samples:
+			return None
+
+		ts = [s.ts for s in samples]
+		vals = [float(getattr(s, field)) for s in samples]
+		n = len(vals)
+		mean = sum(vals) / n
+
+		slope = 0.0
+		if n > 1:
+			tmean = sum(ts) / n
+			var = sum((t - tmean)**2 for t in ts)
+			if var:
+				slope = sum((t - tmean) * (v - mean) for t,v in zip(ts, vals)) / var
+
+		return {'count': n, 'min': min(vals), 'max': max(vals), 'mean': mean, 'slope': slope}
@@ -0,0 +1,165 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Bank overflow detection and lost time accounting.
+
+import json
+import time
+from struct import unpack
+
+from .common import *
+from .readout import destination
+from .adc_unit.registers import SIS3316_ADC_GRP, ADDRESS_THRESHOLD_REG
+
+TS_MOD = 1 << 48 # event timestamps are 48 bit
+
+
+class OverflowMonitor(object):
+	""" Find channels whose bank got full during a spill and account the time they lost.
+
+	A bank is full when addr_prev leaves no room for one more event. Such a
+	channel was dead from its last event in the bank until the first event of
+	its next bank: that is the lost interval (in the sample clock, from event
+	headers, a couple of short FIFO reads per full channel). An interval is
+	closed when the channel has data again, so it's known a spill later;
+	records of closed intervals are appended to `path' as JSON lines:
+		spill, chan, bank, ts (swap time), first_ts, last_ts (events in the full bank),
+		lost_from, lost_to (timestamps), lost (s), threshold_overrun.
+	lost is None if the last event can't be found (the bank is not a whole
+	number of events).
+	Live time fraction of a channel: 1 - lost / time since the first swap.
+	clock: sample clock in MHz (Sis3316.freq by default),
+	event_length: {chan: words} to not to read the config.
+	"""
+	def __init__(self, dev, path = None, clock = None, event_length = None, channels = None):
+		self.dev = dev
+		self.path = path
+		self._f = open(path, 'a') if path else None
+		self.channels = list(channels) if channels is not None else list(range(const.CHAN_TOTAL))
+		self.clock = 1e6 * (clock or dev.freq or 250)
+		self.event_length = dict(event_length or {})
+
+		regs = [SIS3316_ADC_GRP(ADDRESS_THRESHOLD_REG, g) for g in range(0, const.CHAN_GRP_COUNT)]
+		self.thresholds = [val & 0xffFFFF for val in dev.read_list(regs)] # words
+
+		self.spill = 0
+		self.pending = {} # {chan: record}, intervals which are not closed yet
+		self.lost = dict.fromkeys(self.channels, 0.0) # seconds
+		self.overflows = dict.fromkeys(self.channels, 0)
+		self.elapsed = 0.0
+		self._prev_swap = None
+
+	def _evlen(self, chan):
+		if chan not in self.event_length:
+			self.event_length[chan] = self.dev.channels[chan].event_length
+		return self.event_length[chan]
+
+	def _event_ts(self, chan, bank, woffset):
+		""" Timestamp of the event at `woffset' in channel's bank. """
+		buf = bytearray(8)
+		self.dev.channels[chan].bank_read(bank, destination(buf), 2, woffset)
+		w0, w1 = unpack('<II', bytes(buf))
+		return (w0 >> 16) << 32 | w1
+
+	def live(self):
+		""" Live time fraction per channel. """
+		if not self.elapsed:
+			return dict.fromkeys(self.channels, 1.0)
+		return dict((ch, max(0.0, 1.0 - self.lost[ch] / self.elapsed)) for ch in self.channels)
+
+	def check(self, t_swap = None):
+		""" Call after a spill is read (before the next swap), t_swap: time of its swap.
+		Returns a dict:
+			'spill', 'bank',
+			'full': channels which got full,
+			'threshold_overrun': the board reported it at the swap (only if addr_threshold is set),
+			'over_threshold': channels which used more than the threshold,
+			'closed': lost interval records closed by this spill,
+			'live': {chan: live time fraction}.
+		"""
+		dev = self.dev
+		if t_swap is None:
+			t_swap = time.time()
+		if self._prev_swap is not None:
+			self.elapsed += t_swap - self._prev_swap
+		self._prev_swap = t_swap
+		self.spill += 1
+
+		snap = dev.acq_snapshot()
+		bank = snap['prev_bank']
+		if bank is None:
+			raise dev._NotArmedExcept
+
+		status = getattr(dev, 'swap_status', None) # latched by mem_toggle()
+		overrun = bool(status and status['threshold_overrun'] and all(self.thresholds))
+
+		full, over, closed = [], [], []
+		for chan in self.channels:
+			words = snap['prev'][chan]
+			if not words:
+				continue
+
+			rec = self.pending.pop(chan, None)
+			if rec:
+				first = self._event_ts(chan, bank, 0)
+				rec['lost_to'] = first
+				if rec['lost_from'] is not None:
+					rec['lost'] = ((first - rec['lost_from']) % TS_MOD) / self.clock
+					self.lost[chan] += rec['lost']
+				closed.append(rec)
+
+			thr = self.thresholds[chan // const.CHAN_PER_GRP]
+			if thr and words >= thr:
+				over.append(chan)
+
+			evlen = self._evlen(chan)
+			if not bank_full(words, evlen):
+				continue
+
+			full.append(chan)
+			self.overflows[chan] += 1
+			last = None
+			if words % evlen == 0:
+				last = self._event_ts(chan, bank, words - evlen)
+			self.pending[chan] = {'spill': self.spill, 'chan': chan, 'bank': bank, 'ts': t_swap,
+				'first_ts': self._event_ts(chan, bank, 0), 'last_ts': last,
+				'lost_from': last, 'lost_to': None, 'lost': None,
+				'threshold_overrun': overrun}
+
+		for rec in closed:
+			self._write(rec)
+
+		return {'spill': self.spill, 'bank': bank, 'full': full,
+			'threshold_overrun': overrun, 'over_threshold': over,
+			'closed': closed, 'live': self.live()}
+
+	def _write(self, rec):
+		if self._f:
+			self._f.write(json.dumps(rec, sort_keys = True) + '\n')
+			self._f.flush()
+
+	def close(self):
+		""" Write the intervals which are still open (lost_to is None). """
+		for chan, rec in sorted(self.pending.items()):
+			self._write(rec)
+		self.pending = {}
+		if self._f:
+			self._f.close()
+			self._f = None
@@ -0,0 +1,223 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Readout to disk through a pool of buffers and a writer thread.
+
+from threading import Thread, Event
+import time
+
+try:
+	from queue import Queue, Empty
+except ImportError: # Python 2
+	from Queue import Queue, Empty
+
+from .readout import write_all
+
+
+class BufferPool(object):
+	""" A fixed set of preallocated buffers. get() blocks when all of them are in use. """
+	def __init__(self, count, size):
+		self.count = count
+		self.size = size
+		self._free = Queue()
+		for i in range(0, count):
+			self._free.put(bytearray(size))
+		self.stall_time = 0.0 # time spent waiting for a free buffer
+		self.stalls = 0
+
+	def get(self, timeout = None):
+		try:
+			return self._free.get_nowait()
+		except Empty:
+			pass
+
+		t0 = time.time()
+		self.stalls += 1
+		try:
+			return self._free.get(timeout = timeout)
+		finally:
+			self.stall_time += time.time() - t0
+
+	def put(self, buf):
+		self._free.put(buf)
+
+	@property
+	def free(self):
+		return self._free.qsize()
+
+
+class PooledDestination(object):
+	""" Readout destination (push/index protocol) which fills buffers from a pool
+	and passes the full ones to the writer.
+	"""
+	def __init__(self, pipeline, key):
+		self.pipeline = pipeline
+		self.key = key
+		self.index = 0
+		self._buf = None
+		self._pos = 0
+
+	def push(self, source):
+		count = len(source)
+		done = 0
+		while done < count:
+			if self._buf is None:
+				self._buf = self.pipeline._get_buffer()
+				self._pos = 0
+
+			n = min(count - done, len(self._buf) - self._pos)
+			self._buf[self._pos : self._pos + n] = source[done : done + n]
+			self._pos += n
+			done += n
+
+			if self._pos == len(self._buf):
+				self.flush()
+		self.index += count
+
+	def flush(self):
+		""" Pass the current (partially filled) buffer to the writer. """
+		if self._buf is not None:
+			self.pipeline._submit(self.key, self._buf, self._pos)
+			self._buf = None
+
+
+class Pipeline(object):
+	""" Decouple network receive from disk writes.
+
+	The readout thread pushes data into buffers taken from a bounded pool,
+	a writer thread writes full buffers to files and returns them to the pool.
+	If the disk is slower than the network the pool runs out and the readout
+	thread waits for a free buffer (the stall is counted in stats()).
+	Writer errors are raised in the readout thread.
+
+	files: a dict {key: file}, key is usually a channel number;
+	more can be added and removed on the fly (add_file, remove_file).
+	"""
+	def __init__(self, files, nbuffers = 64, bufsize = 1024 * 1024):
+		self.files = files
+		self.pool = BufferPool(nbuffers, bufsize)
+		self._queue = Queue()
+		self._dests = {}
+		self._error = None
+		self.bytes_written = 0
+		self.write_time = 0.0
+		self.queue_max = 0
+
+		self._writer = Thread(target = self._write_loop, name = 'sis3316-writer')
+		self._writer.daemon = True
+		self._writer.start()
+
+	def destination(self, key):
+		""" A destination for readout of `key' data (one per key). """
+		if key not in self._dests:
+			self._dests[key] = PooledDestination(self, key)
+		return self._dests[key]
+
+	def add_file(self, key, fileobj):
+		""" Add an output file. Returns its destination. """
+		self.files[key] = fileobj
+		return self.destination(key)
+
+	def remove_file(self, key, then = None):
+		""" Flush the destination of `key'. Once its data is written the writer
+		thread forgets the file and calls then(fileobj).
+		"""
+		dest = self._dests.pop(key, None)
+		if dest is not None:
+			dest.flush()
+		self._call(self._removed, key, then)
+
+	def _removed(self, key, then):
+		fileobj = self.files.pop(key)
+		if then is not None:
+			then(fileobj)
+
+	def _check(self):
+		if self._error is not None:
+			raise self._error
+
+	def _get_buffer(self):
+		self._check()
+		while True:
+			try:
+				return self.pool.get(timeout = 0.5)
+			except Empty:
+				self._check()
+
+	def _submit(self, key, buf, length):
+		self._check()
+		self._queue.put((key, buf, length))
+		self.queue_max = max(self.queue_max, self._queue.qsize())
+
+	def _call(self, func, *args):
+		""" Run func(*args) in the writer thread after the data queued so far. """
+		self._submit(None, func, args)
+
+	def _write_loop(self):
+		while True:
+			item = self._queue.get()
+			if item is None:
+				return
+			key, buf, length = item
+			if key is None: # _call()
+				func, args = buf, length
+				try:
+					if self._error is None:
+						func(*args)
+				except Exception as e:
+					self._error = e
+				continue
+			try:
+				if self._error is None:
+					t0 = time.time()
+					write_all(self.files[key], memoryview(buf)[:length])
+					self.write_time += time.time() - t0
+					self.bytes_written += length
+			except Exception as e:
+				self._error = e
+			finally:
+				self.pool.put(buf)
+
+	def flush(self):
+		""" Pass all partially filled buffers to the writer (call after a spill). """
+		for dest in self._dests.values():
+			dest.flush()
+
+	def sync(self):
+		""" Flush, wait until everything queued so far is written. """
+		self.flush()
+		done = Event()
+		self._call(done.set)
+		while not done.wait(0.5):
+			self._check()
+		self._check()
+
+	def stats(self):
+		return {'queue': self._queue.qsize(), 'queue_max': self.queue_max,
+			'free': self.pool.free, 'buffers': self.pool.count,
+			'stalls': self.pool.stalls, 'stall_time': self.pool.stall_time,
+			'write_time': self.write_time, 'bytes': self.bytes_written}
+
+	def close(self):
+		""" Flush, wait for the writer to finish. Doesn't close the files. """
+		self.flush()
+		self._queue.put(None)
+		self._writer.join()
+		self._check()
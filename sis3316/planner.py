@@ -0,0 +1,138 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Acquisition budget: data rates, bank fill times and readout headroom.
+
+from .common import *
+from .adc_unit.channel import event_words
+
+UDP_OVERHEAD = 14 + 20 + 8 + 3	# ethernet + IP + UDP headers + sis3316 packet header [bytes]
+PAYLOAD_JUMBO = 8192	# see read_fifo()
+PAYLOAD_STD = 1440
+
+
+def channel_formats(conf):
+	""" Get event format parameters for every channel from a configuration dict
+	(as made by tools/conf.py) or from a device object.
+	Returns a list of dicts: format_mask, raw_window, maw_window, maw_ena, addr_threshold.
+	"""
+	ret = []
+
+	if isinstance(conf, dict):
+		groups = conf.get('groups', {})
+		channels = conf.get('channels', {})
+
+		for idx in range(0, const.CHAN_TOTAL):
+			grp = groups.get(str(idx // const.CHAN_PER_GRP)) or groups.get(idx // const.CHAN_PER_GRP) or {}
+			chan = channels.get(str(idx)) or channels.get(idx) or {}
+			ret.append({
+				'format_mask': chan.get('event_format_mask', 0),
+				'maw_ena': bool(chan.get('event_maw_ena', False)),
+				'raw_window': grp.get('raw_window', 0),
+				'maw_window': grp.get('maw_window', 0),
+				'addr_threshold': grp.get('addr_threshold', 0),
+				})
+	else: # a device
+		for chan in conf.channels:
+			grp = chan.group
+			ret.append({
+				'format_mask': chan.event_format_mask,
+				'maw_ena': bool(chan.event_maw_ena),
+				'raw_window': grp.raw_window,
+				'maw_window': grp.maw_window,
+				'addr_threshold': grp.addr_threshold,
+				})
+	return ret
+
+
+def plan(conf, rates, link_bandwidth = 100e6, jumbo = True, margin = 0.5, min_transfer = 64*1024):
+	""" Predict data rates and recommend a bank swap interval.
+
+	conf: a configuration dict (see tools/conf.py) or a device object.
+	rates: expected trigger rate per channel [Hz], a list or a {chan: rate} dict.
+	link_bandwidth: usable network throughput [bytes/s].
+	jumbo: jumbo frames are enabled.
+	margin: fraction of the bank fill (or threshold) time used as a swap interval.
+	min_transfer: do not swap faster than it takes to collect this many bytes
+		in the busiest channel (avoid tiny transfers).
+
+	Returns a dict with 'channels', 'groups' and the totals.
+	All sizes are in bytes, times in seconds, rates in bytes/s.
+	"""
+	if isinstance(rates, dict):
+		rates = [rates.get(i, rates.get(str(i), 0.0)) for i in range(0, const.CHAN_TOTAL)]
+	if len(rates) != const.CHAN_TOTAL:
+		raise ValueError("Rates for all {0} channels expected, {1} given.".format(const.CHAN_TOTAL, len(rates)))
+
+	payload = PAYLOAD_JUMBO if jumbo else PAYLOAD_STD
+	overhead = 1.0 + float(UDP_OVERHEAD) / payload
+
+	inf = float('inf')
+	channels = []
+	for idx, (fmt, rate) in enumerate(zip(channel_formats(conf), rates)):
+		evt_bytes = 4 * event_words(fmt['format_mask'], fmt['raw_window'], fmt['maw_window'], fmt['maw_ena'])
+		drate = evt_bytes * float(rate)
+		thr = fmt['addr_threshold']
+		channels.append({
+			'chan': idx,
+			'event_bytes': evt_bytes,
+			'rate': float(rate),
+			'data_rate': drate,
+			'bank_fill_time': const.MEM_BANK_SIZE / drate if drate else inf,
+			'threshold_time': thr / drate if drate and thr else inf,
+			})
+
+	groups = []
+	for gid in range(0, const.CHAN_GRP_COUNT):
+		gchans = channels[gid * const.CHAN_PER_GRP : (gid + 1) * const.CHAN_PER_GRP]
+		groups.append({
+			'group': gid,
+			'data_rate': sum(c['data_rate'] for c in gchans),
+			})
+
+	data_rate = sum(c['data_rate'] for c in channels)
+	net_rate = data_rate * overhead
+
+	# swap before the first channel hits the threshold (or fills the bank)
+	limit = min([min(c['bank_fill_time'], c['threshold_time']) for c in channels] + [inf])
+	swap_max = limit * margin
+
+	# ...but not so often that transfers become tiny
+	max_drate = max(c['data_rate'] for c in channels)
+	swap_min = min_transfer / max_drate if max_drate else inf
+
+	if swap_max == inf:
+		swap = None # nothing to read
+	elif swap_min > swap_max:
+		swap = swap_max
+	else:
+		swap = max(swap_min, min(swap_max, 1.0)) # a second is a good default
+
+	return {
+		'channels': channels,
+		'groups': groups,
+		'data_rate': data_rate,
+		'network_rate': net_rate,
+		'link_bandwidth': link_bandwidth,
+		'headroom': link_bandwidth / net_rate if net_rate else inf,
+		'swap_interval': swap,
+		'swap_interval_max': swap_max,
+		'drain_time': net_rate * swap / link_bandwidth if swap else 0.0,
+		}
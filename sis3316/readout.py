@@ -22,23 +22,56 @@
 from .common import *
 from .registers import *
 from io import IOBase
+from mmap import mmap
+import time
 
 class destination (object):
-    """ Proxy object. """
+    """ Proxy object.
+    Gives `push(chunk)' and `index' (bytes pushed + skip) to targets:
+        bytearray, mmap.mmap: fixed size, IndexError on overflow,
+        memoryview, NumPy array or any other writable buffer: the same, the
+            buffer should be C-contiguous (index is in bytes for any item type),
+        a file (io.IOBase),
+        an object which already has `push' and `index' (like RingBuffer): used as is.
+    A chunk is a memoryview of the receive buffer, which is reused for the
+    next packet: push() must copy the data before it returns and must not
+    keep the chunk (or a view of it). All the targets above copy; an object
+    with its own push() has to do the same.
+    """
     target = None
     index = 0
+    
+    def __new__(cls, target, skip = 0):
+        if isinstance(target, cls) or (hasattr(target, 'push') and hasattr(target, 'index')):
+            return target
+        return object.__new__(cls)
+    
     def __init__(self, target, skip = 0):
+        if self is target:
+            return
+        
         self.target = target
         self.index = skip
         
-        if isinstance(target, self.__class__): 
-            return target
-        
-        elif isinstance(target, bytearray):
+        if isinstance(target, (bytearray, mmap)):
             self.push = self._push_bytearray
             
         elif isinstance(target, IOBase):
             self.push = self._push_file
+        
+        else:
+            try:
+                view = memoryview(target)
+            except TypeError:
+                raise TypeError("Unsupported destination type: {0}.".format(type(target)))
+            
+            if view.readonly:
+                raise TypeError("Destination buffer is read-only.")
+            if not view.c_contiguous:
+                raise TypeError("Destination buffer is not contiguous.")
+            
+            self.target = view.cast('B')
+            self.push = self._push_bytearray
     
     def _push_bytearray(self, source):
         limit = len(self.target)
@@ -55,43 +88,285 @@ class destination (object):
         
     def _push_file(self, source):
         count = len(source)
-        self.target.write(source)
+        write_all(self.target, source)
+        self.index += count
+
+
+def write_all(fileobj, data):
+    """ Write all of `data' to a file. A raw file (io.FileIO, an unbuffered
+    open()) may write less than it's given and return the count: the rest
+    is written again. None is taken as all written (Python 2 files).
+    """
+    view = memoryview(data)
+    if view.itemsize != 1:
+        view = view.cast('B')
+    while len(view):
+        count = fileobj.write(view)
+        if count is None:
+            break
+        view = view[count:]
+
+
+class RingBuffer(object):
+    """ A circular buffer for readout, with a consumer cursor.
+    Has the `push'/`index' protocol, so it can be passed wherever a destination is expected.
+    index: bytes pushed in total, read_index: bytes consumed in total.
+    If `grow' is set the buffer is enlarged when full (up to `max_size'),
+    otherwise push() raises IndexError.
+    """
+    def __init__(self, size, grow = False, max_size = None):
+        self.buf = bytearray(size)
+        self.grow = grow
+        self.max_size = max_size
+        self.index = 0
+        self.read_index = 0
+        self._base = 0 # the index at buf[0]
+    
+    @property
+    def size(self):
+        return len(self.buf)
+    
+    def __len__(self):
+        """ Bytes available to the consumer. """
+        return self.index - self.read_index
+    
+    @property
+    def free(self):
+        return len(self.buf) - len(self)
+    
+    def _resize(self, need):
+        size = len(self.buf)
+        while size < need:
+            size *= 2
+        if self.max_size is not None:
+            size = min(size, self.max_size)
+        if size < need:
+            raise IndexError("Out of range.")
+        
+        data = self.peek()
+        self.buf = bytearray(size)
+        self.buf[:len(data)] = data
+        self._base = self.read_index
+    
+    def _pos(self, index):
+        return (index - self._base) % len(self.buf)
+    
+    def push(self, source):
+        count = len(source)
+        if count > self.free:
+            if not self.grow:
+                raise IndexError("Out of range.")
+            self._resize(len(self) + count)
+        
+        size = len(self.buf)
+        pos = self._pos(self.index)
+        first = min(count, size - pos)
+        self.buf[pos : pos + first] = source[:first]
+        if first < count:
+            self.buf[0 : count - first] = source[first:]
         self.index += count
- 
+    
+    def peek(self, count = None):
+        """ Return up to `count' unconsumed bytes (all if None), not moving the cursor.
+        A memoryview if the data is contiguous in the buffer (valid until consumed).
+        """
+        avail = len(self)
+        if count is None or count > avail:
+            count = avail
+        
+        size = len(self.buf)
+        pos = self._pos(self.read_index)
+        first = min(count, size - pos)
+        if first == count:
+            return memoryview(self.buf)[pos : pos + count]
+        return bytes(self.buf[pos : pos + first]) + bytes(self.buf[0 : count - first])
+    
+    def consume(self, count):
+        """ Move the consumer cursor. """
+        if count > len(self):
+            raise IndexError("Out of range.")
+        self.read_index += count
+    
+    def read(self, count = None):
+        """ peek() and consume(). Returns bytes. """
+        data = bytes(self.peek(count))
+        self.consume(len(data))
+        return data
+
 
 class Sis3316(object):
     
     def readout(self, chan_no, target, target_skip=0, opts={}):
-        """ Rerurns ITERATOR. """
+        """ Rerurns ITERATOR.
+        opts:
+            chunk_size: words per chunk.
+            check_every: verify the bank was not swapped every N chunks
+                (0: only after the last chunk). A check is a single request.
+            align_events: cut chunks on event boundaries, so every chunk can be
+                parsed on its own. Events have a fixed length (Adc_channel.event_length,
+                or opts['event_length'] {chan_no: words} to not to read the config);
+                if the data is not a whole number of events, chunks are not aligned.
+            sample: read only the first N words of the bank (0: all),
+            sample_every: read every k-th chunk only, skip the others.
+                Sampled chunks are aligned to events (as with align_events),
+                a sample has at least one event.
+        Yields dicts: 'transfered' (words), 'offset' (of the chunk in the bank, words),
+            'sync' (the chunk starts with an event),
+            'leftover' (words left to read or skip), 'events' (in the chunk, None if not aligned).
+        """
         
         opts.setdefault('chunk_size', 1024*1024) #words
+        opts.setdefault('check_every', 0)
+        opts.setdefault('align_events', False)
+        opts.setdefault('sample', 0)
+        opts.setdefault('sample_every', 1)
         
         chan = self.channels[chan_no]
-        bank = self.mem_prev_bank
-        max_addr = chan.addr_prev
+        bank, max_addr = self._bank_state(chan)
+        if bank is None:
+            raise self._NotArmedExcept
         chunksize = opts['chunk_size']
+        check_every = opts['check_every']
+        every = opts['sample_every']
+        sampling = opts['sample'] or every > 1
         finished = 0
+        chunks = 0
         fsync = True # the first byte in buffer is a first byte of an event
         
+        evlen = None
+        if (opts['align_events'] or sampling) and max_addr:
+            evlen = opts.get('event_length', {}).get(chan_no) or chan.event_length
+            if max_addr % evlen:
+                evlen = None # unexpected event length (averaging mode?)
+            else:
+                chunksize = max(chunksize // evlen, 1) * evlen
+        
+        limit = max_addr
+        if opts['sample']:
+            sample = opts['sample']
+            if evlen:
+                sample = max(sample // evlen, 1) * evlen
+            limit = min(max_addr, sample)
+        
         dest = destination(target, target_skip)
-        while finished < max_addr:
-            toread = min(chunksize, max_addr-finished)
+        while finished < limit:
+            offset = finished
+            toread = min(chunksize, limit-finished)
             wtransferred = chan.bank_read(bank, dest, toread, finished)
-            
-            bank_after = self.mem_prev_bank
-            max_addr_after = chan.addr_prev
-            
-            if bank_after != bank or max_addr_after != max_addr:
-                raise self._BankSwapDuringReadExcept
-            
             finished += wtransferred
+            chunks += 1
+            if every > 1:
+                finished = min(limit, finished + (every-1) * chunksize)
             
-            yield {'transfered': wtransferred, 'sync': fsync, 'leftover': max_addr - finished}
+            if finished >= limit or (check_every and chunks % check_every == 0):
+                if self._bank_state(chan) != (bank, max_addr):
+                    raise self._BankSwapDuringReadExcept
+            
+            yield {'transfered': wtransferred, 'offset': offset, 'sync': fsync or bool(evlen),
+                    'leftover': limit - finished,
+                    'events': wtransferred // evlen if evlen else None}
             
             fsync = False
 
+    def _bank_state(self, chan):
+        """ Previous bank and channel's addr_prev in a single request. """
+        status, addr_prev = self.read_list([SIS3316_ACQUISITION_CONTROL_STATUS, chan.prev_addr_reg])
+        stat = self._readout_status_decode(status)
+        if not stat['armed']:
+            return None, None
+        return (stat['bank'] - 1) % const.MEM_BANK_COUNT, addr_prev & 0xffFFFF
 
+    def acq_snapshot(self):
+        """ Acquisition status and sample addresses of all channels in a single request.
+        Returns a dict:
+            'ts': time of the request,
+            'status': see _readout_status(),
+            'bank', 'prev_bank': None if not armed,
+            'actual': a list of addr_actual, 'prev': a list of addr_prev (words).
+        """
+        chans = self.channels
+        addrs = [SIS3316_ACQUISITION_CONTROL_STATUS] \
+            + [ch.actual_addr_reg for ch in chans] + [ch.prev_addr_reg for ch in chans]
+        ts = time.time()
+        data = self.read_list(addrs)
+        
+        stat = self._readout_status_decode(data[0])
+        bank = stat['bank'] if stat['armed'] else None
+        num = len(chans)
+        return {'ts': ts,
+            'status': stat,
+            'bank': bank,
+            'prev_bank': None if bank is None else (bank-1) % const.MEM_BANK_COUNT,
+            'actual': [val & 0xffFFFF for val in data[1 : 1+num]],
+            'prev': [val & 0xffFFFF for val in data[1+num : 1+2*num]],
+            }
 
+    def readout_groups(self, destinations, target_skip=0):
+        """ Read the previous bank of several channels, interleaving requests to ADC groups.
+        Args:
+            destinations: a list of (chan_no, target).
+        Returns:
+            (words, groups): words per channel {chan_no: words},
+            group statistics {grp_no: {'words', 'jobs', 'time', 'setups', 'rate'}}, rate in bytes/s.
+        """
+        snap = self.acq_snapshot()
+        bank = snap['prev_bank']
+        if bank is None:
+            raise self._NotArmedExcept
+        
+        jobs = []
+        for chan_no, target in destinations:
+            chan = self.channels[chan_no]
+            nwords = snap['prev'][chan_no]
+            mem_no, woffset = chan.bank_location(bank, nwords)
+            jobs.append( (destination(target, target_skip), chan.gid, mem_no, nwords, woffset) )
+        
+        stats = self.read_fifo_groups([j for j in jobs if j[3]])
+        
+        after = self.acq_snapshot()
+        if after['prev_bank'] != bank or after['prev'] != snap['prev']:
+            raise self._BankSwapDuringReadExcept
+        
+        for st in stats.values():
+            st['rate'] = 4.0 * st['words'] / st['time'] if st['time'] else 0.0
+        
+        words = dict( (chan_no, job[3]) for (chan_no, target), job in zip(destinations, jobs) )
+        return words, stats
+    
+    def readout_scheduled(self, destinations, policy, target_skip=0, opts={}):
+        """ Read the previous bank of several channels chunk by chunk, in the order
+        a drain policy gives (see scheduler.DrainPolicy), so a large channel
+        does not have to wait behind the others or hold them up.
+        Args:
+            destinations: a list of (chan_no, target),
+            opts: see readout().
+        Yields (chan_no, dict) for each chunk, the dict is the same as readout() yields.
+        """
+        snap = self.acq_snapshot()
+        if snap['prev_bank'] is None:
+            raise self._NotArmedExcept
+        
+        words = dict( (chan_no, snap['prev'][chan_no]) for chan_no, target in destinations )
+        readers = dict( (chan_no, self.readout(chan_no, target, target_skip, opts))
+                for chan_no, target in destinations if words[chan_no] )
+        remaining = dict( (chan_no, words[chan_no]) for chan_no in readers )
+        policy.start(words)
+        
+        while remaining:
+            chan_no = policy.pick(remaining)
+            try:
+                ret = next(readers[chan_no])
+            except StopIteration:
+                ret = None
+            
+            if ret is None or not ret['leftover']:
+                del remaining[chan_no]
+                policy.done(chan_no)
+            else:
+                remaining[chan_no] = ret['leftover']
+            if ret is not None:
+                yield chan_no, ret
+    
     def readout_pipe(self, chan_no, target, target_skip=0, opts={}):
         """ Readout generator. """
         opts.setdefault('swap_banks_auto', False)
@@ -117,12 +392,12 @@ class Sis3316(object):
         if not chanlist:
             chanlist = range(0,const.CHAN_TOTAL-1)
 
-        data = []        
-        #TODO: make a signle request instead of multiple .addr_actual property calls
+        actual = self.acq_snapshot()['actual']
+        data = []
         for i in chanlist:
             try:
-                data.append(self.channels[i].addr_actual)
-            except (IndexError, AttributeError):
+                data.append(actual[i])
+            except (IndexError, TypeError):
                 data.append(None)
         #End For
         return data
@@ -130,7 +405,11 @@ class Sis3316(object):
     def _readout_status(self):
         """ Return current bank, memory threshold flag """
         data = self.read(SIS3316_ACQUISITION_CONTROL_STATUS)
-        
+        return self._readout_status_decode(data)
+    
+    @staticmethod
+    def _readout_status_decode(data):
+        """ Decode SIS3316_ACQUISITION_CONTROL_STATUS value. """
         return {'armed'    : bool(get_bits(data, 16, 0b1)),
             'busy'    : bool(get_bits(data, 18, 0b1)), 
             'threshold_overrun':bool(get_bits(data, 19, 0b1)), # more data than .addr_threshold - 512 kbytes. overrun is always True if .addr_threshold is 0!
@@ -178,14 +457,18 @@ class Sis3316(object):
         return (bank-1) % const.MEM_BANK_COUNT
 
     
+    swap_status = None  # _readout_status() just before the last mem_toggle()
+    
     def mem_toggle(self):
-        """ Toggle memory bank (disarm and arm opposite) """
-        current = self.mem_bank
-        if current is None:
+        """ Toggle memory bank (disarm and arm opposite). Returns the new bank. """
+        stat = self._readout_status()
+        if not stat['armed']:
             raise self._NotArmedExcept
+        self.swap_status = stat
         
-        new = current ^ 1
+        new = stat['bank'] ^ 1
         self.arm(new)
+        return new
 
 
     class _NotArmedExcept(Sis3316Except):
@@ -0,0 +1,162 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Link recovery after grant loss, protocol errors or ADC FPGA reset.
+
+import sys
+import time
+from datetime import datetime
+
+from .common import *
+from .registers import *
+
+
+def log_stderr(msg):
+	timestr = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+	sys.stderr.write('%s %s\n' % (timestr, msg))
+
+
+class Recovery(object):
+	""" Bring the link and the ADC logic back after a failure and re-arm the sample logic.
+
+	Usage:
+		rec = Recovery(dev)
+		rec.snapshot()	# after the device is configured
+		...
+		except Exception as e:
+			rec.recover(e)
+	"""
+
+	def __init__(self, dev, attempts = 10, delay = 1.0, log = log_stderr):
+		"""
+		dev: a Sis3316 object.
+		attempts: give up after that many failed recovery attempts.
+		delay: seconds to wait between attempts.
+		log: a callable to report recovery actions.
+		"""
+		self.dev = dev
+		self.attempts = attempts
+		self.delay = delay
+		self.log = log
+		self.image = None	# cached register image
+		self.bank = None	# the bank which should be armed
+		self.history = []	# recovery records
+		self.downtime = 0.0	# total, seconds
+
+	def snapshot(self):
+		""" Cache the configuration and the current bank. """
+		self.image = self.dev.register_image()
+		self.bank = self.dev.mem_bank
+
+	def diagnose(self, exc = None):
+		""" Guess a cause of failure by exception. """
+		dev = self.dev
+		causes = (
+			('no_grant', getattr(dev, '_SisNoGrantExcept', None)),
+			('protocol', getattr(dev, '_SisProtocolErrorExcept', None)),
+			('timeout', getattr(dev, '_TimeoutExcept', None)),
+			('bank_swap', getattr(dev, '_BankSwapDuringReadExcept', None)),
+			('not_armed', getattr(dev, '_NotArmedExcept', None)),
+			)
+		for name, cls in causes:
+			if cls and isinstance(exc, cls):
+				return name
+		if isinstance(exc, IOError):
+			return 'io'
+		if exc is None:
+			return 'link_errors'
+		return 'unknown'
+
+	def recover(self, exc = None):
+		""" Reopen the link, restore configuration, re-arm the bank.
+		Returns downtime in seconds. Raises the last exception if all attempts failed.
+		"""
+		dev = self.dev
+		t0 = time.time()
+		cause = self.diagnose(exc)
+		self.log('recovery: %s (%s)' % (cause, exc))
+
+		last_exc = exc
+		for attempt in range(0, self.attempts):
+			actions = []
+			try:
+				self._recover(actions)
+
+			except Exception as e:
+				last_exc = e
+				self.log('recovery: attempt %d failed after %s: %s' % (attempt + 1, actions, e))
+				sleep(self.delay)
+				continue
+
+			downtime = time.time() - t0
+			self.downtime += downtime
+			self.history.append({'ts': t0, 'cause': cause, 'actions': actions,
+					'attempts': attempt + 1, 'downtime': downtime})
+			self.log('recovery: done %s, downtime %.3f s' % (actions, downtime))
+			return downtime
+
+		self.history.append({'ts': t0, 'cause': cause, 'actions': None,
+				'attempts': self.attempts, 'downtime': time.time() - t0})
+		if last_exc is None:
+			raise self._RecoveryFailedExcept(self.attempts)
+		raise last_exc
+
+	def _recover(self, actions):
+		dev = self.dev
+
+		dev.cleanup_socket()
+		dev.open()
+		actions.append('open')
+
+		if not dev.status: # ADC FPGA link errors
+			dev.write(SIS3316_KEY_ADC_FPGA_RESET, 0)
+			msleep(10)
+			actions.append('adc_fpga_reset')
+
+			if dev._freq:
+				for grp in dev.groups:
+					grp.tap_delay_calibrate()
+				usleep(10)
+				for grp in dev.groups:
+					grp.tap_delay_set()
+				usleep(10)
+				actions.append('tap_delay')
+
+		if self.image:
+			if 'adc_fpga_reset' in actions or self._image_changed():
+				dev.load_register_image(self.image)
+				actions.append('restore')
+
+		if not dev.status:
+			raise self._LinkErrorsExcept
+
+		if dev.mem_bank is None: # disarmed by reset
+			dev.arm(self.bank or 0)
+			actions.append('arm %d' % (self.bank or 0))
+
+	def _image_changed(self):
+		image = self.dev.register_image()
+		return any(image.get(k) != v for k,v in self.image.items() if not isinstance(k, str))
+
+	class _RecoveryFailedExcept(Sis3316Except):
+		""" Link recovery failed after {0} attempts. """
+
+	class _LinkErrorsExcept(Sis3316Except):
+		""" ADC FPGA link errors are still present. """
@@ -0,0 +1,236 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Output files split into segments by size, time or spill count.
+#
+# A segment is written as <name>.part and renamed to <name> (or compressed
+# to <name>.sz) by a background thread when it's finished, so anything
+# without .part is complete.
+
+import io
+import os
+import re
+import time
+from threading import Thread
+
+try:
+	from queue import Queue
+except ImportError: # Python 2
+	from Queue import Queue
+
+from .container import ContainerWriter
+from .compress import compress_block, CODECS
+from .readout import write_all
+
+PART = '.part'
+
+
+class FinalizeError(IOError):
+	""" A finished segment could not be written out (fsync, rename or compression failed). """
+
+
+def segment_name(path, run, segment):
+	""" 'data/raw-ch05.dat' -> 'data/raw-ch05_run0003_0012.dat' """
+	root, ext = os.path.splitext(path)
+	return '%s_run%04d_%04d%s' % (root, run, segment, ext)
+
+
+def next_run(paths):
+	""" The first run number not used by segments of any of `paths'. """
+	last = 0
+	for path in paths:
+		root, ext = os.path.splitext(path)
+		folder = os.path.dirname(root) or '.'
+		pattern = re.compile(re.escape(os.path.basename(root)) + r'_run(\d+)_\d+' + re.escape(ext))
+		if not os.path.isdir(folder):
+			continue
+		for name in os.listdir(folder):
+			m = pattern.match(name)
+			if m:
+				last = max(last, int(m.group(1)))
+	return last + 1
+
+
+def finalize(fileobj, part, codec = None, level = 6, block_size = 4 * 1024 * 1024):
+	""" Flush, fsync and close a finished segment, then rename or compress it.
+	Returns the final file name.
+	"""
+	fileobj.flush()
+	os.fsync(fileobj.fileno())
+	fileobj.close()
+	final = part[:-len(PART)]
+	if not codec:
+		os.rename(part, final)
+		return final
+
+	final += '.sz'
+	tmp = final + PART
+	with open(part, 'rb') as src:
+		with open(tmp, 'wb') as dst:
+			while True:
+				data = src.read(block_size)
+				if not data:
+					break
+				dst.write(compress_block(data, codec, level)[0])
+			dst.flush()
+			os.fsync(dst.fileno())
+	os.rename(tmp, final)
+	os.unlink(part)
+	return final
+
+
+class RotatingSink(object):
+	""" A chunk sink (next_spill/write_chunk/close) which writes segments.
+
+	paths: {chan: path} for a file per channel, or a path with `container' set
+	(each segment is then a complete container, see container.py).
+	A new segment starts at a spill boundary when the current one has
+	`max_bytes', is `max_time' seconds old or has `max_spills' spills.
+	Finished segments are closed, fsync'ed and renamed (compressed with
+	`codec' if given) in a background thread; `finished' is the list of
+	their names, on_finished(name) is called from that thread.
+	With a `pipeline' (sis3316.pipeline.Pipeline) the segments are written by
+	its writer thread, which passes each finished segment on to the background
+	thread once all of its data is written.
+	Errors of the background thread are raised in the readout thread as
+	FinalizeError, once each (by next_spill() or close()). The segment is
+	left as .part; a readout should stop then, the output can't be trusted.
+	"""
+	def __init__(self, paths, container = False, run = None, max_bytes = None, max_time = None,
+			max_spills = None, codec = None, level = 6, on_finished = None, pipeline = None):
+		if codec and codec not in CODECS:
+			raise ValueError("Unknown codec '{0}', use one of: {1}.".format(codec, ', '.join(sorted(CODECS))))
+		self.paths = {None: paths} if container else dict(paths)
+		self.container = container
+		self.run = run or next_run(self.paths.values())
+		self.max_bytes = max_bytes
+		self.max_time = max_time
+		self.max_spills = max_spills
+		self.codec = codec
+		self.level = level
+		self.on_finished = on_finished
+		self.pipeline = pipeline
+
+		self.spill = 0
+		self.segment = 0
+		self.finished = []
+		self._files = None
+		self._error = None
+		self._queue = Queue()
+		self._thread = Thread(target = self._finalize_loop, name = 'sis3316-finalize')
+		self._thread.daemon = True
+		self._thread.start()
+
+	def names(self, segment):
+		""" File names of a segment (without .part), {chan: name}. """
+		return dict((key, segment_name(path, self.run, segment)) for key, path in self.paths.items())
+
+	def _open(self):
+		self.segment += 1
+		names = self.names(self.segment)
+		for name in names.values():
+			if os.path.exists(name) or os.path.exists(name + '.sz'):
+				raise IOError("Segment \"%s\" exists." % name)
+		self._files = dict((key, (io.FileIO(name + PART, 'w'), name + PART)) for key, name in names.items())
+		self._dests = dict((key, fileobj) for key, (fileobj, part) in self._files.items())
+		if self.pipeline:
+			self._dests = dict((key, self.pipeline.add_file((self.segment, key), fileobj))
+					for key, fileobj in self._dests.items())
+		self._writer = None
+		if self.container:
+			self._writer = ContainerWriter(self._dests[None])
+		self._bytes = 0
+		self._spills = 0
+		self._t_open = time.time()
+
+	def _rotate_due(self):
+		return self.max_bytes and self._bytes >= self.max_bytes \
+			or self.max_time and time.time() - self._t_open >= self.max_time \
+			or self.max_spills and self._spills >= self.max_spills
+
+	def _finish(self):
+		if self._files is None:
+			return
+		if self._writer:
+			self._writer.close()
+		for key, (fileobj, part) in self._files.items():
+			if self.pipeline:
+				self.pipeline.remove_file((self.segment, key), lambda fileobj, part = part: self._queue.put((fileobj, part)))
+			else:
+				self._queue.put((fileobj, part))
+		self._files = None
+
+	def _finalize_loop(self):
+		while True:
+			item = self._queue.get()
+			if item is None:
+				return
+			fileobj, part = item
+			try:
+				name = finalize(fileobj, part, self.codec, self.level)
+				self.finished.append(name)
+				if self.on_finished:
+					self.on_finished(name)
+			except Exception as e:
+				self._error = FinalizeError("Segment \"%s\" is not finished: %s" % (part, e))
+
+	def _check(self):
+		error, self._error = self._error, None
+		if error is not None:
+			raise error
+
+	def next_spill(self):
+		""" Call once per bank swap, a new segment may start here. """
+		self._check()
+		if self._files is None:
+			self._open()
+		elif self._rotate_due():
+			self._finish()
+			self._open()
+		self.spill += 1
+		self._spills += 1
+		if self._writer:
+			self._writer.spill = self.spill - 1
+			self._writer.next_spill()
+		return self.spill
+
+	def write_chunk(self, chan, data, sync = True, bank = 0, ts = None):
+		if self._writer:
+			self._writer.write_chunk(chan, data, sync, bank, ts)
+		elif self.pipeline:
+			self._dests[chan].push(data)
+		else:
+			write_all(self._dests[chan], data)
+		self._bytes += len(data)
+
+	def stats(self):
+		return {'run': self.run, 'segment': self.segment, 'segment_bytes': self._bytes if self._files else 0,
+			'finished': len(self.finished), 'pending': self._queue.qsize()}
+
+	def close(self):
+		""" Finish the current segment and wait for the background thread. """
+		try:
+			self._finish()
+			if self.pipeline:
+				self.pipeline.sync() # the last segment is passed on
+		finally:
+			self._queue.put(None)
+			self._thread.join()
+		self._check()
@@ -0,0 +1,124 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Trigger threshold scan: rate-vs-threshold curves for all channels at once.
+
+import time
+
+from .common import *
+from .counters import counter_rates
+
+THRESHOLD_OFFSET = 0x8000000 # the running sum + 0x800 0000 is compared to the threshold
+THRESHOLD_MASK = 0xFffFFFF
+
+
+def _addr_rates(dev, interval, evt_words):
+	""" Trigger rates from the growth of actual sample addresses. """
+	addrs = [ch.actual_addr_reg for ch in dev.channels]
+	t0 = time.time()
+	a0 = dev.read_list(addrs)
+	sleep(interval)
+	t1 = time.time()
+	a1 = dev.read_list(addrs)
+
+	rates = []
+	for x0, x1, ewords in zip(a0, a1, evt_words):
+		x0, x1 = x0 & 0xffFFFF, x1 & 0xffFFFF # the upper bits are flags (the bank)
+		if x1 < x0 or not ewords: # bank swap or nothing to count
+			rates.append(None)
+		else:
+			rates.append( (x1 - x0) / float(ewords) / (t1 - t0) )
+	return rates
+
+
+def _counter_rates(dev, interval, counter):
+	prev = dev.counters_snapshot()
+	sleep(interval)
+	cur = dev.counters_snapshot()
+	return [r[counter] for r in counter_rates(prev, cur)]
+
+
+def threshold_scan(dev, thresholds, dwell = 0.5, source = 'counters', counter = 'internal',
+		noise_rate = 10.0):
+	""" Step thresholds of all channel triggers at once and measure rates.
+
+	thresholds: a list of threshold values (without the 0x8000000 offset).
+	dwell: seconds to measure rates at each step.
+	source: 'counters' (trigger statistic counters) or 'addr' (actual sample
+		address growth, the sample logic should be armed).
+	counter: which statistic counter to use with 'counters' source.
+	noise_rate: [Hz] the noise edge is the lowest threshold with a rate below this.
+
+	Returns a dict:
+		'thresholds': the list of thresholds,
+		'rates': {chan: [rate per step]},
+		'edge': {chan: suggested threshold or None}, without the offset as `thresholds',
+		'setting': {chan: edge + 0x8000000 or None}, the value for Adc_trigger.threshold.
+	Sum triggers have no statistic counters of their own, so they are not scanned.
+	Original thresholds are restored in the end.
+	"""
+	if source not in ('counters', 'addr'):
+		raise ValueError("source is 'counters' or 'addr', '{0}' given.".format(source))
+
+	triggers = list(dev.triggers)
+	keys = [t.idx for t in triggers]
+
+	addrs = [t.threshold_addr for t in triggers]
+	saved = dev.read_list(addrs)
+
+	evt_words = None
+	if source == 'addr':
+		evt_words = [ch.event_length for ch in dev.channels]
+
+	rates = dict((k, []) for k in keys)
+
+	try:
+		for thr in thresholds:
+			if (thr + THRESHOLD_OFFSET) & ~THRESHOLD_MASK:
+				raise ValueError("Threshold {0} is out of range.".format(thr))
+
+			data = [set_bits(val, thr + THRESHOLD_OFFSET, 0, THRESHOLD_MASK) for val in saved]
+			dev.write_list(addrs, data)
+
+			if source == 'counters':
+				chan_rates = _counter_rates(dev, dwell, counter)
+			else:
+				chan_rates = _addr_rates(dev, dwell, evt_words)
+
+			for idx, rate in enumerate(chan_rates):
+				rates[idx].append(rate)
+	finally:
+		dev.write_list(addrs, saved)
+
+	edge = dict((k, noise_edge(thresholds, rates[k], noise_rate)) for k in keys)
+	setting = dict((k, None if e is None else e + THRESHOLD_OFFSET) for k, e in edge.items())
+
+	return {'thresholds': list(thresholds), 'rates': rates, 'edge': edge, 'setting': setting}
+
+
+def noise_edge(thresholds, rates, noise_rate):
+	""" The lowest threshold above which the rate stays below `noise_rate'. """
+	pairs = sorted((t, r) for t, r in zip(thresholds, rates) if r is not None)
+	edge = None
+	for thr, rate in reversed(pairs):
+		if rate >= noise_rate:
+			break
+		edge = thr
+	return edge
@@ -0,0 +1,195 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Decide when to swap memory banks.
+
+import time
+
+from .common import *
+from .registers import *
+from .adc_unit.registers import SIS3316_ADC_GRP, ADDRESS_THRESHOLD_REG
+
+
+class BankScheduler(object):
+	""" Poll acquisition status and sample addresses, tell when to swap banks.
+
+	A swap is due when:
+		'threshold': the board reports threshold_overrun (only if Adc_group.addr_threshold is set),
+		'fill': the fullest channel has `fill' of its bank used,
+		'latency': `latency' seconds have passed and there are at least `min_words' to read,
+		'timeout': `max_latency' seconds have passed.
+	Each poll is a single request (see Sis3316.acq_snapshot). The poll interval
+	follows the fill rate of the fullest channel: short at high rates, up to
+	`max_poll' at low rates.
+	"""
+	def __init__(self, dev, latency = 1.0, max_latency = 10.0, min_words = 64 * 1024,
+			fill = 0.5, min_poll = 0.005, max_poll = 0.2):
+		if not 0 < fill <= 1:
+			raise ValueError("fill is a fraction of the bank (0...1], '{0}' given.".format(fill))
+		if max_latency < latency:
+			raise ValueError("max_latency should not be less than latency.")
+
+		self.dev = dev
+		self.latency = latency
+		self.max_latency = max_latency
+		self.min_words = min_words
+		self.fill_words = int(fill * const.CHAN_BANK_WORDS)
+		self.min_poll = min_poll
+		self.max_poll = max_poll
+
+		self.use_threshold = None
+		self.polls = 0
+		self.swapped()
+
+	def swapped(self):
+		""" Call right after a bank swap. """
+		self.t_swap = time.time()
+		self.polls = 0
+		self._prev = None # (ts, words) of the fullest channel
+
+	def _check_threshold(self):
+		""" threshold_overrun is always set if addr_threshold is 0. """
+		regs = [SIS3316_ADC_GRP(ADDRESS_THRESHOLD_REG, g) for g in range(0, const.CHAN_GRP_COUNT)]
+		return all(val & 0xffFFFF for val in self.dev.read_list(regs))
+
+	def poll(self):
+		""" Read the status once. Returns (reason or None, seconds to the next poll). """
+		if self.use_threshold is None:
+			self.use_threshold = self._check_threshold()
+
+		snap = self.dev.acq_snapshot()
+		now = snap['ts']
+		self.polls += 1
+		status = snap['status']
+		wmax, wtotal = max(snap['actual']), sum(snap['actual'])
+		elapsed = now - self.t_swap
+
+		if not status['armed']:
+			raise self.dev._NotArmedExcept
+
+		if self.use_threshold and status['threshold_overrun']:
+			return 'threshold', 0
+		if wmax >= self.fill_words:
+			return 'fill', 0
+		if elapsed >= self.latency and wtotal >= self.min_words:
+			return 'latency', 0
+		if elapsed >= self.max_latency:
+			return 'timeout', 0
+
+		# when the fullest channel reaches fill_words, wake up at half of that time
+		delay = self.max_poll
+		if self._prev:
+			t0, w0 = self._prev
+			if wmax > w0 and now > t0:
+				rate = (wmax - w0) / (now - t0)
+				delay = (self.fill_words - wmax) / rate / 2
+		self._prev = (now, wmax)
+
+		if elapsed < self.latency:
+			delay = min(delay, self.latency - elapsed)
+		else:
+			delay = min(delay, self.max_latency - elapsed)
+		return None, min(self.max_poll, max(self.min_poll, delay))
+
+	def wait(self):
+		""" Block until a swap is due. Returns the reason. """
+		while True:
+			reason, delay = self.poll()
+			if reason:
+				return reason
+			sleep(delay)
+
+
+# Drain order: which channel of the previous bank to read the next chunk of.
+# A policy gets start(words) with {chan: words} when a spill readout begins,
+# pick(remaining) for each chunk (remaining is not empty) and done(chan)
+# when a channel is read. See Sis3316.readout_scheduled().
+
+class DrainPolicy(object):
+	""" Channels in order of their numbers, each one read completely (the old behavior). """
+	def start(self, words):
+		self.t_start = time.time()
+
+	def pick(self, remaining):
+		return min(remaining)
+
+	def done(self, chan):
+		pass
+
+
+class RoundRobin(DrainPolicy):
+	""" A chunk of each channel in turn. """
+	def start(self, words):
+		DrainPolicy.start(self, words)
+		self._order = sorted(words)
+		self._next = 0
+
+	def pick(self, remaining):
+		while True:
+			chan = self._order[self._next % len(self._order)]
+			self._next += 1
+			if chan in remaining:
+				return chan
+
+
+class LargestFirst(DrainPolicy):
+	""" The channel with the most words left goes next, so the fullest memories are drained first.
+	Every `small_every'-th chunk goes to the channel with the least words left,
+	to not to hold up small channels behind a large one (0: strictly largest first).
+	"""
+	def __init__(self, small_every = 4):
+		self.small_every = small_every
+
+	def start(self, words):
+		DrainPolicy.start(self, words)
+		self._count = 0
+
+	def pick(self, remaining):
+		self._count += 1
+		if self.small_every and self._count % self.small_every == 0:
+			return min(remaining, key = remaining.get)
+		return max(remaining, key = remaining.get)
+
+
+class Deadline(DrainPolicy):
+	""" Earliest deadline first, ties go to the larger channel.
+	deadlines: {chan: seconds after the start of the spill readout}, `default' for the rest.
+	missed: {chan: count} of channels read after their deadline.
+	"""
+	def __init__(self, deadlines = None, default = 1.0):
+		self.deadlines = dict(deadlines or {})
+		self.default = default
+		self.missed = {}
+
+	def pick(self, remaining):
+		deadlines = self.deadlines
+		return min(remaining, key = lambda chan: (deadlines.get(chan, self.default), -remaining[chan]))
+
+	def done(self, chan):
+		if time.time() - self.t_start > self.deadlines.get(chan, self.default):
+			self.missed[chan] = self.missed.get(chan, 0) + 1
+
+
+DRAIN_POLICIES = {
+	'fixed': DrainPolicy,
+	'round-robin': RoundRobin,
+	'largest': LargestFirst,
+	'deadline': Deadline,
+	}
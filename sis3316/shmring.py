@@ -0,0 +1,242 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# A shared memory ring buffer: one writer (readout), any number of reader processes.
+#
+# Memory: | header | slot table | data |
+# Header: b'SISRING\0', data size(64), number of slots(32), reserved(32),
+#         write index(64), slots committed(64)
+# Slot:   seq(64), data index(64), size(32), chan(16), flags(8), spill(32), timestamp(double)
+#
+# Indices are totals since the start, the position in the data area is index % data size.
+# The writer never waits for readers; a reader detects that it was overrun by
+# comparing its position with the write index.
+
+import time
+from collections import namedtuple
+from struct import Struct
+
+try:
+	from multiprocessing import shared_memory
+except ImportError: # Python < 3.8
+	shared_memory = None
+
+MAGIC = b'SISRING\0'
+HEADER = Struct('<8sQIIQQ')
+SLOT = Struct('<QQIHBxId')
+HEADER_Q = Struct('<Q')
+_WRITE_INDEX = 24 # offsets of header fields
+_SLOT_HEAD = 32
+FLAG_SYNC = 0b1
+FLAG_BANK = 0b10
+
+Slot = namedtuple('slot', 'seq, index, size, chan, sync, bank, spill, ts')
+
+_created = set() # names of buffers created by this process
+
+
+class OverrunError(Exception):
+	""" The writer has overwritten data before the reader got it. """
+
+
+def _require():
+	if shared_memory is None:
+		raise ImportError("multiprocessing.shared_memory is not available (Python 3.8+ is needed).")
+
+
+class ShmRingWriter(object):
+	""" Create a shared memory ring buffer.
+
+	Zero-copy: pass the writer itself to readout as a destination (push/index),
+	then commit(chan) publishes the data pushed so far as a slot. It also has
+	the chunk sink interface (next_spill/write_chunk/close) of ContainerWriter.
+	Don't use it with readout_groups(): pushes of several channels interleave there.
+	"""
+	def __init__(self, name, size = 256 * 1024 * 1024, nslots = 4096):
+		_require()
+		self.data_size = size
+		self.nslots = nslots
+		self.data_off = HEADER.size + nslots * SLOT.size
+		self.shm = shared_memory.SharedMemory(name = name, create = True, size = self.data_off + size)
+		self.buf = self.shm.buf
+		_created.add(self.shm._name)
+		HEADER.pack_into(self.buf, 0, MAGIC, size, nslots, 0, 0, 0)
+		self.index = 0 # bytes pushed in total
+		self.slot_head = 0
+		self.spill = 0
+		self._start = 0 # the index the current slot starts at
+		self._last = (0, 0) # data of the last slot
+
+	@property
+	def name(self):
+		return self.shm.name
+
+	def push(self, source):
+		count = len(source)
+		if self.index + count - self._start > self.data_size:
+			raise IndexError("Chunk doesn't fit to the ring buffer.")
+
+		end = self.index + count
+		HEADER_Q.pack_into(self.buf, _WRITE_INDEX, end) # reserve before overwriting
+		pos = self.index % self.data_size
+		first = min(count, self.data_size - pos)
+		off = self.data_off
+		self.buf[off + pos : off + pos + first] = source[:first]
+		if first < count:
+			self.buf[off : off + count - first] = source[first:]
+		self.index = end
+
+	def commit(self, chan, sync = True, bank = 0, ts = None):
+		""" Publish data pushed since the last commit as a slot. """
+		if ts is None:
+			ts = time.time()
+		seq = self.slot_head
+		flags = (FLAG_SYNC if sync else 0) | (FLAG_BANK if bank else 0)
+		SLOT.pack_into(self.buf, HEADER.size + (seq % self.nslots) * SLOT.size,
+				seq, self._start, self.index - self._start, chan, flags, self.spill, ts)
+		self.slot_head = seq + 1
+		HEADER_Q.pack_into(self.buf, _SLOT_HEAD, self.slot_head) # the last: readers may take the slot
+		self._last = (self._start, self.index)
+		self._start = self.index
+
+	def discard(self):
+		""" Drop data pushed since the last commit (a failed read). """
+		self.index = self._start
+
+	def last(self):
+		""" Data of the last committed slot: a memoryview, or bytes if it wraps around.
+		Valid until the writer pushes more data.
+		"""
+		start, end = self._last
+		pos = start % self.data_size
+		off = self.data_off
+		if pos + end - start <= self.data_size:
+			return self.buf[off + pos : off + pos + end - start]
+		first = self.data_size - pos
+		return bytes(self.buf[off + pos : off + self.data_size]) + bytes(self.buf[off : off + end - start - first])
+
+	def next_spill(self):
+		self.spill += 1
+		return self.spill
+
+	def write_chunk(self, chan, data, sync = True, bank = 0, ts = None):
+		self.push(data)
+		self.commit(chan, sync, bank, ts)
+
+	def close(self, unlink = True):
+		self.buf = None
+		self.shm.close()
+		if unlink:
+			self.shm.unlink()
+
+
+class ShmRingReader(object):
+	""" Attach to a ring buffer by name. Each reader has its own cursor.
+	start: 'latest' (only new slots) or 'oldest' (what is still in the buffer).
+	"""
+	def __init__(self, name, start = 'latest'):
+		_require()
+		try:
+			self.shm = shared_memory.SharedMemory(name = name, track = False) # Python 3.13+
+		except TypeError:
+			self.shm = shared_memory.SharedMemory(name = name)
+			if self.shm._name not in _created:
+				try: # don't let the resource tracker unlink the writer's memory on exit
+					from multiprocessing import resource_tracker
+					resource_tracker.unregister(self.shm._name, 'shared_memory')
+				except Exception:
+					pass
+		self.buf = self.shm.buf
+		magic, self.data_size, self.nslots, _, _, _ = HEADER.unpack_from(self.buf, 0)
+		if magic != MAGIC:
+			raise ValueError("Not a sis3316 ring buffer.")
+		self.data_off = HEADER.size + self.nslots * SLOT.size
+		self.overruns = 0 # slots lost
+
+		head = self._slot_head()
+		if start == 'oldest':
+			self.cursor = max(0, head - self.nslots)
+		else:
+			self.cursor = head
+
+	def _slot_head(self):
+		return HEADER_Q.unpack_from(self.buf, _SLOT_HEAD)[0]
+
+	def _write_index(self):
+		return HEADER_Q.unpack_from(self.buf, _WRITE_INDEX)[0]
+
+	def valid(self, slot):
+		""" The slot's data is not overwritten (yet). """
+		return self._write_index() <= slot.index + self.data_size
+
+	def _next_slot(self):
+		head = self._slot_head()
+		if self.cursor >= head:
+			return None
+		if head - self.cursor > self.nslots:
+			self.overruns += head - self.nslots - self.cursor
+			self.cursor = head - self.nslots
+
+		seq, index, size, chan, flags, spill, ts = SLOT.unpack_from(self.buf,
+				HEADER.size + (self.cursor % self.nslots) * SLOT.size)
+		if seq != self.cursor: # overwritten while we were reading
+			self.overruns += 1
+			self.cursor += 1
+			raise OverrunError
+		self.cursor += 1
+		return Slot(seq, index, size, chan, bool(flags & FLAG_SYNC), int(bool(flags & FLAG_BANK)), spill, ts)
+
+	def view(self, slot):
+		""" Zero-copy: a memoryview of slot's data, or two if it wraps around.
+		Check valid(slot) after using the data.
+		"""
+		pos = slot.index % self.data_size
+		off = self.data_off
+		first = min(slot.size, self.data_size - pos)
+		views = [self.buf[off + pos : off + pos + first]]
+		if first < slot.size:
+			views.append(self.buf[off : off + slot.size - first])
+		return views
+
+	def read(self, timeout = None, poll = 0.001):
+		""" Wait for the next slot. Returns (slot, bytes) or None on timeout.
+		Raises OverrunError if the data was overwritten (the reader is too slow).
+		"""
+		deadline = None if timeout is None else time.time() + timeout
+		while True:
+			slot = self._next_slot()
+			if slot is not None:
+				break
+			if deadline is not None and time.time() > deadline:
+				return None
+			time.sleep(poll)
+
+		if not self.valid(slot):
+			self.overruns += 1
+			raise OverrunError
+		data = b''.join(bytes(v) for v in self.view(slot))
+		if not self.valid(slot):
+			self.overruns += 1
+			raise OverrunError
+		return slot, data
+
+	def close(self):
+		self.buf = None
+		self.shm.close()
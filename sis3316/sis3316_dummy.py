@@ -20,11 +20,12 @@
 #
 from __future__ import print_function
 
-import device, fifo
+from . import device, fifo
 
 class Sis3316(device.Sis3316, fifo.Sis3316):
 	
 	# Do nothing. Just output reads/writes calls to console.
+	# To test the transport or readout without a board use emulator.py.
 	def read(self, addr):
 		print('>> addr:', hex(addr))
 		return 0
@@ -33,10 +34,11 @@ class Sis3316(device.Sis3316, fifo.Sis3316):
 		print('<< addr:', hex(addr), '\tval:', hex(val))
 	
 	def read_list(self, addrlist):
-		print('>> ', zip( map(hex, addrlist), [0]*len(addrlist)))
+		print('>> ', list(map(hex, addrlist)))
+		return [0] * len(addrlist)
 	
 	def write_list(self, addrlist, datalist):
-		print('<< ', zip(map(hex,addrlist), map(hex,datalist)))
+		print('<< ', list(zip(map(hex,addrlist), map(hex,datalist))))
 	
 	def _read_fifo(self, addr):
 		return 1
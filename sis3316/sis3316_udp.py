@@ -27,10 +27,10 @@ from random import randrange
 import time #FIXME
 from functools import wraps
 import re
-from numpy import uint8
+from threading import RLock
 
 from .common import Sis3316Except, sleep, usleep #FIXME
-from . import device, i2c, fifo, readout
+from . import device, i2c, fifo, readout, counters
 
 
 #link interface
@@ -64,7 +64,18 @@ def retry_on_timeout(f):
     return wrapper
 
 
-class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
+def link_locked(f):
+    """ Hold the link lock for the whole request, so that several threads
+    (i.e. readout and a health monitor) can share the same socket.
+    """
+    @wraps(f)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return f(self, *args, **kwargs)
+    return wrapper
+
+
+class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316, counters.Sis3316):
     """ A general implementation of sis3316 UPD-based protocol.
     """
     # Defaults:
@@ -74,16 +85,22 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
     jumbo = 9000         # set this to your ethernet's jumbo-frame size
     VME_FPGA_VERSION_IS_0008_OR_HIGHER = True # VME FPGA version V_3316-2008 and higher
 
-    def __init__ (self, host, port=5768):
+    def __init__ (self, host, port=5768, local_port=None):
+        """ local_port: UDP port to send from, `port' by default; 0 for any free port
+        (the device answers to the port a request came from), i.e. to talk to an
+        emulator on this host, which has taken `port' (see emulator.py).
+        """
         self.hostname = host
         self.address = (host, port)
         self.packet_identifier=0    # Unsigned char packet identifier for new VME FPGA access protocol
 
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.bind( ('', port ) )
+        sock.bind( ('', port if local_port is None else local_port) )
         sock.setblocking(0) #guarantee that recv will not block internally
         #sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) #avoid the TIME_WAIT issue #FIXME: it still relevant?
         self._sock = sock
+        self._lock = RLock() # one transaction on the link at a time (see monitor.py)
+        self.fifo_stats = dict.fromkeys(('requests', 'unordered', 'timeouts', 'setup_errors', 'cwnd', 'cwnd_min', 'write_requests'), 0)  # FIFO transfer counters (see telemetry.py)
         
         for parent in self.__class__.__bases__: # all parent classes
             parent.__init__(self)
@@ -300,10 +317,11 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
         """ Checks packet ID and increments to next packet number """
         if packetID != self.packet_identifier:
             raise self._PacketsLossExcept #TODO Send relisten command with (xEE) instead
-        self.packet_identifier = uint8(self.packet_identifier + 1)
+        self.packet_identifier = (self.packet_identifier + 1) & 0xFF # unsigned char
                 
 
 # ----------- Interface  ----------------------
+    @link_locked
     @retry_on_timeout
     def read(self, addr):
         """ Execute general read request with a single parameter. """
@@ -315,6 +333,7 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
             raise ValueError('Address {0} is wrong.'.format(hex(addr)))
         
     #@ In general it's not safe to retry write calls, so no retry_on_timeout here!
+    @link_locked
     def write(self, addr, word):
         if addr < 0x20:
             self._write_link(addr,word)
@@ -323,10 +342,11 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
         else:
             raise ValueError('Address 0x%X is wrong.' % addr)
     
+    @link_locked
     def read_list(self, addrlist):
         """ Read a sequence of addresses at once. """
         # Check addresses.
-        if any(addr/0x100000 for addr in addrlist): #any address is out of range
+        if any(addr//0x100000 for addr in addrlist): #any address is out of range
             raise ValueError('Some addresses are wrong.')
             
         if any(addr < 0x20 for addr in addrlist):
@@ -334,16 +354,17 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
         
         return retry_on_timeout(self.__class__._read_vme)(self,addrlist)
 
+    @link_locked
     def write_list(self, addrlist, datalist):
         """ Write to a sequence of addresses at once. """
         # Check addresses.
-        if not all(addr < 0x100000 for addr in addrlist):
-            raise ValueError('Address {0} is wrong.'.format(hex(addr)))
+        if any(addr//0x100000 for addr in addrlist): #any address is out of range
+            raise ValueError('Some addresses are wrong.')
             
-        if not all(addr < 0x20 for addr in addrlist):
+        if any(addr < 0x20 for addr in addrlist):
             raise NotImplementedError    #no sequential writes for link interface addresses.
             
-        return self._write_vme(self, addrlist, datalist) # In general it's not safe to retry write calls, so no retry_on_timeout here!
+        return self._write_vme(addrlist, datalist) # In general it's not safe to retry write calls, so no retry_on_timeout here!
 
 # ----------- FIFO stuff ----------------------
     def _ack_fifo_write(self, timeout = None):
@@ -358,8 +379,7 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
             if not self.VME_FPGA_VERSION_IS_0008_OR_HIGHER:
                 packet_sz_bytes = 2
             else:
-                packet_sz_bytes = 3
-                self._check_packetID( hex(chunk[1]) )
+                packet_sz_bytes = 3  # the packet identifier is checked by _unpack_from()
             
             if len(chunk) == packet_sz_bytes:
                 return chunk
@@ -373,6 +393,8 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
         Get responce to FIFO read request.
         Args:
             dest: an object which has a `push(smth)' method and an `index' property.
+                `smth' is a memoryview of the packet buffer, valid only during the call:
+                push() must copy it (see readout.destination).
             west_sz: estimated count of words in responce (to not to wait an extra timeout in the end).
         Returns:
             Nothing.
@@ -391,6 +413,7 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
 
         sock = self._sock
         tempbuf = bytearray(self.jumbo)
+        tempview = memoryview(tempbuf) # push without copying
         
         packet_idx=0
         bcount = 0
@@ -422,7 +445,7 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
             assert bcount <= best_sz, "The lenght of responce on FIFO-read request is %d bytes, but only %d bytes was expected." % (bcount, best_sz)
             assert bcount%4 == 0, "data length in packet is not power or 4: %d"%(bcount,)
             
-            dest.push(tempbuf[HEADER_SZ_B:packet_sz])
+            dest.push(tempview[HEADER_SZ_B:packet_sz])
             if bcount == best_sz:
                 return # we have got all we need, so not waiting an extra timeout
             
@@ -430,38 +453,47 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
         #~ print "<>timeout cnt %d, est %d" %(bcount, best_sz)
         raise self._TimeoutExcept
 
-    #~ def _write_fifo(self, addr, datalist):
-        #~ dlen = len(datalist)
-        #~ if dlen == 0:
-            #~ return
-            #~ 
-        #~ limit = FIFO_WRITE_LIMIT
-        #~ 
-        #~ for idx in range(0, dlen, limit):
-            #~ ilen = min(dlen-idx, limit)
-            #~ msg = b''.join(( b'\x31', self._pack('<HI%dI' % (ilen,), ilen-1, addr, *datalist[idx:idx+ilen] ), ))
-#~ 
-            #~ resp = self._msg_fifo(msg, 0, 2)[0]
-            #~ 
-            #~ try:
-                #~ hdr, stat = self._unpack_from('<BB',resp)
-                #~ if hdr != 0x31:
-                    #~ raise self._WrongResponceExcept
-                #~ self.__status_err_check(stat)
-                #~ 
-            #~ except struct_error:
-                #~ raise self._MalformedResponceExcept
+    def _write_fifo(self, addr, source):
+        """
+        Send data to FIFO: 0x31 requests of up to FIFO_WRITE_LIMIT words, each one acknowledged.
+        Args:
+            addr: FIFO address.
+            source: a bytes-like object, a whole number of words.
+        Raises:
+            _WrongResponceExcept, _TimeoutExcept
+        """
+        view = memoryview(source)
+        blen = len(view)
+        limit = FIFO_WRITE_LIMIT * 4
+        
+        for idx in range(0, blen, limit):
+            ilen = min(blen - idx, limit)
+            msg = b''.join(( b'\x31', self._pack('<HI', ilen//4 - 1, addr), view[idx:idx+ilen] ))
+            self._req(msg)
+            self.fifo_stats['write_requests'] += 1
+            resp = self._ack_fifo_write()
+            
+            try:
+                hdr, stat = self._unpack_from('<BB', resp)
+                if hdr != 0x31:
+                    raise self._WrongResponceExcept('The packet header is not 0x31')
+                self.__status_err_check(stat)
+                
+            except struct_error:
+                raise self._MalformedResponceExcept
 
 #---------------------------
 
 
 
+    @link_locked
     def read_fifo(self, dest, grp_no, mem_no, nwords, woffset=0):
         """
         Get data from ADC unit's DDR memory. 
         Readout is robust (retransmit on failure) and congestion-aware (adjusts an amount of data per request).
         Attrs:
-            dest: an object which has a `push(smth)' method and an `index' property.
+            dest: an object which has a `push(smth)' method and an `index' property,
+                push() must copy the data it gets (see readout.destination).
             grp_no: ADC group number.
             mem_no: memory unit number.
             nwords: number of words to read to dest.
@@ -479,10 +511,8 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
         wcwnd_max = wcwnd_limit//2
        
         
-        if 'jumbo_ena' in getattr(self,'flags'):
-            wmtu = 8192//4 
-        else:
-            wmtu = 1440//4
+        wmtu = self._fifo_wmtu()
+        stats = self.fifo_stats
         
         wfinished = 0
         binitial_index = dest.index
@@ -493,12 +523,14 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
                 self._fifo_transfer_read(grp_no, mem_no, woffset + wfinished)
                 
             except self._WrongResponceExcept: #some trash in socket
+                stats['setup_errors'] += 1
                 self.cleanup_socket()
                 #~ print "<< trash in socket"
                 sleep(self.default_timeout)
                 continue
                 
             except self._TimeoutExcept:
+                stats['setup_errors'] += 1
                 sleep(self.default_timeout)
                 continue #FIXME: Retry on timeout forever?!
             
@@ -511,6 +543,7 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
 
                     msg = b''.join(( b'\x30', self._pack('<HI', wnum-1, fifo_addr) ))
                     self._req(msg)
+                    stats['requests'] += 1
                     self._ack_fifo_read(dest, wnum) # <- exceptions are most probable here 
                     
                     if wcwnd_max > wcwnd: #recovery after congestion
@@ -520,12 +553,14 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
                         wcwnd = min(wcwnd_limit, wcwnd + wmtu + (wcwnd - wcwnd_max) ) 
                 
                 except self._UnorderedPacketExcept:
+                    stats['unordered'] += 1
                     # softfail: some packets accidentally dropped
                     # print ("UnorderedPacketExcept<< ", wcwnd)
                     break
                     
                 except self._TimeoutExcept:
                     # hardfail (network congestion)
+                    stats['timeouts'] += 1
                     wcwnd_max = wcwnd
                     wcwnd = wcwnd // 2 # Reduce window by 50%
                     # print ("TimeoutExcept<< ", wcwnd, '%0.3f%%'% (1.0 * wfinished/nwords  * 100,) , 'cwnd reduced')
@@ -537,15 +572,155 @@ class Sis3316(device.Sis3316, i2c.Sis3316, fifo.Sis3316, readout.Sis3316):
                     wfinished = bfinished//4
                 
             #end while
-            if wcwnd is 0:
+            stats['cwnd'] = wcwnd
+            stats['cwnd_min'] = min(stats['cwnd_min'] or wcwnd, wcwnd)
+            if wcwnd == 0:
                 raise self._TimeoutExcept("many")
         
         #end while
         self._fifo_transfer_reset(grp_no) #cleanup
         return wfinished
         
+    def _fifo_wmtu(self):
+        """ Payload of a single FIFO responce packet (words). """
+        if self._get_field(SIS3316_UDP_PROTOCOL_CONFIG, 4, 0b1): # jumbo_ena
+            return 8192//4 
+        else:
+            return 1440//4
+
+    @link_locked
+    def read_fifo_groups(self, jobs):
+        """
+        Read DDR memory of several ADC groups, interleaving FIFO requests between groups.
+        Transfer logic of all groups is set up at once, and a group which is being
+        recovered after a packet loss doesn't stop the others.
+        Attrs:
+            jobs: a list of (dest, grp_no, mem_no, nwords, woffset), see read_fifo().
+                Jobs of the same group are done one after another.
+        Returns:
+            A dict {grp_no: {'words', 'jobs', 'time', 'setups'}}, time is from
+            the start to the moment the group was done.
+        """
+        wcwnd_limit = FIFO_READ_LIMIT
+        wcwnd = wcwnd_limit//2
+        wcwnd_max = wcwnd_limit//2
+        wmtu = self._fifo_wmtu()
+        fstats = self.fifo_stats
+        
+        queues = {}
+        for job in jobs:
+            queues.setdefault(job[1], []).append(job)
+        
+        stats = dict((g, {'words': 0, 'jobs': 0, 'time': 0.0, 'setups': 0}) for g in queues)
+        active = {}    # grp_no: [dest, mem_no, nwords, woffset, wfinished, binitial_index]
+        setup = set()  # groups which need transfer logic setup
+        t0 = time.time()
+        
+        while queues or active:
+            for g in list(queues):    # start next jobs
+                if g not in active:
+                    dest, grp_no, mem_no, nwords, woffset = queues[g].pop(0)
+                    if not queues[g]:
+                        del queues[g]
+                    active[g] = [dest, mem_no, nwords, woffset, 0, dest.index]
+                    setup.add(g)
+            
+            if setup:
+                try:
+                    self._fifo_transfer_read_groups(dict(
+                        (g, (active[g][1], active[g][3] + active[g][4])) for g in setup))
+                    for g in setup:
+                        stats[g]['setups'] += 1
+                    setup.clear()
+                
+                except (self._WrongResponceExcept, self._TimeoutExcept):
+                    fstats['setup_errors'] += 1
+                    self.cleanup_socket()
+                    sleep(self.default_timeout)
+                    continue
+            
+            for g in sorted(active):    # a single request per group in turn
+                dest, mem_no, nwords, woffset, wfinished, binitial_index = active[g]
+                fifo_addr = SIS3316_FPGA_ADC_GRP_MEM_BASE + g * SIS3316_FPGA_ADC_GRP_MEM_OFFSET
+                
+                if wcwnd == 0: # the window is adjusted only after a request, so it can't recover
+                    raise self._TimeoutExcept("many")
+                
+                try:
+                    wnum = int(min(nwords - wfinished, FIFO_READ_LIMIT, wcwnd))
+                    msg = b''.join(( b'\x30', self._pack('<HI', wnum-1, fifo_addr) ))
+                    self._req(msg)
+                    fstats['requests'] += 1
+                    self._ack_fifo_read(dest, wnum)
+                    
+                    if wcwnd_max > wcwnd: #recovery after congestion
+                        wcwnd += (wcwnd_max - wcwnd)//2 
+                    else:    #probe new maximum
+                        wcwnd = min(wcwnd_limit, wcwnd + wmtu + (wcwnd - wcwnd_max) ) 
+                
+                except self._UnorderedPacketExcept:
+                    fstats['unordered'] += 1
+                    setup.add(g)
+                
+                except self._TimeoutExcept:
+                    fstats['timeouts'] += 1
+                    wcwnd_max = wcwnd
+                    wcwnd = wcwnd // 2
+                    setup.add(g)
+                
+                finally:
+                    bfinished = (dest.index - binitial_index)
+                    assert bfinished % 4 == 0, "Should read a four-byte words. %d, init %d" %(bfinished, binitial_index)
+                    active[g][4] = wfinished = bfinished//4
+                
+                if wfinished >= nwords:
+                    del active[g]
+                    setup.discard(g)
+                    self._fifo_transfer_reset(g) #cleanup
+                    stats[g]['words'] += wfinished
+                    stats[g]['jobs'] += 1
+                    stats[g]['time'] = time.time() - t0
+            
+            fstats['cwnd'] = wcwnd
+            fstats['cwnd_min'] = min(fstats['cwnd_min'] or wcwnd, wcwnd)
+            if wcwnd == 0:
+                raise self._TimeoutExcept("many")
+        
+        return stats
+
+    @link_locked
     def write_fifo(self, source, grp_no, mem_no, nwords, woffset=0):
-        pass
+        """
+        Write data to ADC unit's DDR memory.
+        The hardware writes in 64-word blocks, so `nwords' should be a multiple of 64.
+        Writes are not retried: a lost request or acknowledgement raises _TimeoutExcept.
+        Attrs:
+            source: a bytes-like object (bytes, bytearray, array, NumPy array...) with at least `nwords' words.
+            grp_no: ADC group number.
+            mem_no: memory unit number.
+            nwords: number of words to write.
+            woffset: index of the first word.
+        Returns:
+            Number of words.
+        """
+        if nwords % 64:
+            raise ValueError("can write only in 64-word (256-byte) chunks (hardware limitation)")
+        
+        view = memoryview(source).cast('B')
+        if len(view) < 4 * nwords:
+            raise ValueError("source has less than {0} words".format(nwords))
+        if not nwords:
+            return 0
+        
+        fifo_addr = SIS3316_FPGA_ADC_GRP_MEM_BASE + grp_no * SIS3316_FPGA_ADC_GRP_MEM_OFFSET
+        
+        self._fifo_transfer_reset(grp_no) #cleanup
+        self._fifo_transfer_write(grp_no, mem_no, woffset)
+        try:
+            self._write_fifo(fifo_addr, view[:4 * nwords])
+        finally:
+            self._fifo_transfer_reset(grp_no) #cleanup
+        return nwords
 
 # ----------- Exceptions ----------------------
 
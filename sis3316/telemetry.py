@@ -0,0 +1,200 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Per-spill readout telemetry: JSON lines and a Prometheus text file.
+
+import os
+import json
+import time
+
+from .common import *
+from .adc_unit.registers import SIS3316_ADC_GRP, ADDRESS_THRESHOLD_REG
+
+
+class SpillTelemetry(object):
+	""" Collect a record per spill and write it out.
+
+	Call begin() right after a bank swap, channel_done() after each channel
+	is read, end() when the spill is read. A record:
+		spill, ts (swap time), reason, bank (being read), swap_time (s),
+		bytes, drain_time (s), mbps (MB/s), dead_time (s, estimated),
+		channels: {chan: {bytes, drain_time, fill, threshold_fill}},
+		fifo: transport counters for the spill (requests, unordered,
+			timeouts, setup_errors) and cwnd, cwnd_min (words).
+	cwnd_min is the lowest window seen in the spill: the device's running
+	minimum if it went down during the spill, otherwise the lowest of the
+	windows sampled at begin(), channel_done() and end() (dev.fifo_stats is
+	not reset, other users of the device may keep their own records).
+	fill is relative to the channel's bank (MEM_BANK_SIZE), threshold_fill
+	to its group's addr_threshold (None if not set).
+	Dead time is the time taken by the swap itself, plus the time the channels
+	in `full' were full before the swap (estimated from their earlier fill rates).
+	With an OverflowMonitor report (see end()) the record also has
+	threshold_overrun and live (live time fraction per channel); without it
+	a channel is full if there's no room for another event (see bank_full()).
+	event_length: {chan: words} to not to read the config.
+	"""
+	def __init__(self, dev, path = None, prom_path = None, event_length = None):
+		self.dev = dev
+		self.event_length = dict(event_length or {})
+		self.path = path
+		self.prom_path = prom_path
+		self._f = open(path, 'a') if path else None
+		self.spill = 0
+		self.last = None # the last record
+		self.totals = {'spills': 0, 'bytes': 0, 'dead_time': 0.0, 'unordered': 0, 'timeouts': 0}
+
+		regs = [SIS3316_ADC_GRP(ADDRESS_THRESHOLD_REG, g) for g in range(0, const.CHAN_GRP_COUNT)]
+		self.thresholds = [4 * (val & 0xffFFFF) for val in dev.read_list(regs)] # bytes
+		self._prev_swap = None
+		self._fill_rates = {} # {chan: bank fraction per second}
+
+	def begin(self, bank, t_swap, t_swapped, reason = None):
+		""" bank: the new (armed) bank, t_swap/t_swapped: time before/after the swap. """
+		self.spill += 1
+		snap = self.dev.acq_snapshot()
+		fifo = self.dev.fifo_stats
+		self._fifo0 = dict(fifo)
+		self._cwnd_min = fifo['cwnd'] or None
+		self._t = time.time()
+		self._cur = {'spill': self.spill, 'ts': t_swap, 'reason': reason,
+			'bank': bank ^ 1, 'swap_time': t_swapped - t_swap,
+			'interval': t_swap - self._prev_swap if self._prev_swap else None,
+			'channels': {}}
+		self._prev = snap['prev']
+		self._prev_swap = t_swap
+
+	def channel_done(self, chan, nbytes, drain_time = None):
+		""" A channel is read. drain_time: seconds, since the previous call by default. """
+		now = time.time()
+		if drain_time is None:
+			drain_time = now - self._t
+		self._t = now
+		self._sample_cwnd()
+
+		thr = self.thresholds[chan // const.CHAN_PER_GRP]
+		prev = 4 * self._prev[chan]
+		self._cur['channels'][chan] = {'bytes': nbytes, 'drain_time': drain_time,
+			'fill': float(prev) / const.MEM_BANK_SIZE,
+			'threshold_fill': float(prev) / thr if thr else None}
+
+	def end(self, overflow = None):
+		""" Finish the record, write it out and return it.
+		overflow: OverflowMonitor.check() result for the spill, its full channels are used.
+		"""
+		rec = self._cur
+		chans = rec['channels']
+		fifo = self.dev.fifo_stats
+		rec['fifo'] = dict((k, fifo[k] - self._fifo0[k]) for k in ('requests', 'unordered', 'timeouts', 'setup_errors'))
+		rec['fifo']['cwnd'] = fifo['cwnd']
+		self._sample_cwnd()
+		if fifo['cwnd_min'] and fifo['cwnd_min'] != self._fifo0['cwnd_min']:
+			self._cwnd_min = fifo['cwnd_min'] # a new low of the device was in this spill
+		rec['fifo']['cwnd_min'] = self._cwnd_min or 0
+
+		rec['bytes'] = sum(c['bytes'] for c in chans.values())
+		rec['drain_time'] = time.time() - rec['ts'] - rec['swap_time']
+		rec['mbps'] = rec['bytes'] / 1024.0**2 / rec['drain_time'] if rec['drain_time'] > 0 else None
+
+		# a full bank: the channel was dead since it got full, the fill rate is from earlier spills
+		dead = 0.0
+		interval = rec['interval']
+		if overflow:
+			full = set(overflow['full'])
+			rec['threshold_overrun'] = overflow['threshold_overrun']
+			rec['live'] = overflow['live']
+		else:
+			full = set(ch for ch in chans if self._prev[ch] and bank_full(self._prev[ch], self._evlen(ch)))
+		rec['full'] = sorted(ch for ch in chans if ch in full)
+		for ch, c in chans.items():
+			if ch in full:
+				rate = self._fill_rates.get(ch)
+				if interval and rate:
+					dead = max(dead, interval - 1.0 / rate)
+			elif interval:
+				self._fill_rates[ch] = c['fill'] / interval
+		rec['dead_time'] = rec['swap_time'] + dead
+
+		self.totals['spills'] += 1
+		self.totals['bytes'] += rec['bytes']
+		self.totals['dead_time'] += rec['dead_time']
+		self.totals['unordered'] += rec['fifo']['unordered']
+		self.totals['timeouts'] += rec['fifo']['timeouts']
+		self.last = rec
+
+		if self._f:
+			self._f.write(json.dumps(rec, sort_keys = True) + '\n')
+			self._f.flush()
+		if self.prom_path:
+			self.write_prometheus(rec)
+		return rec
+
+	def _evlen(self, chan):
+		if chan not in self.event_length:
+			self.event_length[chan] = self.dev.channels[chan].event_length
+		return self.event_length[chan]
+
+	def _sample_cwnd(self):
+		cwnd = self.dev.fifo_stats['cwnd']
+		if cwnd:
+			self._cwnd_min = min(self._cwnd_min or cwnd, cwnd)
+
+	def write_prometheus(self, rec):
+		""" Node exporter textfile collector format. Written to a temporary file and renamed. """
+		lines = []
+		def metric(name, value, help_, type_ = 'gauge', labels = None):
+			if value is None:
+				return
+			if help_:
+				lines.append('# HELP sis3316_%s %s' % (name, help_))
+				lines.append('# TYPE sis3316_%s %s' % (name, type_))
+			lbl = '{%s}' % ','.join('%s="%s"' % kv for kv in sorted(labels.items())) if labels else ''
+			lines.append('sis3316_%s%s %s' % (name, lbl, repr(float(value))))
+
+		metric('spills_total', self.totals['spills'], 'Spills read.', 'counter')
+		metric('bytes_total', self.totals['bytes'], 'Bytes read.', 'counter')
+		metric('dead_time_seconds_total', self.totals['dead_time'], 'Estimated dead time.', 'counter')
+		metric('fifo_unordered_total', self.totals['unordered'], 'FIFO reads restarted on packet loss.', 'counter')
+		metric('fifo_timeouts_total', self.totals['timeouts'], 'FIFO read timeouts.', 'counter')
+		metric('spill_timestamp_seconds', rec['ts'], 'Time of the last bank swap.')
+		metric('spill_bytes', rec['bytes'], 'Bytes in the last spill.')
+		metric('spill_drain_seconds', rec['drain_time'], 'Time to read the last spill.')
+		metric('spill_mbps', rec['mbps'], 'Readout throughput of the last spill, MB/s.')
+		metric('fifo_cwnd_words', rec['fifo']['cwnd'], 'FIFO read congestion window.')
+		first = True
+		for chan, c in sorted(rec['channels'].items()):
+			metric('channel_fill', c['fill'], 'Bank fill fraction of the last spill.' if first else None,
+					labels = {'chan': chan})
+			first = False
+		first = True
+		for chan, live in sorted(rec.get('live', {}).items()):
+			metric('channel_live_fraction', live, 'Live time fraction (bank overflows excluded).' if first else None,
+					labels = {'chan': chan})
+			first = False
+
+		tmp = self.prom_path + '.tmp'
+		with open(tmp, 'w') as f:
+			f.write('\n'.join(lines) + '\n')
+		os.rename(tmp, self.prom_path)
+
+	def close(self):
+		if self._f:
+			self._f.close()
+			self._f = None
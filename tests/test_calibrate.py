@@ -0,0 +1,98 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# DAC offset calibration with a stubbed acquisition: baseline = a line of the offset, clipped.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sis3316 import calibrate
+from sis3316.calibrate import dac_calibrate, ADC_MAX
+
+
+class Group(object):
+    def __init__(self, idx):
+        self.idx = idx
+        self.raw_window = 64
+        self.maw_window = 0
+
+
+class Channel(object):
+    def __init__(self, group, offset):
+        self.group = group
+        self.flags = []
+        self.event_maw_ena = 0
+        self.dac_offset = offset
+
+
+class Board(object):
+    """ Just what software_trigger() and dac_calibrate() use. """
+    def __init__(self, offsets):
+        self.flags = []
+        self.groups = [Group(g) for g in range(0, 4)]
+        self.channels = [Channel(self.groups[i // 4], offsets.get(i, 0x8000)) for i in range(0, 16)]
+
+    def disarm(self):
+        pass
+
+
+class TestDacCalibrate(unittest.TestCase):
+    def setUp(self):
+        self.saved = calibrate.acquire, calibrate.sample_stats, calibrate.msleep
+        calibrate.acquire = self.acquire
+        calibrate.sample_stats = lambda baseline, maw_words = 0: (baseline, 1.0, 1000)
+        calibrate.msleep = lambda ms: None
+
+    def tearDown(self):
+        calibrate.acquire, calibrate.sample_stats, calibrate.msleep = self.saved
+
+    def acquire(self, dev, chanlist, nevents = 16):
+        """ {chan: baseline} instead of the events: `gain' ADC counts per DAC count, 0 at `zero'. """
+        return dict((idx, min(ADC_MAX, max(0.0, self.gain * (dev.channels[idx].dac_offset - self.zero))))
+                for idx in chanlist)
+
+    def calibrate(self, zero, start, target = 1000, gain = 0.25):
+        self.zero, self.gain = zero, gain
+        dev = Board({0: start})
+        res = dac_calibrate(dev, target, chanlist = [0])[0]
+        self.assertTrue(res['converged'], res)
+        self.assertLessEqual(abs(res['baseline'] - target), 2.0)
+        self.assertEqual(dev.channels[0].dac_offset, res['offset'])
+        return res
+
+    def test_linear(self):
+        self.calibrate(zero = 0x6000, start = 0x8000)
+
+    def test_clipped_low(self):
+        # clipped at 0, the first step of the unknown slope (down from 0x8000) goes the wrong way
+        self.calibrate(zero = 0xC000, start = 0x8000)
+
+    def test_clipped_high(self):
+        # clipped at ADC_MAX, the first step (up from below 0x8000) goes the wrong way
+        self.calibrate(zero = 0x2000, start = 0x7000, gain = 1.0)
+
+    def test_clipped_far(self):
+        self.calibrate(zero = 0xF000, start = 0x0000, target = 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
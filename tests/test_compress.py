@@ -0,0 +1,129 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Codecs and the block stream of compress.py.
+
+import io
+import os
+import sys
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sis3316 import compress
+from sis3316.compress import CODECS, BLOCK_HEADER, compress_block, iter_blocks, CompressedWriter, \
+        bitpack_encode, bitpack_decode
+from sis3316.emulator import Emulator
+from sis3316.adc_unit.registers import SIS3316_ADC_GRP, RAW_DATA_BUFFER_CONFIG_REG
+
+
+def emulator_data(raw_window, nevents = 500):
+    """ A channel's bank of emulator events (pulses on a noisy baseline). """
+    emu = Emulator(seed = 1, amplitude = 500)
+    try:
+        emu.write(SIS3316_ADC_GRP(RAW_DATA_BUFFER_CONFIG_REG, 0), raw_window << 16)
+        emu._arm(0)
+        emu._append_events(0, time.time(), 1.0, nevents)
+        return emu._mem_read(0, 0, 0, emu.fill[0])
+    finally:
+        emu.close()
+
+
+def without_numpy(func, *args):
+    saved = sys.modules.get('numpy')
+    sys.modules['numpy'] = None # import fails
+    try:
+        return func(*args)
+    finally:
+        if saved is None:
+            del sys.modules['numpy']
+        else:
+            sys.modules['numpy'] = saved
+
+
+class TestCodecs(unittest.TestCase):
+
+    def setUp(self):
+        self.samples = emulator_data(100)
+        self.samples_odd = self.samples[:2 * 1001] # not a whole number of frames
+        self.headers = emulator_data(0) # events without samples
+        self.noise = os.urandom(10000)
+
+    def roundtrip(self, codec, data):
+        block, cpu = compress_block(data, codec)
+        self.assertEqual(b''.join(iter_blocks(io.BytesIO(block))), data)
+        return len(block) - BLOCK_HEADER.size
+
+    def test_roundtrip(self):
+        for codec in sorted(CODECS):
+            for data in (b'', self.samples, self.samples_odd, self.headers, self.noise):
+                self.roundtrip(codec, data)
+
+    def test_ratio(self):
+        # raw samples compress with every codec
+        for codec in sorted(CODECS):
+            size = self.roundtrip(codec, self.samples)
+            self.assertLess(size * 2, len(self.samples), codec)
+
+    def test_bitpack_not_bigger(self):
+        for data in (self.headers, self.noise):
+            self.assertLessEqual(len(bitpack_encode(data)), len(data) + compress.BITPACK_HEADER.size)
+        self.assertTrue(compress.BITPACK_HEADER.unpack_from(bitpack_encode(self.noise))[0] & compress.BITPACK_STORED)
+
+    def test_bitpack_without_numpy(self):
+        for data in (self.samples_odd, self.headers[:4000], self.noise):
+            packed = bitpack_encode(data)
+            self.assertEqual(without_numpy(bitpack_encode, data), packed)
+            self.assertEqual(without_numpy(bitpack_decode, packed), data)
+
+    def test_delta_without_numpy(self):
+        delta = compress.delta_encode(self.samples_odd)
+        self.assertEqual(without_numpy(compress.delta_encode, self.samples_odd), delta)
+        self.assertEqual(without_numpy(compress.delta_decode, delta), self.samples_odd)
+
+    def test_odd_length(self):
+        for codec in ('delta', 'bitpack'):
+            self.assertRaises(ValueError, compress_block, b'abc', codec)
+
+
+class KeptBytesIO(io.BytesIO):
+    def close(self):
+        pass # keep the data, CompressedWriter closes its file
+
+
+class TestCompressedWriter(unittest.TestCase):
+
+    def test_blocks(self):
+        data = emulator_data(100, 2000)
+        out = KeptBytesIO()
+        with ThreadPoolExecutor(2) as executor:
+            writer = CompressedWriter(out, executor, 'zlib', block_size = 64 * 1024)
+            for pos in range(0, len(data), 10000):
+                writer.write(data[pos : pos + 10000])
+            writer.close()
+        self.assertEqual(writer.raw_bytes, len(data))
+        blocks = list(iter_blocks(io.BytesIO(out.getvalue())))
+        self.assertEqual(len(blocks), -(-len(data) // (64 * 1024)))
+        self.assertEqual(b''.join(blocks), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# The container of container.py: writing, the index and rebuilding it.
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sis3316.container import ContainerWriter, ContainerReader, FormatError, TRAILER, INDEX_BLOCK, INDEX_ENTRY
+
+
+class KeptBytesIO(io.BytesIO):
+    """ BytesIO which a reader can't close. """
+    def close(self):
+        pass
+
+
+def chunk(spill, chan, nwords = 100):
+    return bytes(bytearray([spill & 0xFF, chan]) * (2 * nwords))
+
+
+def write_container(spills = 5, chans = (0, 3, 15), **kwargs):
+    f = KeptBytesIO()
+    writer = ContainerWriter(f, **kwargs)
+    for spill in range(1, spills + 1):
+        writer.next_spill()
+        for n, ch in enumerate(chans):
+            writer.write_chunk(ch, chunk(spill, ch), sync = n % 2 == 0, bank = spill % 2, ts = 1000.0 + spill)
+    return f, writer
+
+
+class TestContainer(unittest.TestCase):
+
+    def check(self, reader, spills = 5, chans = (0, 3, 15)):
+        self.assertEqual(reader.spills, list(range(1, spills + 1)))
+        self.assertEqual(reader.channels, sorted(chans))
+        self.assertEqual(len(reader.entries), spills * len(chans))
+        for e in reader.entries:
+            self.assertEqual(reader.read(e), chunk(e.spill, e.chan))
+            self.assertEqual(e.bank, e.spill % 2)
+            self.assertEqual(e.ts, 1000.0 + e.spill)
+        self.assertEqual([e.sync for e in reader.select(spill = 2)], [True, False, True])
+        self.assertEqual([e.spill for e in reader.select(chan = 3)], list(range(1, spills + 1)))
+
+    def test_index(self):
+        f, writer = write_container()
+        writer.close()
+        reader = ContainerReader(f)
+        self.assertIsNotNone(reader._load_index())
+        self.check(reader)
+
+    def test_index_blocks(self):
+        f, writer = write_container(index_block = 4)
+        self.assertEqual(len(writer.entries), 15 % 4) # the rest is on disk
+        writer.close()
+        self.assertEqual(f.getvalue().count(b'SIXB'), 4)
+        reader = ContainerReader(f)
+        self.assertIsNotNone(reader._load_index())
+        self.check(reader)
+
+    def test_empty(self):
+        f = KeptBytesIO()
+        ContainerWriter(f).close()
+        reader = ContainerReader(f)
+        self.assertEqual(reader.entries, [])
+        self.assertEqual(reader._load_index(), [])
+
+    def test_not_closed(self):
+        f, writer = write_container(index_block = 4)
+        f.write(b'\xAA' * 50) # a chunk being written
+        reader = ContainerReader(f)
+        self.assertIsNone(reader._load_index())
+        self.check(reader)
+
+    def test_broken_trailer(self):
+        f, writer = write_container(index_block = 4)
+        writer.close()
+        data = bytearray(f.getvalue())
+        data[-TRAILER.size - 3 * INDEX_ENTRY.size - INDEX_BLOCK.size] ^= 0xFF # the last index block, 3 entries
+        reader = ContainerReader(KeptBytesIO(bytes(data)))
+        self.assertIsNone(reader._load_index())
+        self.check(reader)
+
+    def test_format_error(self):
+        self.assertRaises(FormatError, ContainerReader, io.BytesIO(b'SIS'))
+        self.assertRaises(FormatError, ContainerReader, io.BytesIO(b'\0' * 100))
+
+    def test_chunk_size(self):
+        f, writer = write_container(1)
+        self.assertRaises(ValueError, writer.write_chunk, 0, b'\0' * 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# The transport and the readout against the emulator (sis3316/emulator.py).
+# Run: python -m pytest tests  (or python -m unittest discover tests)
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sis3316 import Sis3316_udp, RingBuffer
+from sis3316.common import const
+from sis3316.emulator import Emulator
+from sis3316.memtest import pattern
+from sis3316.readout import destination
+from sis3316.registers import SIS3316_MODID, SIS3316_SERIAL_NUMBER_REG
+from sis3316.adc_unit.registers import SIS3316_ADC_GRP, PRE_TRIGGER_DELAY_REG, ADDRESS_THRESHOLD_REG
+from sis3316.scheduler import RoundRobin
+
+CHANNELS = [0, 1, 5, 10, 15]
+
+
+class EmulatorCase(unittest.TestCase):
+    emulator_args = {}
+
+    def setUp(self):
+        self.emu = Emulator(seed = 1, **self.emulator_args).start()
+        self.dev = Sis3316_udp('127.0.0.1', self.emu.port, local_port = 0)
+        self.dev.open()
+
+    def tearDown(self):
+        self.emu.close()
+        self.dev._sock.close()
+
+    def bank_data(self, chan, bank, nwords):
+        """ What the emulator has in a channel's bank. """
+        grp_no, cid = divmod(chan, const.CHAN_PER_GRP)
+        return self.emu._mem_read(grp_no, cid // 2, bank << 24 | (cid & 0b1) << 25, nwords)
+
+    def acquire(self, seconds = 0.2):
+        """ Take events in a bank, swap. Returns the bank to read. """
+        self.dev.disarm()
+        self.dev.arm(0)
+        time.sleep(seconds)
+        return self.dev.mem_toggle() ^ 1
+
+
+class TestLink(EmulatorCase):
+
+    def test_open(self):
+        self.assertEqual(self.dev.read(SIS3316_MODID), Emulator.modid)
+        self.assertEqual(self.dev.serno, Emulator.serno)
+        self.assertTrue(self.emu.grant)
+
+    def test_read_write_list(self):
+        addrs = [SIS3316_ADC_GRP(PRE_TRIGGER_DELAY_REG, g) for g in range(0, const.CHAN_GRP_COUNT)] \
+                + [SIS3316_ADC_GRP(ADDRESS_THRESHOLD_REG, g) for g in range(0, const.CHAN_GRP_COUNT)]
+        values = [0x100 + n for n in range(0, len(addrs))]
+        self.dev.write_list(addrs, values)
+        self.assertEqual(list(self.dev.read_list(addrs)), values)
+        self.assertEqual(list(self.dev.read_list([SIS3316_SERIAL_NUMBER_REG])), [Emulator.serno])
+
+
+class TestFifo(EmulatorCase):
+    nwords = 1 << 16
+
+    def test_write_fifo_loopback(self):
+        data = pattern('counter', self.nwords)
+        self.assertEqual(self.dev.write_fifo(data, 1, 1, self.nwords, 0x100), self.nwords)
+        out = bytearray(4 * self.nwords)
+        self.assertEqual(self.dev.read_fifo(destination(out), 1, 1, self.nwords, 0x100), self.nwords)
+        self.assertEqual(out, data)
+
+
+class TestFifoFaults(EmulatorCase):
+    emulator_args = {'loss': 0.02, 'reorder': 0.05}
+    nwords = 1 << 18
+
+    def test_read_fifo(self):
+        data = pattern('random', self.nwords)
+        self.emu.loss = 0.0 # writes are not retried
+        self.dev.write_fifo(data, 2, 0, self.nwords, 0)
+        self.emu.loss = self.emulator_args['loss']
+
+        out = bytearray(4 * self.nwords)
+        self.assertEqual(self.dev.read_fifo(destination(out), 2, 0, self.nwords, 0), self.nwords)
+        self.assertEqual(out, data)
+        self.assertTrue(self.emu.stats['dropped'])
+        self.assertTrue(self.emu.stats['reordered'])
+        self.assertTrue(self.dev.fifo_stats['unordered'])
+
+
+class TestReadout(EmulatorCase):
+    emulator_args = {'rate': 2000}
+
+    def check(self, chan, bank, words, data):
+        prev = self.dev.channels[chan].addr_prev
+        self.assertTrue(prev)
+        self.assertEqual(words, prev)
+        self.assertEqual(bytes(data), self.bank_data(chan, bank, prev))
+
+    def test_readout_groups(self):
+        bank = self.acquire()
+        dests = [(ch, RingBuffer(1024, grow = True)) for ch in CHANNELS]
+        words, groups = self.dev.readout_groups(dests)
+        self.assertEqual(sorted(groups), sorted(set(ch // const.CHAN_PER_GRP for ch in CHANNELS)))
+        for ch, buf in dests:
+            self.check(ch, bank, words[ch], buf.read())
+
+    def test_readout_scheduled(self):
+        bank = self.acquire()
+        dests = [(ch, RingBuffer(1024, grow = True)) for ch in CHANNELS]
+        opts = {'chunk_size': 1024, 'align_events': True}
+        words = dict.fromkeys(CHANNELS, 0)
+        data = dict((ch, bytearray()) for ch in CHANNELS)
+        bufs = dict(dests)
+        order = []
+        for ch, ret in self.dev.readout_scheduled(dests, RoundRobin(), 0, opts):
+            self.assertTrue(ret['sync'])
+            words[ch] += ret['transfered']
+            data[ch] += bufs[ch].read()
+            order.append(ch)
+        self.assertEqual(order[:len(CHANNELS)], CHANNELS) # a chunk of each channel in turn
+        for ch in CHANNELS:
+            self.check(ch, bank, words[ch], data[ch])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Event boundaries in raw channel data (events.py).
+
+import os
+import sys
+import time
+import unittest
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sis3316.adc_unit.channel import event_words
+from sis3316.adc_unit.registers import SIS3316_ADC_GRP, RAW_DATA_BUFFER_CONFIG_REG, \
+        DATAFORMAT_CONFIG_REG, MAW_TEST_BUFFER_CONFIG_REG
+from sis3316.emulator import Emulator
+from sis3316.events import header_words, event_info, iter_events
+
+
+def event(format_mask = 0, nraw = 4, navg = None, maw_words = 0):
+    """ An event as the device writes it: headers, 0xE (or 0xA + 0xE), samples, MAW values. """
+    words = [format_mask, 0] + [0] * (header_words(format_mask) - 2)
+    if navg is None:
+        words.append(0xE << 28 | (1 << 27 if maw_words else 0) | nraw // 2)
+    else:
+        words.append(0xA << 28 | (1 << 27 if maw_words else 0) | nraw // 2)
+        words.append(0xE << 28 | navg // 2)
+    words += [0x1234] * ((nraw + (navg or 0)) // 2 + maw_words)
+    return array('I', words).tobytes()
+
+
+class TestEvents(unittest.TestCase):
+
+    def test_header_words(self):
+        self.assertEqual(header_words(0), 2)
+        self.assertEqual(header_words(0b1111), 2 + 14)
+
+    def test_event_info(self):
+        data = event(0b101, nraw = 10)
+        self.assertEqual(event_info(data, 0), (len(data), 4 * (2 + 10 + 1), 10))
+        self.assertEqual(len(data), 4 * event_words(0b101, 10))
+
+    def test_average(self):
+        data = event(0, nraw = 6, navg = 20)
+        self.assertEqual(event_info(data, 0), (len(data), 4 * 4, 6))
+
+    def test_maw(self):
+        data = event(0b1, nraw = 8, maw_words = 30)
+        self.assertEqual(event_info(data, 0, maw_words = 30)[0], len(data))
+        self.assertEqual(len(data), 4 * event_words(0b1, 8, 30, True))
+
+    def test_iter_events(self):
+        events = [event(0, 4), event(0b1, 100), event(0b1111, 0), event(0, 2, navg = 4)]
+        data = b''.join(events)
+        found = list(iter_events(data))
+        self.assertEqual([length for pos, length, rpos, nraw in found], [len(e) for e in events])
+        self.assertEqual([pos for pos, length, rpos, nraw in found],
+                [sum(len(e) for e in events[:n]) for n in range(0, len(events))])
+        self.assertEqual([nraw for pos, length, rpos, nraw in found], [4, 100, 0, 2])
+
+    def test_truncated(self):
+        data = event(0, 4) + event(0b1, 100)
+        for cut in (1, 4, 40, 100):
+            self.assertEqual(len(list(iter_events(data[:-cut]))), 1)
+            self.assertRaises(EOFError, event_info, data[:-cut], len(event(0, 4)))
+
+    def test_garbage(self):
+        data = event(0, 4) + b'\0' * 64
+        self.assertRaises(ValueError, list, iter_events(data))
+        data = event(0, 4, navg = 4)
+        data = data[:12] + b'\0' * 4 + data[16:] # no 0xE after 0xA
+        self.assertRaises(ValueError, event_info, data, 0)
+
+    def test_emulator(self):
+        """ Events of every format the emulator writes have the length event_words() gives. """
+        for mask, maw_ena in ((0, False), (0b1, False), (0b1011, True), (0b1111, True)):
+            emu = Emulator(seed = 1)
+            try:
+                emu.write(SIS3316_ADC_GRP(RAW_DATA_BUFFER_CONFIG_REG, 0), 64 << 16)
+                emu.write(SIS3316_ADC_GRP(MAW_TEST_BUFFER_CONFIG_REG, 0), 24)
+                emu.write(SIS3316_ADC_GRP(DATAFORMAT_CONFIG_REG, 0), (mask | maw_ena << 4) << 8) # channel 1
+                emu._arm(0)
+                emu._append_events(1, time.time(), 1.0, 20)
+                data = emu._mem_read(0, 0, 1 << 25, emu.fill[1])
+            finally:
+                emu.close()
+            evlen = 4 * event_words(mask, 64, 24, maw_ena)
+            found = list(iter_events(data, maw_words = 24))
+            self.assertEqual(len(found), 20)
+            self.assertEqual(set(length for pos, length, rpos, nraw in found), set([evlen]))
+            self.assertEqual(set(nraw for pos, length, rpos, nraw in found), set([64]))
+
+
+if __name__ == '__main__':
+    unittest.main()
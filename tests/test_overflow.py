@@ -0,0 +1,207 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Full banks: detection and lost time (overflow.py), accounting in the telemetry (telemetry.py).
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from struct import pack
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sis3316.common import const, bank_full
+from sis3316.overflow import OverflowMonitor
+from sis3316.telemetry import SpillTelemetry
+
+EVLEN = 100 # words
+FULL = const.CHAN_BANK_WORDS // EVLEN * EVLEN # no room for another event
+CLOCK = 250 # MHz
+
+
+class Channel(object):
+    def __init__(self, dev, idx):
+        self.dev = dev
+        self.idx = idx
+        self.event_length = EVLEN
+
+    def bank_read(self, bank, dest, nwords, woffset):
+        """ The two timestamp words of an event. """
+        ts = self.dev.timestamps[(self.idx, woffset)]
+        dest.push(pack('<II', (ts >> 32) << 16 | self.idx << 4, ts & 0xFFFFFFFF))
+
+
+class FakeDev(object):
+    """ Addresses of the previous bank and event timestamps, set by a test. """
+    freq = CLOCK
+
+    def __init__(self, threshold = 0):
+        self.channels = [Channel(self, idx) for idx in range(0, const.CHAN_TOTAL)]
+        self.threshold = threshold
+        self.bank = 0
+        self.prev = [0] * const.CHAN_TOTAL
+        self.timestamps = {} # {(chan, woffset): ts}
+        self.fifo_stats = {'requests': 0, 'unordered': 0, 'timeouts': 0, 'setup_errors': 0,
+                'cwnd': 0, 'cwnd_min': 0}
+
+    def read_list(self, addrs):
+        return [self.threshold] * len(addrs)
+
+    def acq_snapshot(self):
+        return {'prev_bank': self.bank, 'prev': list(self.prev)}
+
+    def spill(self, words, first = None, last = None):
+        """ Swap banks, {chan: words} in the previous one, first/last: {chan: event timestamp}. """
+        self.bank ^= 1
+        self.prev = [words.get(chan, 0) for chan in range(0, const.CHAN_TOTAL)]
+        self.timestamps = {}
+        for chan, ts in (first or {}).items():
+            self.timestamps[(chan, 0)] = ts
+        for chan, ts in (last or {}).items():
+            self.timestamps[(chan, words[chan] - EVLEN)] = ts
+
+
+class TestBankFull(unittest.TestCase):
+
+    def test_bank_full(self):
+        self.assertFalse(bank_full(const.CHAN_BANK_WORDS - EVLEN, EVLEN))
+        self.assertTrue(bank_full(const.CHAN_BANK_WORDS - EVLEN + 1, EVLEN))
+        self.assertTrue(bank_full(FULL, EVLEN))
+        self.assertFalse(bank_full(0, EVLEN))
+
+
+class TestOverflow(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.dir, 'lost.log')
+        self.dev = FakeDev()
+        self.mon = OverflowMonitor(self.dev, self.log, channels = [0, 3, 7])
+
+    def tearDown(self):
+        self.mon.close()
+        shutil.rmtree(self.dir)
+
+    def records(self):
+        with open(self.log) as f:
+            return [json.loads(line) for line in f]
+
+    def test_lost_time(self):
+        self.dev.spill({0: 300, 3: FULL}, first = {0: 0, 3: 1000}, last = {3: 5000})
+        report = self.mon.check(100.0)
+        self.assertEqual(report['full'], [3])
+        self.assertEqual(report['closed'], [])
+        self.assertEqual(self.mon.overflows, {0: 0, 3: 1, 7: 0})
+        self.assertEqual(self.mon.pending[3]['last_ts'], 5000)
+
+        self.dev.spill({0: 300, 3: 200}, first = {0: 0, 3: 5000 + CLOCK * 10**5}) # 0.1 s later
+        report = self.mon.check(101.0)
+        self.assertEqual(report['full'], [])
+        self.assertEqual(len(report['closed']), 1)
+        self.assertAlmostEqual(report['closed'][0]['lost'], 0.1)
+        self.assertAlmostEqual(report['live'][3], 0.9)
+        self.assertEqual(report['live'][0], 1.0)
+        self.assertEqual(self.mon.pending, {})
+
+        rec = self.records()[0]
+        self.assertEqual((rec['spill'], rec['chan'], rec['first_ts'], rec['lost_from'], rec['lost_to']),
+                (1, 3, 1000, 5000, 5000 + CLOCK * 10**5))
+
+    def test_timestamp_wrap(self):
+        self.dev.spill({3: FULL}, first = {3: 0}, last = {3: (1 << 48) - CLOCK * 10**4})
+        self.mon.check(100.0)
+        self.dev.spill({3: 200}, first = {3: CLOCK * 10**4})
+        report = self.mon.check(101.0)
+        self.assertAlmostEqual(report['closed'][0]['lost'], 0.02)
+
+    def test_not_whole_events(self):
+        self.dev.spill({3: const.CHAN_BANK_WORDS - 10}, first = {3: 0})
+        report = self.mon.check(100.0)
+        self.assertEqual(report['full'], [3])
+        self.assertEqual(self.mon.pending[3]['lost_from'], None)
+        self.mon.close()
+        self.assertEqual([(rec['chan'], rec['lost']) for rec in self.records()], [(3, None)])
+
+    def test_room_for_one_more(self):
+        self.dev.spill({3: const.CHAN_BANK_WORDS - EVLEN}, first = {3: 0})
+        self.assertEqual(self.mon.check(100.0)['full'], [])
+
+    def test_threshold(self):
+        self.dev = FakeDev(threshold = 1000)
+        mon = OverflowMonitor(self.dev, channels = [0, 3])
+        self.dev.spill({0: 300, 3: 1200})
+        self.assertEqual(mon.check(100.0)['over_threshold'], [3])
+        self.assertEqual(mon.thresholds, [1000] * const.CHAN_GRP_COUNT)
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def spill(self, tel, t_swap, words, overflow = None):
+        tel.begin(self.dev.bank ^ 1, t_swap, t_swap + 0.01, 'fill')
+        for chan in sorted(words):
+            tel.channel_done(chan, 4 * words[chan], 0.1)
+        return tel.end(overflow)
+
+    def setUp(self):
+        self.dev = FakeDev()
+
+    def test_full(self):
+        tel = SpillTelemetry(self.dev)
+        words = {0: 300, 3: FULL, 5: const.CHAN_BANK_WORDS - EVLEN, 7: const.CHAN_BANK_WORDS - 10}
+        self.dev.spill(words)
+        rec = self.spill(tel, 100.0, words)
+        self.assertEqual(rec['full'], [3, 7])
+        self.assertEqual(rec['channels'][3]['fill'], 4.0 * FULL / const.MEM_BANK_SIZE)
+        self.assertEqual(rec['bytes'], 4 * sum(words.values()))
+
+    def test_same_as_overflow(self):
+        """ Without a report the telemetry finds the same full banks as an OverflowMonitor. """
+        words = {0: 300, 3: FULL, 5: const.CHAN_BANK_WORDS - EVLEN, 7: const.CHAN_BANK_WORDS - 10}
+        self.dev.spill(words, first = dict.fromkeys(words, 0), last = {3: 0})
+        mon = OverflowMonitor(self.dev, channels = sorted(words))
+        rec = self.spill(SpillTelemetry(self.dev, event_length = dict.fromkeys(words, EVLEN)), 100.0, words)
+        self.assertEqual(rec['full'], mon.check(100.0)['full'])
+
+    def test_overflow_report(self):
+        tel = SpillTelemetry(self.dev)
+        self.dev.spill({0: 300, 3: 300})
+        report = {'full': [0], 'threshold_overrun': True, 'live': {0: 0.5, 3: 1.0}}
+        rec = self.spill(tel, 100.0, {0: 300, 3: 300}, report)
+        self.assertEqual(rec['full'], [0]) # the report's, not the addresses
+        self.assertEqual(rec['live'], {0: 0.5, 3: 1.0})
+        self.assertTrue(rec['threshold_overrun'])
+
+    def test_dead_time(self):
+        """ A full bank was dead since it got full, at the fill rate of the earlier spills. """
+        tel = SpillTelemetry(self.dev)
+        quarter = const.CHAN_BANK_WORDS // 4
+        for t_swap, words in ((100.0, quarter), (101.0, quarter), (107.0, FULL)):
+            self.dev.spill({3: words})
+            rec = self.spill(tel, t_swap, {3: words})
+        self.assertEqual(rec['full'], [3])
+        # a quarter of the bank in 1 s: full in 4 s, dead for the other 2 s of the 6 s interval
+        self.assertAlmostEqual(rec['dead_time'], 0.01 + 2.0)
+        self.assertAlmostEqual(tel.totals['dead_time'], 3 * 0.01 + 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
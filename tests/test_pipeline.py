@@ -0,0 +1,103 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# The writer thread of pipeline.py and short writes to raw files.
+
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sis3316.pipeline import Pipeline
+from sis3316.readout import destination, write_all
+
+
+class ShortWrites(io.RawIOBase):
+    """ A raw file which takes at most `limit' bytes per write(), like a pipe or a socket. """
+    def __init__(self, limit = 1000):
+        self.limit = limit
+        self.data = bytearray()
+        self.calls = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.calls += 1
+        count = min(len(data), self.limit)
+        self.data += memoryview(data)[:count]
+        return count
+
+
+class TestShortWrites(unittest.TestCase):
+    data = bytes(bytearray(range(0, 256))) * 40
+
+    def test_write_all(self):
+        f = ShortWrites()
+        write_all(f, self.data)
+        self.assertEqual(f.data, self.data)
+        self.assertEqual(f.calls, 11)
+
+    def test_destination(self):
+        f = ShortWrites()
+        dest = destination(f)
+        dest.push(memoryview(self.data))
+        self.assertEqual(f.data, self.data)
+        self.assertEqual(dest.index, len(self.data))
+
+    def test_pipeline(self):
+        files = {0: ShortWrites(), 1: ShortWrites(333)}
+        pipeline = Pipeline(files, nbuffers = 2, bufsize = 4096)
+        for n in range(0, 3):
+            for key in files:
+                pipeline.destination(key).push(self.data)
+        pipeline.close()
+        for f in files.values():
+            self.assertEqual(f.data, self.data * 3)
+        self.assertEqual(pipeline.stats()['bytes'], 2 * 3 * len(self.data))
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_error(self):
+        f = io.BytesIO()
+        pipeline = Pipeline({0: f}, nbuffers = 2, bufsize = 16)
+        f.close()
+        dest = pipeline.destination(0)
+        dest.push(b'\0' * 16)
+        self.assertRaises(ValueError, pipeline.sync)
+        self.assertRaises(ValueError, pipeline.close)
+
+    def test_remove_file(self):
+        files = {}
+        pipeline = Pipeline(files, nbuffers = 2, bufsize = 16)
+        f = io.BytesIO()
+        pipeline.add_file('a', f).push(b'abc')
+        removed = []
+        pipeline.remove_file('a', lambda fileobj: removed.append((fileobj, fileobj.getvalue())))
+        pipeline.sync()
+        self.assertEqual(removed, [(f, b'abc')])
+        self.assertFalse(files)
+        pipeline.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Event sizes and the acquisition budget of planner.py.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sis3316.common import const
+from sis3316.adc_unit.channel import event_words
+from sis3316.planner import plan, channel_formats
+
+
+CONF = {
+    'groups': {'0': {'raw_window': 100, 'addr_threshold': 48000}, '3': {'raw_window': 1000}},
+    'channels': {'1': {'event_format_mask': 0b1}, '13': {'event_format_mask': 0b1111, 'event_maw_ena': 1}},
+    }
+
+
+class TestEventWords(unittest.TestCase):
+
+    def test_header(self):
+        self.assertEqual(event_words(0, 0), 3)
+        self.assertEqual(event_words(0b1, 0), 3 + 7)
+        self.assertEqual(event_words(0b10, 0), 3 + 2)
+        self.assertEqual(event_words(0b100, 0), 3 + 3)
+        self.assertEqual(event_words(0b1000, 0), 3 + 2)
+        self.assertEqual(event_words(0b1111, 0), 3 + 14)
+
+    def test_samples(self):
+        self.assertEqual(event_words(0, 100), 3 + 50)
+        self.assertEqual(event_words(0, 100, maw_window = 40), 3 + 50) # MAW buffer is off
+        self.assertEqual(event_words(0b1111, 100, 40, True), 3 + 14 + 50 + 40)
+
+
+class TestPlan(unittest.TestCase):
+
+    def test_formats(self):
+        fmts = channel_formats(CONF)
+        self.assertEqual(len(fmts), const.CHAN_TOTAL)
+        self.assertEqual(fmts[1], {'format_mask': 0b1, 'maw_ena': False, 'raw_window': 100,
+                'maw_window': 0, 'addr_threshold': 48000})
+        self.assertEqual(fmts[13]['raw_window'], 1000)
+        self.assertTrue(fmts[13]['maw_ena'])
+        self.assertEqual(fmts[4], {'format_mask': 0, 'maw_ena': False, 'raw_window': 0,
+                'maw_window': 0, 'addr_threshold': 0})
+
+    def test_rates(self):
+        res = plan(CONF, {1: 1000.0, 13: 10.0})
+        chans = res['channels']
+        self.assertEqual(chans[1]['event_bytes'], 4 * (3 + 7 + 50))
+        self.assertEqual(chans[13]['event_bytes'], 4 * (3 + 14 + 500))
+        self.assertEqual(chans[1]['data_rate'], 240000.0)
+        self.assertEqual(chans[1]['bank_fill_time'], const.MEM_BANK_SIZE / 240000.0)
+        self.assertEqual(chans[1]['threshold_time'], 0.2)
+        self.assertEqual(chans[0]['data_rate'], 0.0)
+        self.assertEqual(chans[0]['bank_fill_time'], float('inf'))
+        self.assertEqual(res['groups'][0]['data_rate'], 240000.0)
+        self.assertEqual(res['groups'][3]['data_rate'], 20680.0)
+        self.assertEqual(res['data_rate'], 240000.0 + 20680.0)
+        self.assertEqual(res['swap_interval_max'], 0.1) # a half of the threshold time
+        self.assertEqual(res['swap_interval'], 0.1)
+        self.assertTrue(res['network_rate'] > res['data_rate'])
+        self.assertEqual(res, plan(CONF, [0.0, 1000.0] + [0.0] * 11 + [10.0, 0.0, 0.0]))
+
+    def test_no_data(self):
+        res = plan(CONF, [0.0] * const.CHAN_TOTAL)
+        self.assertEqual(res['swap_interval'], None)
+        self.assertEqual(res['drain_time'], 0.0)
+
+    def test_rate_count(self):
+        self.assertRaises(ValueError, plan, CONF, [100.0] * 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Output segments of rotate.py.
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sis3316.compress import iter_blocks
+from sis3316.container import ContainerReader
+from sis3316.pipeline import Pipeline
+from sis3316.rotate import RotatingSink, FinalizeError, PART, segment_name, next_run
+
+
+class RotateCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def listdir(self):
+        return sorted(os.listdir(self.dir))
+
+    def write_spills(self, sink, spills, chans = (0,)):
+        """ A chunk per channel per spill, the spill number in every byte. """
+        for n in range(1, spills + 1):
+            sink.next_spill()
+            for ch in chans:
+                sink.write_chunk(ch, bytes(bytearray([n]) * 4000))
+
+
+class TestSegments(RotateCase):
+
+    def test_names(self):
+        self.assertEqual(segment_name('data/raw-ch05.dat', 3, 12), 'data/raw-ch05_run0003_0012.dat')
+        self.assertEqual(next_run([self.path('a.dat')]), 1)
+        for name in ('a_run0002_0001.dat', 'a_run0007_0003.dat.sz', 'b_run0009_0001.dat', 'a_run0008.dat'):
+            open(self.path(name), 'w').close()
+        self.assertEqual(next_run([self.path('a.dat')]), 8)
+        self.assertEqual(next_run([self.path('a.dat'), self.path('b.dat')]), 10)
+
+    def test_rotate(self):
+        finished = []
+        sink = RotatingSink({0: self.path('a.dat')}, max_spills = 2, on_finished = finished.append)
+        self.write_spills(sink, 3)
+        self.assertEqual(sink.stats()['segment'], 2)
+        self.assertIn('a_run0001_0002.dat' + PART, self.listdir()) # being written
+        sink.close()
+        self.assertEqual(self.listdir(), ['a_run0001_0001.dat', 'a_run0001_0002.dat'])
+        self.assertEqual(sorted(finished), sorted(sink.finished))
+        with open(self.path('a_run0001_0001.dat'), 'rb') as f:
+            self.assertEqual(f.read(), b'\x01' * 4000 + b'\x02' * 4000)
+
+    def test_max_bytes(self):
+        sink = RotatingSink({0: self.path('a.dat')}, max_bytes = 10000)
+        self.write_spills(sink, 5) # a new segment at the first spill after 10000 bytes
+        sink.close()
+        self.assertEqual(len(sink.finished), 2)
+
+    def test_run(self):
+        open(self.path('a_run0004_0001.dat'), 'w').close()
+        sink = RotatingSink({0: self.path('a.dat')}, max_spills = 1)
+        self.assertEqual(sink.run, 5)
+        sink.close()
+        sink = RotatingSink({0: self.path('a.dat')}, run = 4)
+        self.assertRaises(IOError, sink.next_spill) # the segment exists
+        sink.close()
+
+    def test_compress(self):
+        sink = RotatingSink({0: self.path('a.dat')}, max_spills = 2, codec = 'zlib')
+        self.write_spills(sink, 4)
+        sink.close()
+        self.assertEqual(self.listdir(), ['a_run0001_0001.dat.sz', 'a_run0001_0002.dat.sz'])
+        with open(self.path('a_run0001_0002.dat.sz'), 'rb') as f:
+            self.assertEqual(b''.join(iter_blocks(f)), b'\x03' * 4000 + b'\x04' * 4000)
+
+    def test_unknown_codec(self):
+        self.assertRaises(ValueError, RotatingSink, {0: self.path('a.dat')}, codec = 'gzip')
+
+    def test_finalize_error(self):
+        sink = RotatingSink({0: self.path('a.dat')}, run = 1, max_spills = 1)
+        sink.next_spill()
+        os.makedirs(os.path.join(self.path('a_run0001_0001.dat'), 'x')) # can't be renamed to
+        sink.write_chunk(0, b'\0' * 4000)
+        sink.next_spill() # the first segment is passed to the background thread
+        self.assertRaises(FinalizeError, sink.close)
+        self.assertIn('a_run0001_0001.dat' + PART, self.listdir()) # left as it is
+        self.assertIn('a_run0001_0002.dat', self.listdir())
+
+
+class TestPipeline(RotateCase):
+
+    def test_segments(self):
+        pipeline = Pipeline({}, nbuffers = 4, bufsize = 1024)
+        sink = RotatingSink({0: self.path('a.dat'), 5: self.path('b.dat')}, max_spills = 2, pipeline = pipeline)
+        self.write_spills(sink, 5, (0, 5))
+        sink.close()
+        pipeline.close()
+        self.assertEqual(sink.segment, 3)
+        self.assertEqual(len(sink.finished), 6)
+        self.assertFalse([name for name in self.listdir() if name.endswith(PART)])
+        with open(self.path('b_run0001_0002.dat'), 'rb') as f:
+            self.assertEqual(f.read(), b'\x03' * 4000 + b'\x04' * 4000)
+        self.assertFalse(pipeline.files) # finished segments are removed
+
+    def test_container(self):
+        pipeline = Pipeline({}, nbuffers = 4, bufsize = 1024)
+        sink = RotatingSink(self.path('c.sis'), container = True, max_spills = 2, pipeline = pipeline)
+        self.write_spills(sink, 4, (0, 5))
+        sink.close()
+        pipeline.close()
+        reader = ContainerReader(self.path('c_run0001_0002.sis'))
+        self.assertEqual(reader.spills, [3, 4])
+        self.assertEqual(reader.channels, [0, 5])
+        self.assertEqual(reader.read(reader.select(5, 4)[0]), b'\x04' * 4000)
+        reader.close()
+
+    def test_write_error(self):
+        pipeline = Pipeline({}, nbuffers = 4, bufsize = 1024)
+        sink = RotatingSink({0: self.path('a.dat')}, max_spills = 1, pipeline = pipeline)
+        self.write_spills(sink, 2)
+        pipeline.sync()
+        pipeline.files[(sink.segment, 0)].close() # the current segment is broken
+        sink.write_chunk(0, b'\0' * 100) # stays in the buffer until close()
+        self.assertRaises(ValueError, sink.close)
+        self.assertEqual(self.listdir(), ['a_run0001_0001.dat', 'a_run0001_0002.dat' + PART])
+
+
+if __name__ == '__main__':
+    unittest.main()
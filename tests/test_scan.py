@@ -0,0 +1,65 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Threshold scan helpers of scan.py.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sis3316 import scan
+
+
+class Channel(object):
+    def __init__(self, idx):
+        self.actual_addr_reg = 0x100 + idx
+
+
+class AddrDev(object):
+    """ Gives the actual sample addresses from a list of read_list() results. """
+    def __init__(self, *reads):
+        self.channels = [Channel(i) for i in range(0, len(reads[0]))]
+        self.reads = list(reads)
+
+    def read_list(self, addrs):
+        return self.reads.pop(0)
+
+
+class TestScan(unittest.TestCase):
+
+    def test_addr_rates(self):
+        bank1 = 1 << 24
+        dev = AddrDev([0, bank1 | 100, 500, 0x3000000 | 100], [1000, bank1 | 1100, bank1 | 200, 0x3000000 | 600])
+        rates = scan._addr_rates(dev, 0.01, [10, 10, 10, 0])
+        self.assertTrue(rates[0] > 0)
+        self.assertAlmostEqual(rates[1], rates[0], delta = rates[0] * 1e-6) # the bank bit is not a count
+        self.assertEqual(rates[2], None) # swapped
+        self.assertEqual(rates[3], None) # no event length
+
+    def test_noise_edge(self):
+        thresholds = [10, 20, 30, 40, 50]
+        self.assertEqual(scan.noise_edge(thresholds, [1000, 500, 5, 1, 0], 10.0), 30)
+        self.assertEqual(scan.noise_edge(thresholds, [1000, 500, 5, 50, 0], 10.0), 50)
+        self.assertEqual(scan.noise_edge(thresholds, [1000] * 5, 10.0), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Drain policies of scheduler.py: the order chunks of channels are read in.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sis3316.scheduler import DrainPolicy, RoundRobin, LargestFirst, Deadline, DRAIN_POLICIES
+
+
+def drain(policy, words, chunk = 1000):
+    """ Read channels chunk by chunk like Sis3316.readout_scheduled(). Returns the channels in read order. """
+    policy.start(dict(words))
+    remaining = dict(words)
+    order = []
+    while remaining:
+        chan = policy.pick(remaining)
+        order.append(chan)
+        remaining[chan] -= min(chunk, remaining[chan])
+        if not remaining[chan]:
+            del remaining[chan]
+            policy.done(chan)
+    return order
+
+
+WORDS = {0: 3000, 5: 1000, 9: 6000, 12: 2000}
+
+
+class TestDrainPolicies(unittest.TestCase):
+
+    def test_fixed(self):
+        self.assertEqual(drain(DrainPolicy(), WORDS), [0] * 3 + [5] + [9] * 6 + [12] * 2)
+
+    def test_round_robin(self):
+        self.assertEqual(drain(RoundRobin(), WORDS), [0, 5, 9, 12, 0, 9, 12, 0, 9, 9, 9, 9])
+
+    def test_largest(self):
+        self.assertEqual(drain(LargestFirst(small_every = 0), WORDS), [9, 9, 9, 0, 9, 0, 9, 12, 0, 5, 9, 12])
+
+    def test_largest_small_every(self):
+        order = drain(LargestFirst(small_every = 2), WORDS)
+        self.assertEqual(order[:6], [9, 5, 9, 12, 9, 12])
+        self.assertEqual(sorted(order), sorted(drain(DrainPolicy(), WORDS)))
+
+    def test_deadline(self):
+        policy = Deadline({12: 0.0, 5: 0.5}, default = 100.0)
+        self.assertEqual(drain(policy, WORDS), [12, 12, 5, 9, 9, 9, 0, 9, 0, 9, 0, 9]) # ties: the larger one
+
+    def test_deadline_missed(self):
+        policy = Deadline({12: -1.0}, default = 100.0)
+        drain(policy, WORDS)
+        drain(policy, WORDS)
+        self.assertEqual(policy.missed, {12: 2})
+
+    def test_names(self):
+        self.assertEqual(sorted(DRAIN_POLICIES), ['deadline', 'fixed', 'largest', 'round-robin'])
+        for cls in DRAIN_POLICIES.values():
+            self.assertEqual(sorted(drain(cls(), WORDS)), sorted(drain(DrainPolicy(), WORDS)))
+
+
+if __name__ == '__main__':
+    unittest.main()
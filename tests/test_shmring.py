@@ -0,0 +1,117 @@
+#
+# This file is part of sis3316 python package.
+#
+# Copyright 2014 Sergey Ryzhikov <sergey-inform@ya.ru>
+# IHEP @ Protvino, Russia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# The shared memory ring buffer of shmring.py, a writer and readers in one process.
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from sis3316 import shmring
+from sis3316.shmring import ShmRingWriter, ShmRingReader, OverrunError
+
+
+def chunk(n, size):
+    return bytes(bytearray([n & 0xFF]) * size)
+
+
+@unittest.skipIf(shmring.shared_memory is None, "multiprocessing.shared_memory is not available")
+class TestShmRing(unittest.TestCase):
+    size = 4096
+    nslots = 8
+
+    def setUp(self):
+        self.writer = ShmRingWriter('sis3316-test-%d' % os.getpid(), self.size, self.nslots)
+        self.readers = []
+
+    def tearDown(self):
+        for reader in self.readers:
+            reader.close()
+        self.writer.close()
+
+    def reader(self, start = 'latest'):
+        reader = ShmRingReader(self.writer.name, start)
+        self.readers.append(reader)
+        return reader
+
+    def test_read(self):
+        reader = self.reader()
+        self.writer.next_spill()
+        self.writer.write_chunk(3, chunk(1, 100), sync = False, bank = 1, ts = 10.0)
+        self.writer.push(chunk(2, 200))
+        self.writer.commit(15)
+        self.assertEqual(bytes(self.writer.last()), chunk(2, 200))
+
+        slot, data = reader.read(timeout = 0)
+        self.assertEqual(data, chunk(1, 100))
+        self.assertEqual((slot.seq, slot.index, slot.size, slot.chan, slot.sync, slot.bank, slot.spill, slot.ts),
+                (0, 0, 100, 3, False, 1, 1, 10.0))
+        slot, data = reader.read(timeout = 0)
+        self.assertEqual((slot.chan, slot.index, data), (15, 100, chunk(2, 200)))
+        self.assertEqual(reader.read(timeout = 0), None)
+
+    def test_start(self):
+        self.writer.write_chunk(0, chunk(1, 100))
+        latest, oldest = self.reader(), self.reader('oldest')
+        self.writer.write_chunk(1, chunk(2, 100))
+        self.assertEqual(latest.read(timeout = 0)[0].chan, 1)
+        self.assertEqual(oldest.read(timeout = 0)[0].chan, 0)
+
+    def test_wrap(self):
+        reader = self.reader()
+        for n in range(0, 10):
+            self.writer.write_chunk(0, chunk(n, 1000))
+            self.assertEqual(bytes(self.writer.last()), chunk(n, 1000))
+            slot, data = reader.read(timeout = 0)
+            self.assertEqual(data, chunk(n, 1000))
+        self.assertEqual(reader.overruns, 0)
+
+    def test_discard(self):
+        reader = self.reader()
+        self.writer.push(chunk(1, 100))
+        self.writer.discard() # a failed read
+        self.writer.push(chunk(2, 100))
+        self.writer.commit(0)
+        self.assertEqual(reader.read(timeout = 0)[1], chunk(2, 100))
+
+    def test_data_overrun(self):
+        reader = self.reader()
+        for n in range(0, 5):
+            self.writer.write_chunk(0, chunk(n, 1000)) # the first one is overwritten
+        self.assertRaises(OverrunError, reader.read, 0)
+        self.assertEqual(reader.overruns, 1)
+        slot, data = reader.read(timeout = 0)
+        self.assertEqual((slot.seq, data), (1, chunk(1, 1000)))
+
+    def test_slot_overrun(self):
+        reader = self.reader()
+        for n in range(0, self.nslots + 3):
+            self.writer.write_chunk(0, chunk(n, 4))
+        slot, data = reader.read(timeout = 0)
+        self.assertEqual(reader.overruns, 3)
+        self.assertEqual((slot.seq, data), (3, chunk(3, 4)))
+
+    def test_too_large(self):
+        self.assertRaises(IndexError, self.writer.push, chunk(0, self.size + 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
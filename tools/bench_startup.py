@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Measure startup time of the sis3316 package and the tools.
+Each measurement runs a fresh python interpreter, the best of N runs is reported.
+With a host given, also measures the first transaction latency.
+Exits with 1 if any measurement is over its budget.
+"""
+
+import sys,os
+import argparse
+import subprocess
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(TOOLS_DIR, '..')
+
+# Startup time budget [seconds], including interpreter startup.
+BUDGET = {
+    'import sis3316': 0.15,
+    'check_connection.py': 0.15,
+    'conf.py': 0.2,
+    'readout.py': 0.2,
+    'plan.py': 0.2,
+    'parse.py': 0.2,
+    'hist.py': 0.2,
+    'freq.py': 0.2,
+    'scope.py': 0.2,
+    'scope_minmax.py': 0.2,
+    }
+
+
+def best_of(cmd, repeat):
+    """ Run a command `repeat' times, return the minimal wall time.
+    Raises CalledProcessError if the command fails (a crash is not a fast start).
+    """
+    best = None
+    for i in range(0, repeat):
+        t0 = time.time()
+        ret = subprocess.call(cmd, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        dt = time.time() - t0
+        if ret != 0:
+            raise subprocess.CalledProcessError(ret, cmd)
+        if best is None or dt < best:
+            best = dt
+    return best
+
+
+def first_transaction(host, port, local_port=None):
+    """ Return (construct, open, first read) latencies in seconds. """
+    t0 = time.time()
+    sys.path.append(ROOT_DIR)
+    import sis3316
+    dev = sis3316.Sis3316_udp(host, port, local_port)
+    t1 = time.time()
+    dev.open()
+    t2 = time.time()
+    dev.read(sis3316.registers.SIS3316_SERIAL_NUMBER_REG)
+    t3 = time.time()
+    return t1 - t0, t2 - t1, t3 - t2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('host', nargs='?', default=None,
+        help="hostname or IP address (optional)")
+    parser.add_argument('port', type=int, nargs='?', default=1234,
+        help="UDP port number")
+    parser.add_argument('--local-port', type=int, default=None,
+        help="UDP port to send from (default: the same as port), 0: any free port, i.e. for an emulator on this host")
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+        help="runs per measurement. default: %(default)s")
+    args = parser.parse_args()
+
+    py = sys.executable
+    over = False
+
+    baseline = best_of([py, '-c', 'pass'], args.repeat)
+    print('%-20s %8.1f ms' % ('python', baseline * 1000))
+
+    for name, budget in sorted(BUDGET.items()):
+        if name.startswith('import'):
+            cmd = [py, '-c', name]
+        else:
+            cmd = [py, os.path.join(TOOLS_DIR, name), '--help']
+
+        try:
+            dt = best_of(cmd, args.repeat)
+        except subprocess.CalledProcessError as e:
+            print('%-20s   FAILED (exit code %d)' % (name, e.returncode))
+            over = True
+            continue
+        mark = ''
+        if dt > budget:
+            mark = '  OVER BUDGET (%.0f ms)' % (budget * 1000)
+            over = True
+        print('%-20s %8.1f ms%s' % (name, dt * 1000, mark))
+
+    if args.host:
+        construct, open_, read = first_transaction(args.host, args.port, args.local_port)
+        print('%-20s %8.1f ms' % ('Sis3316_udp()', construct * 1000))
+        print('%-20s %8.1f ms' % ('open()', open_ * 1000))
+        print('%-20s %8.1f ms' % ('first read()', read * 1000))
+
+    if over:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
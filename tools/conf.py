@@ -47,11 +47,13 @@ def main():
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument('host', help='hostname or IP address')
     parser.add_argument('port', type=int, nargs="?", default=1234, help='UDP port number')
+    parser.add_argument('--local-port', type=int, default=None, help='UDP port to send from (default: the same as port), 0: any free port, i.e. for an emulator on this host')
     parser.add_argument('--documentation', action='store_true', help='Prints out documentation for possible arguments in config file') 
     parser.add_argument('-c','--conf', nargs=1, dest = 'conffile',  type=argparse.FileType('r'), help='Load configuration from file')
+    parser.add_argument('--dac-calibrate', type=float, metavar='BASELINE', help='Find DAC offsets for the target baseline (ADC counts), then dump configuration')
     args = parser.parse_args()
     
-    dev = sis3316.Sis3316_udp(args.host, args.port)
+    dev = sis3316.Sis3316_udp(args.host, args.port, args.local_port)
     dev.open()
     
     if sys.stdout.isatty():    # if output is a real terminal
@@ -68,6 +70,13 @@ def main():
         dev.triggers[0].help()
         sys.exit()
 
+    if args.dac_calibrate is not None:
+        from sis3316.calibrate import dac_calibrate
+        res = dac_calibrate(dev, args.dac_calibrate)
+        for idx, r in sorted(res.items()):
+            sys.stderr.write('ch%02d offset: %5d baseline: %s iterations: %d%s\n' % (idx, r['offset'], 
+                    r['baseline'], r['iterations'], '' if r['converged'] else ' (not converged)'))
+
     if not args.conffile: #no conf file provided
         config = dump_conf(dev)
         print( json.dumps(config, indent=2, sort_keys=True))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+List or extract the contents of a readout container (readout.py --container).
+Without options prints the index: a line per chunk.
+With --extract writes raw data of the selected chunks to stdout (or --outfile),
+which parse.py and integrate.py can read.
+"""
+
+import sys,os
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from sis3316.container import ContainerReader, FormatError
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('infile', type=str, help="container file")
+    parser.add_argument('-c', '--channel', type=int, default=None,
+        help="select a channel")
+    parser.add_argument('-s', '--spill', type=int, default=None,
+        help="select a spill")
+    parser.add_argument('-x', '--extract', action='store_true',
+        help="write raw data of the selected chunks")
+    parser.add_argument('-o', '--outfile', type=str, default=None,
+        help="output file for --extract, default is stdout")
+    args = parser.parse_args()
+
+    try:
+        reader = ContainerReader(args.infile)
+    except (IOError, FormatError) as e:
+        sys.stderr.write("%s\n" % e)
+        exit(1)
+
+    entries = reader.select(args.channel, args.spill)
+
+    if not args.extract:
+        print('spill   chan  bank  sync       offset        bytes  timestamp')
+        for e in entries:
+            print('%-7d %-5d %-5d %-5d %12d %12d  %.3f' % (e.spill, e.chan, e.bank, e.sync, e.offset, e.size, e.ts))
+        sys.stderr.write('%d chunks, %d spills, channels: %s\n' % (len(entries),
+                len(set(e.spill for e in entries)), ' '.join(str(c) for c in sorted(set(e.chan for e in entries)))))
+        return
+
+    if args.outfile:
+        out = open(args.outfile, 'wb')
+    else:
+        out = getattr(sys.stdout, 'buffer', sys.stdout)
+
+    for e in entries:
+        out.write(reader.read(e))
+    out.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+Decompress a file written by readout.py --compress.
+Writes raw data to stdout (or --outfile), which parse.py, integrate.py
+and container.py can read.
+"""
+
+import sys,os
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from sis3316.compress import iter_blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('infile', type=str, help="compressed file")
+    parser.add_argument('-o', '--outfile', type=str, default=None,
+        help="output file, default is stdout")
+    args = parser.parse_args()
+
+    if args.outfile:
+        out = open(args.outfile, 'wb')
+    else:
+        out = getattr(sys.stdout, 'buffer', sys.stdout)
+
+    try:
+        with open(args.infile, 'rb') as f:
+            for data in iter_blocks(f):
+                out.write(data)
+    except (ValueError, EOFError) as e:
+        sys.stderr.write("%s: %s\n" % (args.infile, e))
+        exit(1)
+    finally:
+        out.flush()
+
+
+if __name__ == "__main__":
+    main()
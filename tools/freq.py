@@ -2,14 +2,7 @@
 ''' Get frequency.
 '''
 import sys
-
-try:
-    import numpy as np
-    import argparse
-    from matplotlib import pyplot as plt
-except Exception as e:
-    print('Import error:', e)
-    exit(1)
+import argparse
 
 parser = argparse.ArgumentParser(description=__doc__)
 parser.add_argument('infile', nargs='*', type=argparse.FileType('r'),
@@ -18,6 +11,14 @@ parser.add_argument('-c', '--column', type=int, default=0)
 parser.add_argument('-f', '--freq', type=float, default=250*1000*1000)
 
 args = parser.parse_args()
+
+# heavy imports after parsing arguments, so --help is fast
+try:
+    import numpy as np
+    from matplotlib import pyplot as plt
+except Exception as e:
+    print('Import error:', e)
+    exit(1)
 #print(args)
 
 arr = np.loadtxt(args.infile[0], comments='#', usecols=args.column)
@@ -2,14 +2,7 @@
 ''' Histogram some data.
 '''
 import sys
-
-try:
-    import numpy as np
-    import matplotlib.pyplot as plt
-    import argparse
-except Exception as e:
-    print('Import error:', e)
-    exit(1)
+import argparse
 
 #TODO: enable per-file parameters: file.txt,col=3,range=0:100,label='hehe',fmt='g',s=12345,...
 
@@ -82,6 +75,14 @@ parser.add_argument('-n', '--nbins', type=int, default=100)
 
 
 args = parser.parse_args()  # TODO: use parse_intermixed_args when python3.7 will become ubiquitous
+
+# heavy imports after parsing arguments, so --help is fast
+try:
+    import numpy as np
+    import matplotlib.pyplot as plt
+except Exception as e:
+    print('Import error:', e)
+    exit(1)
 #print(args)
 
 if args.scales and len(args.scales) != len(args.infile):
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+DDR memory loopback test: write known patterns to the memory of each ADC group,
+read them back, verify and print write/read throughput per group and transfer size.
+Separates memory or link problems from trigger-rate problems.
+The sample logic is disarmed: the memory contents are overwritten.
+"""
+
+import sys,os
+import argparse
+import json
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import sis3316
+from sis3316.memtest import loopback, PATTERNS
+
+
+def main():
+    PORT = 3333
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('host', type=str, help="hostname or ip address.")
+    parser.add_argument('port', type=int, nargs='?', default=PORT,
+        help="UDP port number, default is %d" % PORT)
+    parser.add_argument('--local-port', type=int, default=None,
+        help="UDP port to send from (default: the same as port), 0: any free port, i.e. for an emulator on this host")
+    parser.add_argument('-g', '--groups', metavar='N', nargs='+', type=int, default=[0, 1, 2, 3],
+        help="ADC groups, from 0 to 3 (all by default)")
+    parser.add_argument('-s', '--sizes', metavar='KB', nargs='+', type=int, default=[4, 64, 1024],
+        help="transfer sizes in kilobytes. default: %(default)s")
+    parser.add_argument('-p', '--patterns', nargs='+', choices=PATTERNS, default=['counter', 'random'],
+        help="data patterns. default: %(default)s")
+    parser.add_argument('--mem', type=int, choices=[0, 1], default=0,
+        help="memory chip. default: %(default)s")
+    parser.add_argument('--offset', type=int, default=0,
+        help="start address in the memory, words. default: %(default)s")
+    parser.add_argument('-r', '--repeat', type=int, default=1,
+        help="repeat each transfer N times. default: %(default)s")
+    parser.add_argument('--json', action='store_true',
+        help="output as json")
+    args = parser.parse_args()
+
+    dev = sis3316.Sis3316_udp(args.host, args.port, args.local_port)
+    dev.open()
+    dev.disarm()
+
+    res = loopback(dev, args.groups, [kb * 1024 for kb in args.sizes], args.patterns,
+            mem_no=args.mem, woffset=args.offset, repeat=args.repeat)
+    failed = [r for r in res if r['exception'] or r['errors']]
+
+    if args.json:
+        print(json.dumps(res, indent=2, sort_keys=True))
+    else:
+        print('grp  size[KB]  pattern    write MB/s   read MB/s   errors')
+        for r in res:
+            if r['exception']:
+                status = r['exception']
+            elif r['errors']:
+                status = '%d (first at word %d)' % (r['errors'], r['first_error'])
+            else:
+                status = 'ok'
+            print('%-4d %8d  %-9s %11s %11s   %s' % (r['grp'], r['size'] // 1024, r['pattern'],
+                '-' if r['write_mbps'] is None else '%.2f' % r['write_mbps'],
+                '-' if r['read_mbps'] is None else '%.2f' % r['read_mbps'], status))
+        sys.stderr.write('%d transfers, %d failed\n' % (len(res), len(failed)))
+
+    if failed:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
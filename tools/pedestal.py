@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Pedestal run: fire software triggers in bursts, read raw samples of all channels,
+print pedestal mean and RMS (noise) per channel.
+"""
+
+import sys,os
+import argparse
+import json
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import sis3316
+from sis3316.calibrate import pedestals, CALIB_RAW_WINDOW
+from sis3316.sis3316_udp import VME_WRITE_LIMIT
+
+
+def main():
+    PORT = 3333
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('host', type=str, help="hostname or ip address.")
+    parser.add_argument('port', type=int, nargs='?', default=PORT,
+        help="UDP port number, default is %d" % PORT)
+    parser.add_argument('--local-port', type=int, default=None,
+        help="UDP port to send from (default: the same as port), 0: any free port, i.e. for an emulator on this host")
+    parser.add_argument('-c', '--channels', metavar='N', nargs='+', type=int, default=list(range(0, 16)),
+        help="channels, from 0 to 15 (all by default)")
+    parser.add_argument('-n', '--events', type=int, default=1000,
+        help="triggers to fire. default: %(default)s")
+    parser.add_argument('--rate', type=float, default=None,
+        help="trigger rate [Hz], as fast as possible by default")
+    parser.add_argument('--burst', type=int, default=VME_WRITE_LIMIT,
+        help="triggers per request, 1 to %d. default: %%(default)s" % VME_WRITE_LIMIT)
+    parser.add_argument('--raw-window', type=int, default=None,
+        help="raw samples per event in all groups (restored after the run).\n"\
+            "default: the configured raw windows, %d where not configured" % CALIB_RAW_WINDOW)
+    parser.add_argument('--json', action='store_true',
+        help="output as json")
+    args = parser.parse_args()
+    if not 1 <= args.burst <= VME_WRITE_LIMIT:
+        parser.error("--burst must be from 1 to %d" % VME_WRITE_LIMIT)
+
+    dev = sis3316.Sis3316_udp(args.host, args.port, args.local_port)
+    dev.open()
+
+    t0 = time.time()
+    res = pedestals(dev, sorted(set(args.channels)), nevents=args.events, rate=args.rate,
+            burst=args.burst, raw_window=args.raw_window)
+
+    if args.json:
+        print(json.dumps(res, indent=2, sort_keys=True))
+        return
+
+    print('chan        mean       rms   events')
+    for chan, st in sorted(res.items()):
+        if st['mean'] is None:
+            print('%02d    %10s %9s %8d' % (chan, '-', '-', st['events']))
+        else:
+            print('%02d    %10.2f %9.3f %8d' % (chan, st['mean'], st['rms'], st['events']))
+    sys.stderr.write('%.2fs\n' % (time.time() - t0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Acquisition budget planner.
+Predict data rates, bank fill times and readout headroom for a configuration
+(a json file made by conf.py) and expected trigger rates.
+"""
+
+import sys,os
+import argparse
+import json
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from sis3316.common import const
+from sis3316.planner import plan
+
+
+def human_time(sec):
+    if sec == float('inf'):
+        return 'inf'
+    return '%.3g s' % sec
+
+
+def json_safe(obj):
+    """ Unbounded values (inf) as null, json has no infinity. """
+    if isinstance(obj, dict):
+        return dict((k, json_safe(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return [json_safe(v) for v in obj]
+    if isinstance(obj, float) and obj == float('inf'):
+        return None
+    return obj
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument('conffile',
+        type=argparse.FileType('r'),
+        help="configuration file (see conf.py)"
+        )
+    parser.add_argument('-r', '--rate',
+        metavar='HZ',
+        nargs='+',
+        type=float,
+        default=[100.0],
+        help="expected trigger rate per channel, a single value for all channels "\
+            "\nor a value per channel of --channels. default: %(default)s"
+        )
+    parser.add_argument('-c', '--channels',
+        metavar='N',
+        nargs='+',
+        type=int,
+        default=list(range(0, const.CHAN_TOTAL)),
+        help="channels which take triggers, from 0 to %d (all by default)" % (const.CHAN_TOTAL - 1)
+        )
+    parser.add_argument('--link',
+        metavar='MB/s',
+        type=float,
+        default=100.0,
+        help="usable network throughput. default: %(default)s"
+        )
+    parser.add_argument('--no-jumbo',
+        action='store_true',
+        help="jumbo frames are disabled"
+        )
+    parser.add_argument('--json',
+        action='store_true',
+        help="output as json (unbounded times are null)"
+        )
+
+    args = parser.parse_args()
+
+    for x in args.channels:
+        if not 0 <= x < const.CHAN_TOTAL:
+            sys.stderr.write("%d is not a valid channel number!\n" % x)
+            exit(1)
+    channels = sorted(set(args.channels))
+
+    if len(args.rate) == 1:
+        rates = dict((ch, args.rate[0]) for ch in channels)
+    elif len(args.rate) == len(args.channels):
+        rates = dict(zip(args.channels, args.rate))
+    else:
+        sys.stderr.write("Give a single rate or a rate per channel (%d), %d given.\n" % (len(args.channels), len(args.rate)))
+        exit(1)
+
+    config = json.load(args.conffile)
+    res = plan(config, rates, link_bandwidth = args.link * 1e6, jumbo = not args.no_jumbo)
+
+    if args.json:
+        print(json.dumps(json_safe(res), indent=2, sort_keys=True, allow_nan=False))
+        return
+
+    MB = 1e6
+    print('chan  evt,B     rate,Hz   MB/s     bank fill  threshold')
+    for c in res['channels']:
+        if c['chan'] not in rates:
+            continue
+        print('%02d  %8d  %9.1f  %7.3f  %10s  %9s' % (c['chan'], c['event_bytes'], c['rate'],
+                c['data_rate'] / MB, human_time(c['bank_fill_time']), human_time(c['threshold_time'])))
+    print('')
+    for g in res['groups']:
+        print('group %d: %.3f MB/s' % (g['group'], g['data_rate'] / MB))
+    print('')
+    print('data: %.3f MB/s, network: %.3f MB/s, link: %.3f MB/s, headroom: x%.2f' % (
+            res['data_rate'] / MB, res['network_rate'] / MB, res['link_bandwidth'] / MB, res['headroom']))
+
+    if res['swap_interval'] is None:
+        print('no data expected')
+    else:
+        print('swap banks every %s (at most %s), drain takes %s' % (human_time(res['swap_interval']),
+                human_time(res['swap_interval_max']), human_time(res['drain_time'])))
+
+    if res['headroom'] < 1:
+        sys.stderr.write("Warning: the link can't keep up with the expected data rate!\n")
+
+
+if __name__ == "__main__":
+    main()
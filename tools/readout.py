@@ -8,41 +8,109 @@ Write raw (binary) data to files (one file per channel).
 import sys,os
 import argparse
 from time import sleep 
+import time
 import io
 from datetime import datetime
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import sis3316
+from sis3316.readout import destination
 
 
-def readout_loop(dev, destinations, opts = {}, quiet = False, print_stats = False ):
+def readout_loop(dev, destinations, outputs = None, opts = {}, quiet = False, print_stats = False, monitor = None, recovery = None, scheduler = None, order = None ):
     """ Perform endless readout loop. 
     
         destinations: 
             zip(channels, files)
+        outputs:
+            a SpillOutputs, where each spill goes besides `destinations'
         quiet:
             only errors in stderr
         print_stats:
             print bytes per channel to stderr (ignores `quiet`)
+        monitor:
+            a running sis3316.Monitor, its cached status is printed on errors
+        recovery:
+            a sis3316.Recovery, used to reopen the link and resume readout after errors
+        scheduler:
+            a sis3316.BankScheduler to decide when to swap banks (a swap per second if None)
+        order:
+            a sis3316.scheduler.DrainPolicy, the order to read chunks of channels in
+            (channel by channel if None, not used with opts['interleave'])
     """
+    from sis3316.rotate import FinalizeError  # a RotatingSink sink failed to write out a segment
+    
+    if outputs is None:
+        outputs = SpillOutputs()
     total_bytes = 0
     human_bytes = ''
     units = ( ('GB',1024**3), ('MB', 1024**2), ('KB', 1024), ('Bytes', 1))
     
+    checked_ts = 0  # the last monitor sample checked for link errors
+    reason = 'start'
+    
     while True:
         try:
-            dev.mem_toggle()
+            if recovery and monitor:
+                smp = monitor.last
+                if smp and smp.ts > checked_ts:
+                    checked_ts = smp.ts
+                    if not smp.ok:
+                        recovery.recover()  # link error latches are set
+            
+            if scheduler:
+                reason = scheduler.wait()
+            
+            t_swap = time.time()
+            bank = dev.mem_toggle()
+            if scheduler:
+                scheduler.swapped()
+            if recovery:
+                recovery.bank = bank
+            outputs.begin(destinations, bank, t_swap, time.time(), reason)
             recv_bytes = 0
             stats = []
+            grp_stats = {}
             out = ''
-            for ch, file_ in destinations:
-                bytes_ = 0
-                for ret in dev.readout_pipe(ch, file_, 0, opts ):  # per chunk
-                    bytes_ += ret['transfered'] * 4  # words -> bytes
-                
-                stats.append( (ch, bytes_) )    
-                recv_bytes += bytes_
+            if opts.get('interleave'):
+                words, grp_stats = dev.readout_groups(destinations)
+                for ch, file_ in destinations:
+                    stats.append( (ch, words[ch] * 4) )
+                    recv_bytes += words[ch] * 4
+                    gst = grp_stats.get(ch // 4)
+                    outputs.channel_done(ch, words[ch] * 4, gst['time'] if gst else 0.0)
+                    if len(file_):
+                        outputs.chunk(ch, file_, True)
+            elif order:
+                nbytes = dict( (ch, 0) for ch, file_ in destinations )
+                files = dict(destinations)
+                for ch, ret in dev.readout_scheduled(destinations, order, 0, opts):  # per chunk
+                    nbytes[ch] += ret['transfered'] * 4
+                    outputs.chunk(ch, files[ch], ret['sync'])
+                    if not ret['leftover']:
+                        outputs.channel_done(ch, nbytes[ch])
                 
+                for ch, file_ in destinations:
+                    stats.append( (ch, nbytes[ch]) )
+                    recv_bytes += nbytes[ch]
+                    if not nbytes[ch]:
+                        outputs.channel_done(ch, 0, 0.0)
+            else:
+                for ch, file_ in destinations:
+                    bytes_ = 0
+                    for ret in dev.readout_pipe(ch, file_, 0, opts ):  # per chunk
+                        bytes_ += ret['transfered'] * 4  # words -> bytes
+                        outputs.chunk(ch, file_, ret['sync'])
+                    
+                    stats.append( (ch, bytes_) )    
+                    recv_bytes += bytes_
+                    outputs.channel_done(ch, bytes_)
+            
+            report = outputs.end(t_swap)
+            if report and report['full'] and not quiet:
+                timestr = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                sys.stderr.write('\n%s Bank full, data lost: channels %s\n' % (timestr,
+                    ' '.join('%d (live %.3f)' % (ch, report['live'][ch]) for ch in report['full'])))
 
             total_bytes += recv_bytes
             
@@ -51,8 +119,15 @@ def readout_loop(dev, destinations, opts = {}, quiet = False, print_stats = Fals
             
             if print_stats:
                 # bytes per channel
-                stats_str = 'chan         bytes\n' \
+                stats_str = ('swap: %-10s\n' % reason if scheduler else '') \
+                    + 'chan         bytes\n' \
                     + "\n".join( ["%02d\t%10d" % (ch,b) for ch,b in stats] )
+                if grp_stats:
+                    stats_str += '\ngroup        MB/s\n' \
+                        + "\n".join( ["%d\t%10.2f" % (g, st['rate'] / 1024**2) for g,st in sorted(grp_stats.items())] )
+                if getattr(order, 'missed', None):
+                    stats_str += '\ndeadlines missed: ' + ' '.join('%d:%d' % kv for kv in sorted(order.missed.items()))
+                stats_str += outputs.stats_str(report)
             
             if not quiet:
                 # human-readable total_bytes
@@ -68,18 +143,159 @@ def readout_loop(dev, destinations, opts = {}, quiet = False, print_stats = Fals
                 out = bytes_str + stats_str
                 sys.stderr.write(out + "\033[F" * out.count('\n') ) 
 
-            sleep(1)
+            if not scheduler:
+                sleep(1)
             
         except KeyboardInterrupt:
             sys.stderr.write('\n' * out.count('\n') + "\nInterrupted.\n")
+            outputs.close()
             exit(0)
+        
+        except FinalizeError as e:
+            # a segment could not be written out: don't go on writing the run to a broken output
+            timestr = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            sys.stderr.write('\n%s Err: %s\nStopped.\n' % (timestr, e))
+            try:
+                outputs.close()
+            except Exception as e:
+                sys.stderr.write('%s\n' % e)
+            exit(1)
             
         except Exception as e:
             # Ignore all exceptions and continue
             timestr = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             sys.stderr.write('\n%s Err: %s\n' % (timestr, e))
+            if monitor and monitor.last:
+                sys.stderr.write('status: %s\n' % str(monitor.last))
+            if recovery:
+                try:
+                    recovery.recover(e)
+                except Exception as e:
+                    sys.stderr.write('%s Recovery failed: %s\n' % (timestr, e))
+                    sleep(1)
+
+
+class SpillOutputs(object):
+    """ Where each spill goes besides the destinations, called by readout_loop().
+    
+        sinks:
+            objects with next_spill(), write_chunk() and close() (ContainerWriter,
+            RotatingSink, FanoutServer, ChannelFiles); the destinations are
+            sis3316.RingBuffer then, each chunk is moved from them to the sinks
+        shm:
+            a sis3316.shmring.ShmRingWriter which is the destination of all channels
+            (not with opts['interleave']): each chunk is committed to it, then passed to the sinks
+        pipeline:
+            a sis3316.pipeline.Pipeline which the destinations or sinks write to, flushed after each spill
+        compressors:
+            sis3316.compress.CompressedWriter output files, closed on exit, their stats are printed
+        telemetry:
+            a sis3316.telemetry.SpillTelemetry to record each spill
+        overflow:
+            a sis3316.overflow.OverflowMonitor to find channels whose bank got full
+    """
+    def __init__(self, sinks = (), shm = None, pipeline = None, compressors = (), telemetry = None, overflow = None):
+        self.sinks = list(sinks)
+        self.shm = shm
+        self.pipeline = pipeline
+        self.compressors = list(compressors)
+        self.telemetry = telemetry
+        self.overflow = overflow
+        self._bank = 0
+    
+    def begin(self, destinations, bank, t_swap, t_swapped, reason):
+        """ Banks are swapped, `bank' is armed. """
+        self._bank = bank ^ 1  # being read
+        if self.telemetry:
+            self.telemetry.begin(bank, t_swap, t_swapped, reason)
+        if self.shm:
+            self.shm.next_spill()
+            self.shm.discard()  # leftovers of a failed spill
+        elif self.sinks:
+            for ch, buf in destinations:
+                buf.consume(len(buf))
+        for sink in self.sinks:
+            sink.next_spill()
+    
+    def chunk(self, ch, buf, sync):
+        """ A chunk of channel `ch' is read into its destination `buf'. """
+        if not (self.sinks or self.shm):
+            return  # written by the destination
+        if self.shm:
+            self.shm.commit(ch, sync, self._bank)
+            data = self.shm.last()  # a view, no copy
+        else:
+            data = buf.read()
+        for sink in self.sinks:
+            sink.write_chunk(ch, data, sync, self._bank)
+    
+    def channel_done(self, ch, nbytes, drain_time = None):
+        if self.telemetry:
+            self.telemetry.channel_done(ch, nbytes, drain_time)
+    
+    def end(self, t_swap):
+        """ The spill is read. Returns the OverflowMonitor report (None without it). """
+        if self.pipeline:
+            self.pipeline.flush()
+        report = None
+        if self.overflow:
+            report = self.overflow.check(t_swap)
+        if self.telemetry:
+            self.telemetry.end(report)
+        return report
+    
+    def stats_str(self, report = None):
+        ret = ''
+        if self.overflow and report:
+            ret += '\nbank full: %d times, live min %.3f' % (sum(self.overflow.overflows.values()),
+                min(report['live'].values()))
+        if self.pipeline:
+            pst = self.pipeline.stats()
+            ret += '\nwriter: queue %(queue)d (max %(queue_max)d), free %(free)d/%(buffers)d, ' \
+                'stalled %(stall_time).2fs, writing %(write_time).2fs' % pst
+        for sink in self.sinks:
+            if hasattr(sink, 'segment'):
+                ret += '\nsegments: run %(run)d, #%(segment)d, %(finished)d finished, %(pending)d pending' % sink.stats()
+            if hasattr(sink, 'subscribers'):
+                ret += '\npublish: %(subscribers)d subscribers, %(queued)d queued, %(dropped)d dropped' % sink.stats()
+        if self.compressors:
+            raw = sum(c.raw_bytes for c in self.compressors)
+            comp = sum(c.compressed_bytes for c in self.compressors)
+            cpu = sum(c.cpu_time for c in self.compressors)
+            if comp:
+                ret += '\ncompression: ratio %.2f, cpu %.3fs/MB' % (float(raw) / comp, cpu / (raw / 1024.0**2))
+        return ret
+    
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+        if self.shm:
+            self.shm.close()
+        if self.pipeline:
+            self.pipeline.close()
+        for c in self.compressors:
+            c.close()
+        if self.telemetry:
+            self.telemetry.close()
+        if self.overflow:
+            self.overflow.close()
+
+
+class ChannelFiles(object):
+    """ A chunk sink which writes a file per channel (to use the files together with other sinks). """
+    def __init__(self, files):
+        self.dests = dict( (ch, destination(f)) for ch, f in files.items() )
+    
+    def next_spill(self):
+        pass
+    
+    def write_chunk(self, ch, data, sync=True, bank=0):
+        self.dests[ch].push(data)
+    
+    def close(self):
+        pass
+
 
-        
 def makedirs(path):
     """ Create directories for `path` (like 'mkdir -p'). """
     if not path:
@@ -92,7 +308,7 @@ def makedirs(path):
 def main():
     # Defaults
     chunksize = 1024*1024  # how many bytes to request at once
-    opts = {'chunk_size': chunksize/4 }
+    opts = {'chunk_size': chunksize//4 }
     OUTPATH = "data/raw-ch"
     OUTEXT = ".dat"
     PORT = 3333
@@ -111,6 +327,12 @@ def main():
         default=PORT,
         help="UDP port number, default is %d" % PORT
         )
+    parser.add_argument('--local-port',
+        type=int,
+        default=None,
+        help="UDP port to send from (default: the same as port),\n"\
+            "0: any free port, i.e. for an emulator on this host"
+        )
     parser.add_argument('-c', '--channels',
         metavar='N',
         nargs='+',
@@ -126,6 +348,79 @@ def main():
         help="a path for output, one file per channel."\
             "\ndefault: \"%s\"" % OUTPATH
         )
+    parser.add_argument('--container',
+        type=str,
+        metavar='FILE',
+        help="write a single file with spill-framed chunks and an index\n"\
+            "(see sis3316/container.py) instead of a file per channel"
+        )
+    parser.add_argument('--publish',
+        type=str,
+        metavar='ADDR',
+        help="publish chunks to local subscribers (see sis3316/fanout.py),\n"\
+            "ADDR is a port, host:port or a path to a Unix socket"
+        )
+    parser.add_argument('--publish-queue',
+        type=int,
+        metavar='N',
+        default=64,
+        help="chunks queued per subscriber, the oldest are dropped. default: %(default)s"
+        )
+    parser.add_argument('--shm',
+        type=str,
+        metavar='NAME',
+        help="also put chunks to a shared memory ring buffer for analysis processes\n"\
+            "(see sis3316/shmring.py)"
+        )
+    parser.add_argument('--shm-size',
+        type=int,
+        metavar='MB',
+        default=256,
+        help="shared memory ring buffer size. default: %(default)s"
+        )
+    parser.add_argument('--telemetry',
+        type=str,
+        metavar='FILE',
+        help="append a JSON line per spill: throughput, drain time, bank fill,\n"\
+            "transport retries and cwnd, dead time (see sis3316/telemetry.py)"
+        )
+    parser.add_argument('--prom',
+        type=str,
+        metavar='FILE',
+        help="keep the last spill metrics in FILE in Prometheus text format (node exporter textfile)"
+        )
+    parser.add_argument('--lost-log',
+        type=str,
+        metavar='FILE',
+        help="append lost time intervals of channels whose bank got full (JSON lines,\n"\
+            "see sis3316/overflow.py). default: lost.log next to the output"
+        )
+    parser.add_argument('--no-overflow-check',
+        action='store_true',
+        help="do not check for full banks after each spill"
+        )
+    parser.add_argument('--rotate-size',
+        type=int,
+        metavar='MB',
+        help="start a new output segment when the current one has MB megabytes"
+        )
+    parser.add_argument('--rotate-time',
+        type=float,
+        metavar='SEC',
+        help="start a new output segment every SEC seconds"
+        )
+    parser.add_argument('--rotate-spills',
+        type=int,
+        metavar='N',
+        help="start a new output segment every N spills.\n"\
+            "Segments are named <output>NN_run<run>_<segment>.dat, written as .part and\n"\
+            "renamed (or compressed with --compress) in the background when finished"
+        )
+    parser.add_argument('--run',
+        type=int,
+        metavar='N',
+        help="run number for segment names, default: the next unused one"
+        )
     parser.add_argument('-q', '--quiet',
         action='store_true',
         help="be quiet in stderr"
@@ -134,6 +429,90 @@ def main():
         action='store_true',
         help="print statistics per channel (ignores --quiet)"
         )
+    parser.add_argument('--interleave',
+        action='store_true',
+        help="read ADC groups concurrently, interleaving their requests"
+        )
+    parser.add_argument('--order',
+        choices=['fixed', 'round-robin', 'largest', 'deadline'],
+        default='fixed',
+        help="the order to read channels in (see sis3316/scheduler.py):\n"\
+            "fixed: channel by channel, round-robin: a chunk of each channel in turn,\n"\
+            "largest: the fullest channel first, interleaved with small ones,\n"\
+            "deadline: earliest --deadline first. default: %(default)s"
+        )
+    parser.add_argument('--deadline',
+        metavar='CH=SEC',
+        nargs='+',
+        default=[],
+        help="a channel's deadline for --order deadline, seconds after the spill readout starts\n"\
+            "(--latency for the other channels)"
+        )
+    parser.add_argument('--sample',
+        type=int,
+        metavar='KB',
+        default=0,
+        help="monitoring: read only the first KB kilobytes of each channel's bank"
+        )
+    parser.add_argument('--sample-every',
+        type=int,
+        metavar='K',
+        default=1,
+        help="monitoring: read only every K-th chunk of each channel's bank"
+        )
+    parser.add_argument('--no-align',
+        action='store_true',
+        help="do not cut chunks on event boundaries"
+        )
+    parser.add_argument('--no-recovery',
+        action='store_true',
+        help="do not try to reopen the link and resume readout after errors"
+        )
+    parser.add_argument('--monitor',
+        type=float,
+        metavar='SEC',
+        default=10.0,
+        help="device health sampling interval, 0 to disable. default: %(default)s"
+        )
+    parser.add_argument('--latency',
+        type=float,
+        metavar='SEC',
+        default=1.0,
+        help="swap banks at least this often if there is data to read. default: %(default)s"
+        )
+    parser.add_argument('--fill',
+        type=float,
+        default=0.5,
+        help="swap banks when a channel has used this fraction of its bank. default: %(default)s"
+        )
+    parser.add_argument('--fixed-interval',
+        action='store_true',
+        help="swap banks once a second, do not poll the device"
+        )
+    parser.add_argument('--buffers',
+        type=int,
+        metavar='N',
+        default=64,
+        help="write files in a separate thread through N buffers of 1MB, 0 to write directly. default: %(default)s"
+        )
+    parser.add_argument('--compress',
+        choices=['zlib', 'bz2', 'lzma', 'delta', 'bitpack'],
+        help="compress output in blocks (see sis3316/compress.py), adds .sz to file names.\n"\
+            "delta: 16-bit word differences + zlib, good for waveforms,\n"\
+            "bitpack: differences packed to the bits they need, fast (NumPy).\n"\
+            "Needs --buffers (not 0), so blocks are queued off the receive thread"
+        )
+    parser.add_argument('--compress-level',
+        type=int,
+        default=6,
+        help="compression level. default: %(default)s"
+        )
+    parser.add_argument('--compress-workers',
+        type=int,
+        metavar='N',
+        default=2,
+        help="compression threads. default: %(default)s"
+        )
     
             
     # Parse arguments
@@ -150,11 +529,22 @@ def main():
 
     # --output
     outpath = args.output
+    if args.container:
+        outpath = args.container
     makedirs(outpath)
     outfiles = [outpath + "%02d"%chan + OUTEXT for chan in channels]
+    if args.container:
+        outfiles = [outpath]
+    if args.compress:
+        outfiles = [name + '.sz' for name in outfiles]
 
+    rotate = bool(args.rotate_size or args.rotate_time or args.rotate_spills)
+    if args.compress and not args.buffers and not rotate:
+        sys.stderr.write("--compress needs --buffers N (N > 0): the receive thread would wait for the compressors.\n")
+        exit(1)
+    
     # check no overwrite
-    for outfile in outfiles:
+    for outfile in ([] if rotate else outfiles):
         if os.path.exists(outfile) \
         and os.path.getsize(outfile) != 0:
             sys.stderr.write("File \"%s\" exists and not empty! " \
@@ -163,7 +553,7 @@ def main():
     
     # Prepare device
     host,port = args.host, args.port
-    dev = sis3316.Sis3316_udp(host, port)
+    dev = sis3316.Sis3316_udp(host, port, args.local_port)
     dev.open()
     if not dev.configure():  # set channel numbers and so on.
         sys.stderr.write('Warning: After configure(), dev.status = false\n')
@@ -172,26 +562,147 @@ def main():
     dev.ts_clear()
     dev.mem_toggle()  # flush the device memory to not to read a large chunk of old data
 
+    # Cache configuration to restore it after ADC FPGA reset
+    recovery = None
+    if not args.no_recovery:
+        recovery = sis3316.Recovery(dev)
+        recovery.snapshot()
+
+    # Health monitor: a single bulk request per sample, cached values
+    monitor = sis3316.Monitor(dev, args.monitor or 10.0)
+    smp = monitor.sample()
+    if args.monitor:
+        monitor.start()
+
     if not args.quiet:
         if 'jumbo_ena' in getattr(dev,'flags'):
             jumbo = True
         else:
             jumbo = False
-        sys.stderr.write("ADC id: %s, serial: %s, temp: %d °C, jumbo_frame: %s" %( str(dev.id), hex(dev.serno), dev.temp, jumbo) + '\n' )
-        sys.stderr.write( str(dev._readout_status()) + '\n')
+        sys.stderr.write("ADC id: %s, serial: %s, temp: %d °C, jumbo_frame: %s" %( str(monitor.id), hex(monitor.serno), smp.temp, jumbo) + '\n' )
+        sys.stderr.write( str(smp.readout) + '\n')
         sys.stderr.write("---\n")
 
-    # Open files
-    files_ = [io.FileIO( name, 'w') for name in outfiles] 
+    opts['interleave'] = args.interleave
+    opts['align_events'] = not args.no_align
+    opts['sample'] = args.sample * 1024 // 4
+    opts['sample_every'] = max(args.sample_every, 1)
+    if opts['align_events'] or opts['sample'] or opts['sample_every'] > 1:
+        # Event lengths are fixed for the run: read the config once, not at every chunk
+        opts['event_length'] = dict( (ch, dev.channels[ch].event_length) for ch in channels )
+    if args.interleave and (args.sample or args.sample_every > 1):
+        sys.stderr.write("--sample and --sample-every can't be used with --interleave.\n")
+        exit(1)
+
+    compressors = []
+    pipeline = None
+    if rotate:
+        # Segments: written by the writer thread (--buffers), finished ones are closed (and compressed) in the background
+        from sis3316.rotate import RotatingSink
+        if args.buffers:
+            from sis3316.pipeline import Pipeline
+            pipeline = Pipeline({}, nbuffers=args.buffers)
+        if args.container:
+            paths = args.container
+        else:
+            paths = dict( (ch, outpath + "%02d"%ch + OUTEXT) for ch in channels )
+        sinks = [RotatingSink(paths, container=bool(args.container), run=args.run,
+                max_bytes=args.rotate_size * 1024**2 if args.rotate_size else None,
+                max_time=args.rotate_time, max_spills=args.rotate_spills,
+                codec=args.compress, level=args.compress_level, pipeline=pipeline)]
+        if not args.quiet:
+            sys.stderr.write("run: %d\n" % sinks[0].run)
+    else:
+        # Open files
+        files_ = [io.FileIO( name, 'w') for name in outfiles] 
+        if args.compress:
+            from concurrent.futures import ThreadPoolExecutor
+            from sis3316.compress import CompressedWriter
+            executor = ThreadPoolExecutor(args.compress_workers)
+            files_ = compressors = [CompressedWriter(f, executor, args.compress, args.compress_level) for f in files_]
 
-    # Perform readout
-    destinations = list(zip( get_iterable(channels), get_iterable(files_) ))  # Python3 has changed zip behavior, need to wrap in list()
-    readout_loop(dev, destinations, opts, quiet=args.quiet, print_stats=args.stats)
+        # Perform readout
+        if args.container:
+            outputs = [('container', files_[0])]
+        else:
+            outputs = list(zip( get_iterable(channels), get_iterable(files_) ))  # Python3 has changed zip behavior, need to wrap in list()
+    
+        if args.buffers:
+            from sis3316.pipeline import Pipeline
+            pipeline = Pipeline(dict(outputs), nbuffers=args.buffers)
+            outputs = [(key, pipeline.destination(key)) for key, file_ in outputs]
+    
+        # Chunk sinks: read into ring buffers, then pass each chunk to the sinks
+        sinks = []
+        if args.container:
+            from sis3316.container import ContainerWriter
+            sinks.append(ContainerWriter(outputs[0][1]))
+        elif args.publish or args.shm:
+            sinks.append(ChannelFiles(dict(outputs)))
+    if args.publish:
+        from sis3316.fanout import FanoutServer
+        sinks.append(FanoutServer(args.publish, args.publish_queue))
+    shm = None
+    if args.shm:
+        from sis3316.shmring import ShmRingWriter
+        shm = ShmRingWriter(args.shm, args.shm_size * 1024**2)
+        if args.interleave:  # channels of a group are pushed in turn, read through ring buffers
+            sinks.append(shm)
+            shm = None
+    
+    if shm:
+        # Read straight into the shared memory, the other sinks take the data from there
+        destinations = [(ch, shm) for ch in channels]
+    elif sinks:
+        destinations = [(ch, sis3316.RingBuffer(chunksize, grow=True)) for ch in channels]
+    else:
+        destinations = outputs
+    
+    telemetry = None
+    if args.telemetry or args.prom:
+        from sis3316.telemetry import SpillTelemetry
+        telemetry = SpillTelemetry(dev, args.telemetry, args.prom, opts.get('event_length'))
+    
+    from sis3316.scheduler import DRAIN_POLICIES, Deadline
+    if args.order == 'deadline':
+        try:
+            deadlines = dict( (int(ch), float(sec)) for ch, sec in (item.split('=') for item in args.deadline) )
+        except ValueError:
+            sys.stderr.write("--deadline takes CH=SEC pairs.\n")
+            exit(1)
+        order = Deadline(deadlines, default=args.latency)
+    elif args.order == 'fixed':
+        order = None  # channel by channel, each one read out in full (dev.readout_pipe)
+    else:
+        order = DRAIN_POLICIES[args.order]()
+    
+    overflow = None
+    if not args.no_overflow_check:
+        from sis3316.overflow import OverflowMonitor
+        lost_log = args.lost_log
+        if not lost_log:
+            lost_log = args.container + '.lost' if args.container \
+                else os.path.join(os.path.dirname(outpath), 'lost.log')
+        overflow = OverflowMonitor(dev, lost_log, event_length=opts.get('event_length'), channels=channels)
+    
+    scheduler = None
+    if not args.fixed_interval:
+        scheduler = sis3316.BankScheduler(dev, latency=args.latency,
+                max_latency=max(10 * args.latency, 10.0), fill=args.fill)
+    
+    spill_outputs = SpillOutputs(sinks, shm=shm, pipeline=pipeline, compressors=compressors,
+            telemetry=telemetry, overflow=overflow)
+    readout_loop(dev, destinations, spill_outputs, opts, quiet=args.quiet, print_stats=args.stats,
+            monitor=monitor if args.monitor else None, recovery=recovery, scheduler=scheduler,
+            order=order)
 
 
 def get_iterable(x):
     """ Allows lists of one object to be zipped """
-    from collections import Iterable
+    try:
+        from collections.abc import Iterable
+    except ImportError:  # Python 2
+        from collections import Iterable
     if isinstance(x, Iterable):
         return x
     else:
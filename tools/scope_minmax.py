@@ -9,6 +9,22 @@
 
 import sys,os
 import argparse
+
+def parse_args():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('infile', nargs='?', type=str, default='-',
+		help="raw data file (stdin by default)")
+	parser.add_argument('-b','--baseline', type=int, default=20,
+		help='a number of baseline samples')
+	#~ parser.add_argument('--debug', action='store_true')
+	
+	return parser.parse_args()
+
+args = None # the argparse.Namespace() object, config. options
+
+if __name__ == '__main__':
+	args = parse_args() # --help exits here, before GUI libraries are loaded
+
 import wx
 import time
 import io
@@ -39,7 +55,6 @@ FONT_SIZE = 9
 ID_PAUSE = wx.NewId()
 
 # Globals
-args = None # the argparse.Namespace() object, config. options
 events = [] #TODO: refactor
 hist = []
 
@@ -472,15 +487,9 @@ class MainGUI(wx.App):
 		
 		
 def main():
-	parser = argparse.ArgumentParser(description=__doc__)
-	parser.add_argument('infile', nargs='?', type=str, default='-',
-		help="raw data file (stdin by default)")
-	parser.add_argument('-b','--baseline', type=int, default=20,
-		help='a number of baseline samples')
-	#~ parser.add_argument('--debug', action='store_true')
-	
 	global args
-	args = parser.parse_args()
+	if args is None:
+		args = parse_args()
 
 	if args.infile == '-':
 		args.infile = sys.stdin
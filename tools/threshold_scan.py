@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Scan trigger thresholds of all channels at once.
+Print rate-vs-threshold curves and a suggested noise-edge threshold per channel.
+"""
+
+import sys,os
+import argparse
+import json
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import sis3316
+from sis3316.scan import threshold_scan
+
+
+def main():
+    PORT = 3333
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('host', type=str, help="hostname or ip address.")
+    parser.add_argument('port', type=int, nargs='?', default=PORT,
+        help="UDP port number, default is %d" % PORT)
+    parser.add_argument('--local-port', type=int, default=None,
+        help="UDP port to send from (default: the same as port), 0: any free port, i.e. for an emulator on this host")
+    parser.add_argument('-r', '--range', nargs=3, type=int, metavar=('START', 'STOP', 'STEP'),
+        default=[0, 2000, 100],
+        help="thresholds to scan. default: %(default)s")
+    parser.add_argument('-d', '--dwell', type=float, default=0.5,
+        help="seconds to measure at each step. default: %(default)s")
+    parser.add_argument('--source', choices=['counters', 'addr'], default='counters',
+        help="rates from trigger statistic counters or from sample address growth")
+    parser.add_argument('--noise-rate', type=float, default=10.0,
+        help="rate [Hz] below which the noise edge is found. default: %(default)s")
+    parser.add_argument('--json', action='store_true',
+        help="output as json")
+    args = parser.parse_args()
+
+    start, stop, step = args.range
+    thresholds = list(range(start, stop, step))
+
+    dev = sis3316.Sis3316_udp(args.host, args.port, args.local_port)
+    dev.open()
+
+    if args.source == 'addr':
+        dev.disarm()
+        dev.arm()
+
+    res = threshold_scan(dev, thresholds, dwell=args.dwell, source=args.source,
+            noise_rate=args.noise_rate)
+
+    if args.json:
+        print(json.dumps(res, indent=2, sort_keys=True))
+        return
+
+    keys = sorted(res['rates'].keys(), key=str)
+    print('thr     ' + ' '.join(['%8s' % k for k in keys]))
+    for n, thr in enumerate(res['thresholds']):
+        vals = [res['rates'][k][n] for k in keys]
+        print('%-7d ' % thr + ' '.join(['%8s' % ('-' if v is None else '%.1f' % v) for v in vals]))
+    print('edge    ' + ' '.join(['%8s' % res['edge'][k] for k in keys]))
+    print('setting ' + ' '.join(['%8s' % ('-' if res['setting'][k] is None else '%x' % res['setting'][k])
+            for k in keys]) + '  (hex: edge + 0x8000000, for trigger.threshold)')
+
+
+if __name__ == "__main__":
+    main()